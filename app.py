@@ -1,20 +1,68 @@
-import os, sys, subprocess, threading
-from backend.core import app
-import backend.routes 
+import os, sys, subprocess, threading, argparse
+from ui import startup
+from backend.config import API_HOST, API_PORT, API_SERVER, MAX_CONCURRENT, MAX_QUEUE
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def run_backend():
-    app.run(host="127.0.0.1", port=5000, debug=False, use_reloader=False)
+def load_backend():
+    # Flask and the routes are imported here rather than at the top so the UI
+    # process can be started while they load
+    from backend.core import app, gate
+    startup.mark("import backend.core")
+    import backend.routes as routes
+    startup.mark("import backend.routes")
+    return app, gate, routes
 
-def run_ui():
+def _warm_up(routes):
+    routes.warm_up()
+    startup.done("warm up")
+
+def run_backend(server: str = API_SERVER, host: str = API_HOST, port: int = API_PORT,
+                max_concurrent: int | None = None, max_queue: int | None = None):
+    app, gate, routes = load_backend()
+    if max_concurrent is not None:
+        gate.max_concurrent = max(1, max_concurrent)
+    if max_queue is not None:
+        gate.max_queue = max(0, max_queue)
+    startup.expect("warm up")
+    threading.Thread(target=_warm_up, args=(routes,), name="warm-up", daemon=True).start()
+    startup.mark("serve")
+    if server == "asgi":
+        from backend.asgi import serve
+        serve(host=host, port=port)
+    else:
+        app.run(host=host, port=port, debug=False, use_reloader=False, threaded=True)
+
+def run_ui(profile: bool = False):
+    # this process serves the API, so the UI must not spawn another backend
+    env = {**os.environ, "CHANG_LI_SPAWN_BACKEND": "0"}
     subprocess.Popen(
-        [sys.executable, "-m", "ui.main"],
-        cwd=BASE_DIR
+        [sys.executable, "-m", "ui.main"] + (["--profile-startup"] if profile else []),
+        cwd=BASE_DIR, env=env
     )
 
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Chang Li local assistant")
+    ap.add_argument("--server", choices=["dev", "asgi"], default=API_SERVER,
+                    help="dev = Flask threaded server, asgi = uvicorn (pip install uvicorn asgiref)")
+    ap.add_argument("--host", default=API_HOST)
+    ap.add_argument("--port", type=int, default=API_PORT)
+    ap.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT, help="generations running at once")
+    ap.add_argument("--max-queue", type=int, default=MAX_QUEUE, help="generations allowed to wait before 429")
+    ap.add_argument("--no-ui", action="store_true", help="serve the API only")
+    ap.add_argument("--profile-startup", action="store_true", help="print a startup timing breakdown (UI and backend)")
+    return ap.parse_args(argv)
+
 if __name__ == "__main__":
-    t = threading.Thread(target=run_backend, daemon=True)
+    args = parse_args()
+    if args.profile_startup:
+        startup.enable("app.py")
+    backend_args = (args.server, args.host, args.port, args.max_concurrent, args.max_queue)
+    if args.no_ui:
+        run_backend(*backend_args)
+        sys.exit(0)
+    run_ui(args.profile_startup)
+    startup.mark("ui process started")
+    t = threading.Thread(target=run_backend, args=backend_args, daemon=True)
     t.start()
-    run_ui()
     t.join()
@@ -0,0 +1,129 @@
+import json, re, threading, time
+from . import metrics
+
+# Admission control for generation requests. At most `max_concurrent`
+# generations run at once; up to `max_queue` more wait their turn for at most
+# `queue_timeout` seconds. Anything beyond that is refused straight away with
+# 429 + Retry-After so clients back off instead of piling up threads.
+# Light routes (config, history, health...) are never queued.
+
+_GATED = re.compile(r"^/chat(/[^/]+)?/?$")
+
+class AdmissionControl:
+    def __init__(self, wsgi_app, max_concurrent: int = 4, max_queue: int = 16, queue_timeout: float = 30.0):
+        self.wsgi_app = wsgi_app
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = float(queue_timeout)
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._avg_service = 5.0     # seconds, moving average of slot hold time
+
+    def gated(self, environ) -> bool:
+        return environ.get("REQUEST_METHOD") == "POST" and bool(_GATED.match(environ.get("PATH_INFO") or ""))
+
+    def retry_after(self) -> int:
+        # rough time until a queued request would get a slot
+        backlog = self.waiting + self.active
+        return max(1, int(self._avg_service * backlog / self.max_concurrent + 0.5))
+
+    def acquire(self) -> str | None:
+        t0 = time.monotonic()
+        with self._cond:
+            if self.active >= self.max_concurrent or self.waiting:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    return "queue full"
+                self.waiting += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self.active >= self.max_concurrent:
+                        left = deadline - time.monotonic()
+                        if left <= 0:
+                            self.timed_out += 1
+                            return "timed out in queue"
+                        self._cond.wait(left)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+        metrics.observe("queue_wait_seconds", time.monotonic() - t0, stage="admission")
+        return None
+
+    def release(self, held: float):
+        with self._cond:
+            self.active -= 1
+            self._avg_service = 0.8 * self._avg_service + 0.2 * held
+            self._cond.notify()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "active": self.active,
+                "queue_depth": self.waiting,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_service_s": round(self._avg_service, 2),
+            }
+
+    def _reject(self, start_response, reason: str):
+        body = json.dumps({"error": "server busy, retry later", "reason": reason,
+                           "queue_depth": self.waiting}).encode("utf-8")
+        start_response("429 Too Many Requests", [
+            ("Content-Type", "application/json"),
+            ("Content-Length", str(len(body))),
+            ("Retry-After", str(self.retry_after())),
+            ("X-Queue-Depth", str(self.waiting)),
+        ])
+        return [body]
+
+    def __call__(self, environ, start_response):
+        if not self.gated(environ):
+            return self.wsgi_app(environ, start_response)
+        reason = self.acquire()
+        if reason:
+            return self._reject(start_response, reason)
+        t0 = time.monotonic()
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self.release(time.monotonic() - t0)
+            raise
+        # streamed replies keep their slot until the body is exhausted or closed
+        return _ReleaseOnClose(body, lambda: self.release(time.monotonic() - t0))
+
+class _ReleaseOnClose:
+    # Releases when the body is closed or, for servers that never call
+    # close() (asgiref's WsgiToAsgi), when iteration ends or is abandoned.
+    def __init__(self, body, on_close):
+        self._body = body
+        self._on_close = on_close
+
+    def __iter__(self):
+        try:
+            yield from self._body
+        finally:
+            self.close()
+
+    def close(self):
+        body, self._body = self._body, None
+        on_close, self._on_close = self._on_close, None
+        try:
+            if body is not None and hasattr(body, "close"):
+                body.close()
+        finally:
+            if on_close is not None:
+                on_close()
+
+def install(app, **kwargs) -> AdmissionControl:
+    gate = AdmissionControl(app.wsgi_app, **kwargs)
+    app.wsgi_app = gate
+    app.extensions["admission"] = gate
+    return gate
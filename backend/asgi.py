@@ -0,0 +1,45 @@
+# ASGI entry point: `uvicorn backend.asgi:app` or `python app.py --server asgi`.
+# The Flask routes run unchanged behind asgiref's WSGI adapter: the event loop
+# owns the sockets, so idle keep-alive clients cost no thread, while each
+# admitted request runs on its own thread from a pool. AdmissionControl
+# (installed in core) bounds how many generations hold a thread at once.
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from asgiref.sync import sync_to_async
+    from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+except ImportError as e:
+    raise ImportError("ASGI mode needs asgiref and uvicorn: pip install asgiref uvicorn") from e
+
+from .core import app as flask_app, gate
+from . import routes  # noqa: F401  (registers the routes)
+
+LIGHT_THREADS = 8   # headroom for config, history, health... on top of the generations
+
+_pool = None
+
+def _executor() -> ThreadPoolExecutor:
+    # sized on first use so --max-concurrent / --max-queue are already applied;
+    # a queued generation holds its thread while it waits for a slot
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(gate.max_concurrent + gate.max_queue + LIGHT_THREADS,
+                                   thread_name_prefix="asgi")
+    return _pool
+
+class _Instance(WsgiToAsgiInstance):
+    # asgiref runs the WSGI app with thread_sensitive=True, i.e. every request
+    # on one shared thread, so generations would run one after another and
+    # /healthz would wait behind them
+    async def run_wsgi_app(self, body):
+        run = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func
+        await sync_to_async(lambda: run(self, body), thread_sensitive=False, executor=_executor())()
+
+class _WsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _Instance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+app = _WsgiToAsgi(flask_app)
+
+def serve(host: str = "127.0.0.1", port: int = 5000, log_level: str = "warning", **kwargs):
+    import uvicorn
+    uvicorn.run(app, host=host, port=port, log_level=log_level, **kwargs)
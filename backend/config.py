@@ -2,10 +2,14 @@ import os
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-DATA_DIR = os.path.join(BASE_DIR, "data")
+DATA_DIR = os.environ.get("CHANG_LI_DATA", os.path.join(BASE_DIR, "data"))
 os.makedirs(DATA_DIR, exist_ok=True)
 
 HISTORY_FILE = os.path.join(DATA_DIR, "chat_history.json")
+CHATS_DB     = os.path.join(DATA_DIR, "chats.db")
+SEARCH_DB    = os.path.join(DATA_DIR, "search.db")
+CHATS_DIR    = os.path.join(DATA_DIR, "chats")
+CHAT_STORE   = os.environ.get("CHANG_LI_STORE", "sqlite").lower()   # sqlite | files
 APP_CONFIG_FILE = os.path.join(DATA_DIR, "config.json")       
 UI_CONFIG_FILE  = os.path.join(DATA_DIR, "ui_chat_config.json")  
 SESSIONS_FILE   = os.path.join(DATA_DIR, "chat_sessions.json")  
@@ -13,6 +17,21 @@ SESSIONS_FILE   = os.path.join(DATA_DIR, "chat_sessions.json")
 CUDA_VISIBLE_DEVICES = os.environ.get("CUDA_VISIBLE_DEVICES", "1")
 OLLAMA_MODELS = os.environ.get("OLLAMA_MODELS", "D:/Tools/ollama")
 OLLAMA_PATH   = os.environ.get("OLLAMA_PATH", "C:/Users/LOQ/AppData/Local/Programs/Ollama/ollama.exe")
+OLLAMA_HOST   = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+if "://" not in OLLAMA_HOST:
+    OLLAMA_HOST = "http://" + OLLAMA_HOST
+OLLAMA_ENGINE  = os.environ.get("CHANG_LI_ENGINE", "auto").lower()   # auto | http | cli
+OLLAMA_TIMEOUT = float(os.environ.get("CHANG_LI_OLLAMA_TIMEOUT", "600"))
+OLLAMA_POOL    = int(os.environ.get("CHANG_LI_OLLAMA_POOL", "8"))
+MODELS_TTL     = float(os.environ.get("CHANG_LI_MODELS_TTL", "60"))
 
 API_HOST = os.environ.get("CHANG_LI_HOST", "127.0.0.1")
 API_PORT = int(os.environ.get("CHANG_LI_PORT", "5000"))
+API_SERVER = os.environ.get("CHANG_LI_SERVER", "dev").lower()     # dev | asgi
+
+MAX_CONCURRENT = int(os.environ.get("CHANG_LI_MAX_CONCURRENT", "4"))
+MAX_QUEUE      = int(os.environ.get("CHANG_LI_MAX_QUEUE", "16"))
+QUEUE_TIMEOUT  = float(os.environ.get("CHANG_LI_QUEUE_TIMEOUT", "30"))
+
+GEN_SLOTS   = int(os.environ.get("CHANG_LI_GEN_SLOTS", "2"))       # generations sent to Ollama at once
+WARM_MODELS = int(os.environ.get("CHANG_LI_WARM_MODELS", "2"))     # most recently used models kept loaded
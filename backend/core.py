@@ -1,5 +1,8 @@
 from flask import Flask
 from flask_cors import CORS
+from . import admission
+from .config import MAX_CONCURRENT, MAX_QUEUE, QUEUE_TIMEOUT
 
 app = Flask(__name__)
 CORS(app)
+gate = admission.install(app, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT)
@@ -0,0 +1,57 @@
+import os, json, time, threading
+
+# Parsed-file cache keyed by path. An entry is reused while the file's
+# (mtime, size, inode) stamp is unchanged; the stamp itself is re-checked at
+# most every CHECK_INTERVAL seconds, and writers call invalidate() so the
+# app's own changes are visible immediately.
+
+CHECK_INTERVAL = 1.0
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        return None
+
+def load_json(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+class FileCache:
+    def __init__(self, check_interval: float = CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._entries: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, loader, stamp_fn=None):
+        stamp_fn = stamp_fn or (lambda: _stamp(key))
+        now = time.monotonic()
+        with self._lock:
+            ent = self._entries.get(key)
+            if ent is not None and now - ent[2] < self.check_interval:
+                self.hits += 1
+                return ent[1]
+        stamp = stamp_fn()
+        with self._lock:
+            ent = self._entries.get(key)
+            if ent is not None and ent[0] == stamp:
+                self._entries[key] = (stamp, ent[1], now)
+                self.hits += 1
+                return ent[1]
+        value = loader()
+        with self._lock:
+            self._entries[key] = (stamp, value, now)
+            self.misses += 1
+        return value
+
+    def invalidate(self, key: str | None = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+file_cache = FileCache()
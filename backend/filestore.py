@@ -0,0 +1,317 @@
+import os, re, json, mmap, struct, tempfile, threading
+from .config import CHATS_DIR
+from . import search
+from .storage import write_json_atomic, _reindex, _now, _title_from, ROW_FIELDS, COMPACT_EVERY
+
+# Split-file chat store (CHANG_LI_STORE=files). Each chat is three files in
+# data/chats/:
+#   <id>.jsonl  one JSON line per turn, append-only
+#   <id>.off    uint64 byte offset of every turn in the .jsonl
+#   <id>.json   metadata (names, model, prompt, memory, title)
+# plus index.bin, a fixed-record table (id, turn count, .jsonl size, created,
+# last_updated) that is memory-mapped when the store opens. Opening costs one
+# pass over the records, a tail read is two offset lookups and one read, and
+# an append writes to the end of two files and rewrites one record, however
+# large the archive is. Files only change when their chat does, so backups
+# can be incremental.
+#
+# The record is the commit point: bytes past the recorded size (a write that
+# died halfway) are cut off by the next append. The index is owned by one
+# process; SQLite remains the store for several processes sharing data/.
+
+MAGIC = b"CLIX"
+VERSION = 1
+ID_BYTES = 64
+DELETED = 1
+GROW = 256                                      # records added when the index is full
+_HEADER = struct.Struct("<4sII4x")              # magic, version, records used
+_RECORD = struct.Struct("<64sIIQ19s19s2x")      # id, turns, flags, .jsonl size, created, last_updated
+_OFFSET = struct.Struct("<Q")
+_SAFE_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,63}")
+
+def _replace_bytes(path: str, data: bytes):
+    d = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=d)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+class FileStore:
+    def __init__(self, root: str = CHATS_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, "index.bin")
+        self.created = False            # index.bin did not exist before
+        self._lock = threading.RLock()
+        self._slots: dict[str, int] = {}
+        self._used = 0
+        self._writes = 0
+        os.makedirs(root, exist_ok=True)
+        self._open()
+
+    def _open(self):
+        if not os.path.exists(self.index_path):
+            _replace_bytes(self.index_path, _HEADER.pack(MAGIC, VERSION, 0) + bytes(GROW * _RECORD.size))
+            self.created = True
+        self._f = open(self.index_path, "r+b")
+        self._mm = mmap.mmap(self._f.fileno(), 0)
+        magic, version, used = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError(f"{self.index_path} is not a chat index (version {VERSION})")
+        self._used = used
+        self._slots = {}
+        for slot in range(used):
+            chat_id, _, flags, _, _, _ = self._read(slot)
+            if not flags & DELETED:
+                self._slots[chat_id] = slot
+
+    def close(self):
+        with self._lock:
+            self._mm.flush()
+            self._mm.close()
+            self._f.close()
+
+    def _read(self, slot: int) -> tuple:
+        raw = _RECORD.unpack_from(self._mm, _HEADER.size + slot * _RECORD.size)
+        return (raw[0].rstrip(b"\0").decode("utf-8"), raw[1], raw[2], raw[3],
+                raw[4].rstrip(b"\0").decode("ascii"), raw[5].rstrip(b"\0").decode("ascii"))
+
+    def _write(self, slot: int, chat_id: str, turns: int, flags: int, size: int, created: str, updated: str):
+        _RECORD.pack_into(self._mm, _HEADER.size + slot * _RECORD.size, chat_id.encode("utf-8"), turns, flags,
+                          size, created[:19].encode("ascii"), updated[:19].encode("ascii"))
+
+    def _new_slot(self) -> int:
+        if _HEADER.size + (self._used + 1) * _RECORD.size > len(self._mm):
+            self._mm.flush()
+            self._mm.close()
+            self._f.truncate(_HEADER.size + (self._used + GROW) * _RECORD.size)
+            self._mm = mmap.mmap(self._f.fileno(), 0)
+        return self._used
+
+    def _commit_slot(self, slot: int):
+        self._used = slot + 1
+        _HEADER.pack_into(self._mm, 0, MAGIC, VERSION, self._used)
+
+    def _paths(self, chat_id: str) -> tuple[str, str, str]:
+        if not isinstance(chat_id, str) or not _SAFE_ID.fullmatch(chat_id):
+            raise ValueError(f"chat id not usable as a file name: {chat_id!r}")
+        base = os.path.join(self.root, chat_id)
+        return base + ".jsonl", base + ".off", base + ".json"
+
+    def _meta(self, chat_id: str) -> dict:
+        try:
+            with open(self._paths(chat_id)[2], "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _record(self, chat_id: str) -> tuple | None:
+        with self._lock:
+            slot = self._slots.get(chat_id)
+            return None if slot is None else self._read(slot)
+
+    def _after_write(self):
+        self._writes += 1
+        if self._writes % COMPACT_EVERY == 0:
+            self.compact()
+
+    def put(self, chat: dict):
+        # write a whole chat, replacing any previous version; no search update
+        hist = chat.get("history") or []
+        jsonl, off, metap = self._paths(chat["id"])
+        lines = [json.dumps(t, ensure_ascii=False).encode("utf-8") + b"\n" for t in hist]
+        offsets, pos = bytearray(), 0
+        for line in lines:
+            offsets += _OFFSET.pack(pos)
+            pos += len(line)
+        meta = {k: v for k, v in chat.items() if k not in ROW_FIELDS}
+        title = chat.get("title")
+        if title is None:
+            title = _title_from(hist[0].get("user")) if hist and isinstance(hist[0], dict) else ""
+        meta["title"] = title
+        now = _now()
+        updated = chat.get("last_updated") or now
+        with self._lock:
+            _replace_bytes(jsonl, b"".join(lines))
+            _replace_bytes(off, bytes(offsets))
+            write_json_atomic(metap, meta)
+            slot = self._slots.get(chat["id"])
+            if slot is None:
+                slot = self._new_slot()
+                self._write(slot, chat["id"], len(hist), 0, pos, chat.get("created") or updated, updated)
+                self._commit_slot(slot)
+                self._slots[chat["id"]] = slot
+            else:
+                self._write(slot, chat["id"], len(hist), 0, pos, chat.get("created") or updated, updated)
+            self._after_write()
+
+    def get_turns(self, chat_id: str, start: int = 0, end: int | None = None) -> list[dict]:
+        rec = self._record(chat_id)
+        if rec is None:
+            return []
+        _, turns, _, size, _, _ = rec
+        start = max(0, start)
+        end = turns if end is None else max(0, min(end, turns))
+        if start >= end:
+            return []
+        jsonl, off, _ = self._paths(chat_id)
+        try:
+            with open(off, "rb") as f:
+                f.seek(start * _OFFSET.size)
+                lo = _OFFSET.unpack(f.read(_OFFSET.size))[0]
+                if end < turns:
+                    f.seek(end * _OFFSET.size)
+                    hi = _OFFSET.unpack(f.read(_OFFSET.size))[0]
+                else:
+                    hi = size
+            with open(jsonl, "rb") as f:
+                f.seek(lo)
+                data = f.read(hi - lo)
+        except OSError:         # deleted meanwhile
+            return []
+        return [json.loads(line) for line in data.split(b"\n")[:-1]]
+
+    def get_chat(self, chat_id: str, with_history: bool = True) -> dict | None:
+        rec = self._record(chat_id)
+        if rec is None:
+            return None
+        meta = self._meta(chat_id)
+        title = meta.pop("title", "")
+        chat = {"id": chat_id}
+        chat.update(meta)
+        chat["turn_count"] = rec[1]
+        chat["last_updated"] = rec[5]
+        chat["title"] = title
+        chat["created"] = rec[4]
+        if with_history:
+            chat["history"] = self.get_turns(chat_id)
+        return chat
+
+    def list_chats(self) -> list[dict]:
+        with self._lock:
+            ids = list(self._slots)
+        return [c for c in (self.get_chat(i, with_history=False) for i in ids) if c]
+
+    def list_sessions(self, limit: int | None = None, offset: int = 0) -> list[dict]:
+        # sorted on the mapped records; metadata is read for the page only
+        with self._lock:
+            recs = [self._read(slot) for slot in self._slots.values()]
+        recs.sort(key=lambda r: r[0])
+        recs.sort(key=lambda r: r[5], reverse=True)
+        offset = max(0, offset)
+        page = recs[offset:] if limit is None else recs[offset:offset + max(0, limit)]
+        out = []
+        for chat_id, turns, _, _, created, updated in page:
+            meta = self._meta(chat_id)
+            out.append({"id": chat_id, "title": meta.get("title", ""), "created": created, "last_updated": updated,
+                        "turn_count": turns, "user_name": meta.get("user_name") or "", "model": meta.get("model") or ""})
+        return out
+
+    def count_chats(self) -> int:
+        return len(self._slots)
+
+    def create_chat(self, chat: dict) -> dict:
+        chat.setdefault("last_updated", _now())
+        self.put(chat)
+        _reindex(search.index_chat, chat["id"], chat.get("history") or [])
+        return chat
+
+    def save_chats(self, chats):
+        # replaces the whole store, like the SQLite store
+        chats = chats or []
+        keep = {c["id"] for c in chats}
+        with self._lock:
+            gone = [chat_id for chat_id in self._slots if chat_id not in keep]
+        for chat_id in gone:
+            self.delete_chat(chat_id)
+        for c in chats:
+            self.put(c)
+        for c in chats:
+            _reindex(search.index_chat, c["id"], c.get("history") or [])
+
+    def update_chat(self, chat_id: str, touch: bool = True, **fields) -> bool:
+        with self._lock:
+            rec = self._record(chat_id)
+            if rec is None:
+                return False
+            meta = self._meta(chat_id)
+            meta.update({k: v for k, v in fields.items() if k not in ROW_FIELDS})
+            if fields.get("title") is not None:
+                meta["title"] = str(fields["title"]).strip()
+            write_json_atomic(self._paths(chat_id)[2], meta)
+            self._write(self._slots[chat_id], chat_id, rec[1], rec[2], rec[3], rec[4],
+                        fields.get("last_updated") or (_now() if touch else rec[5]))
+        return True
+
+    def rename_chat(self, chat_id: str, title: str) -> bool:
+        with self._lock:
+            if chat_id not in self._slots:
+                return False
+            meta = self._meta(chat_id)
+            meta["title"] = title.strip()
+            write_json_atomic(self._paths(chat_id)[2], meta)
+        return True
+
+    def append_turn(self, chat_id: str, turn: dict, **fields) -> int:
+        line = json.dumps(turn, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self._lock:
+            rec = self._record(chat_id)
+            if rec is None:
+                raise KeyError(chat_id)
+            _, idx, flags, size, created, _ = rec
+            jsonl, off, metap = self._paths(chat_id)
+            with open(jsonl, "ab") as f:
+                if f.tell() != size:
+                    f.truncate(size)
+                f.write(line)
+            with open(off, "ab") as f:
+                if f.tell() != idx * _OFFSET.size:
+                    f.truncate(idx * _OFFSET.size)
+                f.write(_OFFSET.pack(size))
+            if fields:
+                # the routes pass the chat's identity on every turn; only rewrite it when it changed
+                meta = self._meta(chat_id)
+                new = {**meta, **{k: v for k, v in fields.items() if k not in ROW_FIELDS}}
+                if new != meta:
+                    write_json_atomic(metap, new)
+            self._write(self._slots[chat_id], chat_id, idx + 1, flags, size + len(line), created, _now())
+            self._after_write()
+        _reindex(search.index_turn, chat_id, idx, turn)
+        return idx + 1
+
+    def delete_chat(self, chat_id: str) -> bool:
+        with self._lock:
+            slot = self._slots.pop(chat_id, None)
+            if slot is not None:
+                rec = self._read(slot)
+                self._write(slot, chat_id, rec[1], rec[2] | DELETED, rec[3], rec[4], rec[5])
+                for p in self._paths(chat_id):
+                    try:
+                        os.remove(p)
+                    except FileNotFoundError:
+                        pass
+        _reindex(search.remove_chat, chat_id)
+        return slot is not None
+
+    def compact(self):
+        # drop deleted records from index.bin
+        with self._lock:
+            if self._used > len(self._slots):
+                recs = [self._read(slot) for slot in sorted(self._slots.values())]
+                spare = GROW - len(recs) % GROW
+                buf = bytearray(_HEADER.pack(MAGIC, VERSION, len(recs)) + bytes((len(recs) + spare) * _RECORD.size))
+                for i, (chat_id, turns, flags, size, created, updated) in enumerate(recs):
+                    _RECORD.pack_into(buf, _HEADER.size + i * _RECORD.size, chat_id.encode("utf-8"), turns, flags,
+                                      size, created.encode("ascii"), updated.encode("ascii"))
+                self.close()
+                _replace_bytes(self.index_path, bytes(buf))
+                self._open()
+            else:
+                self._mm.flush()
+        _reindex(search.compact)
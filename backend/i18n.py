@@ -1,5 +1,6 @@
 import os, json
 from .config import BASE_DIR
+from .filecache import file_cache
 
 LOCALE_DIRS = [
     os.path.join(BASE_DIR, "backend", "locales"),
@@ -39,7 +40,19 @@ def _load_file_for(code: str) -> dict:
             return _extract_keys(_safe_json_load(p))
     return {}
 
+def _dirs_stamp():
+    out = []
+    for d in LOCALE_DIRS:
+        try:
+            out.append(os.stat(d).st_mtime_ns)
+        except OSError:
+            out.append(None)
+    return tuple(out)
+
 def list_locales() -> list[str]:
+    return list(file_cache.get("i18n:locales", _scan_locales, _dirs_stamp))
+
+def _scan_locales() -> list[str]:
     files = set()
     for d in LOCALE_DIRS:
         try:
@@ -0,0 +1,95 @@
+import time, threading
+
+# Background queue for memory summarization. Jobs are keyed by chat id: a
+# chat that is scheduled again while still pending is coalesced into the
+# existing job (and its debounce deadline pushed back); a chat scheduled while
+# its job is running gets exactly one follow-up run. Finished jobs are kept
+# for a while so their status can be read, then dropped.
+
+DEBOUNCE_SECONDS = 2.0
+KEEP_FINISHED = 600.0       # seconds a done/error job stays visible
+MAX_FINISHED = 256
+
+class MemoryWorker:
+    def __init__(self, update_fn, debounce: float = DEBOUNCE_SECONDS, name: str = "memory-worker"):
+        self.update_fn = update_fn
+        self.debounce = debounce
+        self.name = name
+        self._jobs: dict[str, dict] = {}
+        self._cv = threading.Condition()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+
+    def schedule(self, chat_id: str, model: str) -> dict:
+        now = time.time()
+        with self._cv:
+            job = self._jobs.get(chat_id)
+            if job and job["state"] == "running":
+                job["rerun"] = True
+                job["model"] = model
+            elif job and job["state"] == "pending":
+                job["model"] = model
+                job["due"] = now + self.debounce
+                job["coalesced"] += 1
+            else:
+                job = self._jobs[chat_id] = {
+                    "chat_id": chat_id, "state": "pending", "model": model,
+                    "due": now + self.debounce, "scheduled": now, "coalesced": 0,
+                    "rerun": False, "runs": (job or {}).get("runs", 0),
+                    "started": None, "finished": None, "updated": None, "error": None,
+                }
+            self._ensure_thread()
+            self._cv.notify()
+            return dict(job)
+
+    def status(self, chat_id: str) -> dict | None:
+        with self._cv:
+            job = self._jobs.get(chat_id)
+            return dict(job) if job else None
+
+    def pending(self) -> int:
+        with self._cv:
+            return sum(1 for j in self._jobs.values() if j["state"] in ("pending", "running"))
+
+    def _prune(self):
+        done = sorted((j for j in self._jobs.values() if j["state"] in ("done", "error")),
+                      key=lambda j: j["finished"])
+        cutoff = time.time() - KEEP_FINISHED
+        extra = len(done) - MAX_FINISHED
+        for i, j in enumerate(done):
+            if i < extra or j["finished"] < cutoff:
+                del self._jobs[j["chat_id"]]
+
+    def _next_due(self):
+        due = [j for j in self._jobs.values() if j["state"] == "pending"]
+        return min(due, key=lambda j: j["due"]) if due else None
+
+    def _loop(self):
+        while True:
+            with self._cv:
+                job = self._next_due()
+                while job is None or job["due"] > time.time():
+                    self._cv.wait(None if job is None else max(0.0, job["due"] - time.time()))
+                    job = self._next_due()
+                job["state"] = "running"
+                job["started"] = time.time()
+                chat_id, model = job["chat_id"], job["model"]
+            try:
+                updated, error = bool(self.update_fn(chat_id, model)), None
+            except Exception as e:
+                updated, error = False, str(e)
+                print(f"[ERROR] {self.name} job for {chat_id} failed: {e}")
+            with self._cv:
+                job["runs"] += 1
+                job["finished"] = time.time()
+                job["updated"] = updated
+                job["error"] = error
+                if job["rerun"]:
+                    job.update(state="pending", rerun=False, due=time.time() + self.debounce)
+                else:
+                    job["state"] = "error" if error else "done"
+                self._prune()
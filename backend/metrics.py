@@ -0,0 +1,180 @@
+import os, time, threading
+
+# Lightweight latency instrumentation. Off unless CHANG_LI_METRICS=1; when
+# off, span() hands back a shared no-op context manager and observe()/inc()
+# return immediately, so call sites can stay in hot paths.
+#
+#   with metrics.span("prompt.build"):           # chang_li_span_seconds{span=...}
+#       ...
+#   metrics.observe("ttft_seconds", 0.42, model=m)
+#
+# Spans opened while handling a request are also collected per thread and
+# reported in that response's Server-Timing header.
+
+ENABLED = os.environ.get("CHANG_LI_METRICS", "").lower() in ("1", "true", "on")
+PREFIX = "chang_li_"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 250)
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}     # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple = ()):
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {PREFIX}{self.name} {self.help}", f"# TYPE {PREFIX}{self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labels, s in sorted(series.items()):
+            for i, b in enumerate(self.buckets):
+                out.append(f"{PREFIX}{self.name}_bucket{_fmt(labels + (('le', _num(b)),))} {s[i]}")
+            out.append(f"{PREFIX}{self.name}_bucket{_fmt(labels + (('le', '+Inf'),))} {s[-1]}")
+            out.append(f"{PREFIX}{self.name}_sum{_fmt(labels)} {_num(s[-2])}")
+            out.append(f"{PREFIX}{self.name}_count{_fmt(labels)} {s[-1]}")
+        return out
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._series: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, labels: tuple = ()):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + value
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {PREFIX}{self.name} {self.help}", f"# TYPE {PREFIX}{self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for labels, v in sorted(series.items()):
+            out.append(f"{PREFIX}{self.name}{_fmt(labels)} {_num(v)}")
+        return out
+
+def _num(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt(labels: tuple) -> str:
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in labels) + "}" if labels else ""
+
+_METRICS = {m.name: m for m in (
+    Histogram("span_seconds", "Time spent in an instrumented section."),
+    Histogram("request_seconds", "HTTP request latency (streams: until the handler returns)."),
+    Histogram("ttft_seconds", "Time from sending a generation to its first token."),
+    Histogram("generation_seconds", "Wall time of a whole generation."),
+    Histogram("tokens_per_second", "Generated tokens per second.", RATE_BUCKETS),
+    Histogram("queue_wait_seconds", "Time a generation waited for admission or a scheduler slot."),
+    Counter("generations_total", "Generations by model, engine and outcome."),
+    Counter("tokens_total", "Prompt and generated tokens by model."),
+)}
+
+_local = threading.local()
+
+class _Noop:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _Noop()
+
+class _Span:
+    __slots__ = ("name", "labels", "t0")
+
+    def __init__(self, name: str, labels: tuple):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        _METRICS["span_seconds"].observe(dt, (("span", self.name),) + self.labels)
+        trace = getattr(_local, "trace", None)
+        if trace is not None:
+            trace.append((self.name, dt))
+        return False
+
+def span(name: str, **labels):
+    if not ENABLED:
+        return _NOOP
+    return _Span(name, tuple(sorted(labels.items())))
+
+def observe(metric: str, value: float, **labels):
+    if ENABLED:
+        _METRICS[metric].observe(value, tuple(sorted(labels.items())))
+
+def inc(metric: str, value: float = 1, **labels):
+    if ENABLED:
+        _METRICS[metric].inc(value, tuple(sorted(labels.items())))
+
+def record_generation(gen, ttft: float | None = None, outcome: str = "ok"):
+    # one place for everything we learn from a finished Generation
+    if not ENABLED or gen is None:
+        return
+    model, engine = gen.model, gen.engine or "unknown"
+    inc("generations_total", model=model, engine=engine, outcome=outcome)
+    if engine == "cache":
+        return
+    observe("generation_seconds", gen.duration, model=model)
+    if ttft is not None:
+        observe("ttft_seconds", ttft, model=model)
+    if gen.eval_tokens:
+        inc("tokens_total", gen.eval_tokens, model=model, kind="eval")
+        gen_time = gen.duration - (ttft or 0.0)
+        if gen_time > 0:
+            observe("tokens_per_second", gen.eval_tokens / gen_time, model=model)
+    if gen.prompt_tokens:
+        inc("tokens_total", gen.prompt_tokens, model=model, kind="prompt")
+
+def trace_begin():
+    if ENABLED:
+        _local.trace = []
+
+def trace_end() -> list[tuple[str, float]]:
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    return trace or []
+
+def server_timing(trace: list[tuple[str, float]]) -> str:
+    return ", ".join(f"{name.replace('.', '-')};dur={dt * 1000:.1f}" for name, dt in trace)
+
+def render() -> str:
+    lines = []
+    for m in _METRICS.values():
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+def set_enabled(on: bool):
+    global ENABLED
+    ENABLED = bool(on)
+
+def reset():
+    for name, m in list(_METRICS.items()):
+        _METRICS[name] = type(m)(m.name, m.help, m.buckets) if isinstance(m, Histogram) else type(m)(m.name, m.help)
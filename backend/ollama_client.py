@@ -1,73 +1,52 @@
-import os, subprocess, re
-from .config import OLLAMA_PATH, OLLAMA_MODELS
-
-SKIP_PHRASES = [
-    "Thinking", "...done thinking",
-    "We need to respond as Changli", "Personality:",
-    "The user says", "We need to be friendly."
-    "We need to respond to" 
-    "The user is" 
-    "so address them as" 
-    "Keep it friendly, simple, Indonesian slang default." 
-    "So answer" 
-    "That is concise."
-]
-
-_META_RE = [
-    re.compile(r'^\s*(analysis|reasoning|thoughts?|system|meta|notes?|context|tool(?:s)?|plan|guidelines)\s*[:\-]\s*', re.I),
-    re.compile(r'^\s*(assistant|user|developer)\s*[:\-]\s*', re.I),
-    re.compile(r'^\s*the conversation\s*[:\-]\s*', re.I),
-    re.compile(r'^\s*as (an )?ai\b', re.I),
-    re.compile(r'^\s*final answer\s*[:\-]\s*', re.I),
-]
-
-def _filter_output(raw: str) -> str:
-    if not raw:
-        return "Sorry sayang, aku lagi bingung nih... 😢"
-
-    s = raw.replace("```", "\n")
-
-    kept = []
-    for line in s.splitlines():
-        t = line.strip()
-        if not t:
-            kept.append("") 
-            continue
-        if any(p.lower() in t.lower() for p in SKIP_PHRASES):
-            continue
-        if any(rx.match(t) for rx in _META_RE):
-            continue
-        if (t.startswith("[") and t.endswith("]")) or (t.startswith("(") and t.endswith(")")):
-            low = t.lower()
-            if any(k in low for k in ("analysis", "system", "thought", "tool", "meta", "context")):
-                continue
-        kept.append(t)
-
-    out = "\n".join([k for k in kept if k != ""]).strip()
-    if out:
-        return out
-
-    paras = [p.strip() for p in re.split(r'\n\s*\n', s) if p.strip()]
-    for p in reversed(paras):
-        low = p.lower()
-        if any(rx.match(p) for rx in _META_RE):
-            continue
-        if any(lbl in low for lbl in ("the conversation:", "assistant:", "user:", "system:", "analysis:", "reasoning:")):
-            continue
-        return p.strip()
-
-    return "Sorry sayang, aku lagi bingung nih... 😢"
-
-def list_models() -> list[str]:
-    if not os.path.exists(OLLAMA_PATH):
-        return []
-    env = os.environ.copy()
-    env["OLLAMA_MODELS"] = OLLAMA_MODELS
-    try:
+import os, subprocess, json, codecs, threading, time
+from dataclasses import dataclass, field
+import requests
+from requests.adapters import HTTPAdapter
+from .output_filter import filter_output
+from .response_cache import active_cache, cacheable, cache_key
+from . import metrics
+from .config import OLLAMA_PATH, OLLAMA_MODELS, OLLAMA_HOST, OLLAMA_ENGINE, OLLAMA_TIMEOUT, OLLAMA_POOL, MODELS_TTL
+
+_filter_output = filter_output
+
+class EngineUnavailable(RuntimeError):
+    pass
+
+@dataclass
+class Generation:
+    text: str
+    model: str
+    context: list | None = None
+    prompt_tokens: int = 0
+    eval_tokens: int = 0
+    duration: float = 0.0
+    engine: str = ""
+    load_time: float = 0.0
+    extra: dict = field(default_factory=dict)
+
+class CLIEngine:
+    name = "cli"
+    supports_context = False
+
+    def __init__(self, path: str = OLLAMA_PATH, models_dir: str = OLLAMA_MODELS):
+        self.path = path
+        self.models_dir = models_dir
+
+    def _env(self) -> dict:
+        env = os.environ.copy()
+        env["OLLAMA_MODELS"] = self.models_dir
+        return env
+
+    def available(self) -> bool:
+        return os.path.exists(self.path)
+
+    def list_models(self) -> list[str]:
+        if not self.available():
+            raise EngineUnavailable(f"Ollama executable not found at {self.path}")
         r = subprocess.run(
-            [OLLAMA_PATH, "list"],
+            [self.path, "list"],
             capture_output=True, text=True, encoding="utf-8",
-            env=env, timeout=30
+            env=self._env(), timeout=30
         )
         names = []
         for line in r.stdout.splitlines():
@@ -77,30 +56,445 @@ def list_models() -> list[str]:
                 if ":" in name:
                     names.append(name)
         return sorted(set(names))
+
+    def generate(self, prompt: str, model: str, options: dict | None = None,
+                 context: list | None = None, keep_alive=None) -> Generation:
+        if not self.available():
+            raise EngineUnavailable(f"Ollama executable not found at {self.path}")
+        t0 = time.perf_counter()
+        # the prompt goes through stdin, argv has a platform size limit
+        r = subprocess.run(
+            [self.path, "run", model],
+            input=prompt, capture_output=True, text=True, encoding="utf-8",
+            env=self._env(), timeout=OLLAMA_TIMEOUT
+        )
+        if r.returncode != 0:
+            # missing model, daemon down...: an error, never a reply
+            raise RuntimeError((r.stderr or "").strip() or f"ollama run {model} exited with code {r.returncode}")
+        return Generation(text=r.stdout, model=model, duration=time.perf_counter() - t0, engine=self.name)
+
+    def stream(self, prompt: str, model: str, options: dict | None = None,
+               context: list | None = None, keep_alive=None):
+        if not self.available():
+            raise EngineUnavailable(f"Ollama executable not found at {self.path}")
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(
+            [self.path, "run", model],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            env=self._env(), bufsize=0
+        )
+        buf = []
+        try:
+            proc.stdin.write(prompt.encode("utf-8")); proc.stdin.close()
+            dec = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            while True:
+                raw = proc.stdout.read(256)
+                if not raw:
+                    break
+                piece = dec.decode(raw)
+                if piece:
+                    buf.append(piece)
+                    yield piece
+            tail = dec.decode(b"", final=True)
+            if tail:
+                buf.append(tail)
+                yield tail
+            if proc.wait(timeout=OLLAMA_TIMEOUT) != 0:
+                raise RuntimeError(f"ollama run {model} exited with code {proc.returncode}")
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+        return Generation(text="".join(buf), model=model, duration=time.perf_counter() - t0, engine=self.name)
+
+    def embed(self, texts: list[str], model: str) -> list[list[float]]:
+        raise EngineUnavailable("the ollama CLI has no embedding command")
+
+    def unload(self, model: str) -> bool:
+        if not self.available():
+            raise EngineUnavailable(f"Ollama executable not found at {self.path}")
+        r = subprocess.run([self.path, "stop", model], capture_output=True, text=True,
+                           env=self._env(), timeout=30)
+        return r.returncode == 0
+
+    def chat(self, messages: list[dict], model: str, options: dict | None = None, keep_alive=None) -> Generation:
+        buf = []
+        for m in messages:
+            role = m.get("role", "user")
+            content = m.get("content", "")
+            if role == "system":
+                buf.append(content)
+            else:
+                buf.append(f"{'User' if role == 'user' else 'AI'}: {content}")
+        buf.append("AI:")
+        return self.generate("\n".join(buf), model, options=options, keep_alive=keep_alive)
+
+class HTTPEngine:
+    name = "http"
+    supports_context = True
+
+    def __init__(self, host: str = OLLAMA_HOST, pool_size: int = OLLAMA_POOL, timeout: float = OLLAMA_TIMEOUT):
+        self.host = host.rstrip("/")
+        self.timeout = timeout
+        self.sess = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.sess.mount("http://", adapter)
+        self.sess.mount("https://", adapter)
+
+    def _post(self, path: str, payload: dict, timeout=None, stream: bool = False):
+        try:
+            r = self.sess.post(self.host + path, json=payload, timeout=timeout or self.timeout, stream=stream)
+        except requests.ConnectionError as e:
+            raise EngineUnavailable(f"Ollama API not reachable at {self.host}: {e}") from e
+        r.raise_for_status()
+        return r
+
+    def available(self, timeout: float = 0.5) -> bool:
+        try:
+            return self.sess.get(self.host + "/api/version", timeout=timeout).ok
+        except Exception:
+            return False
+
+    def list_models(self) -> list[str]:
+        try:
+            r = self.sess.get(self.host + "/api/tags", timeout=10)
+        except requests.ConnectionError as e:
+            raise EngineUnavailable(f"Ollama API not reachable at {self.host}: {e}") from e
+        r.raise_for_status()
+        names = [m.get("name") or m.get("model") for m in (r.json().get("models") or [])]
+        return sorted(set(n for n in names if n))
+
+    @staticmethod
+    def _payload(model: str, options: dict | None, keep_alive) -> dict:
+        payload = {"model": model, "stream": False}
+        if options:
+            payload["options"] = options
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return payload
+
+    def generate(self, prompt: str, model: str, options: dict | None = None,
+                 context: list | None = None, keep_alive=None, raw: bool = False) -> Generation:
+        payload = self._payload(model, options, keep_alive)
+        payload["prompt"] = prompt
+        if context:
+            payload["context"] = context
+        if raw:
+            payload["raw"] = True
+        t0 = time.perf_counter()
+        data = self._post("/api/generate", payload).json()
+        return Generation(
+            text=data.get("response", ""), model=model, context=data.get("context"),
+            prompt_tokens=data.get("prompt_eval_count", 0), eval_tokens=data.get("eval_count", 0),
+            duration=time.perf_counter() - t0, engine=self.name, load_time=data.get("load_duration", 0) / 1e9,
+        )
+
+    def stream(self, prompt: str, model: str, options: dict | None = None,
+               context: list | None = None, keep_alive=None, raw: bool = False):
+        payload = self._payload(model, options, keep_alive)
+        payload.update(prompt=prompt, stream=True)
+        if context:
+            payload["context"] = context
+        if raw:
+            payload["raw"] = True
+        t0 = time.perf_counter()
+        r = self._post("/api/generate", payload, stream=True)
+        buf, last = [], {}
+        try:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                last = json.loads(line)
+                if last.get("error"):
+                    raise RuntimeError(last["error"])
+                tok = last.get("response", "")
+                if tok:
+                    buf.append(tok)
+                    yield tok
+                if last.get("done"):
+                    break
+        finally:
+            r.close()
+        return Generation(
+            text="".join(buf), model=model, context=last.get("context"),
+            prompt_tokens=last.get("prompt_eval_count", 0), eval_tokens=last.get("eval_count", 0),
+            duration=time.perf_counter() - t0, engine=self.name, load_time=last.get("load_duration", 0) / 1e9,
+        )
+
+    def chat(self, messages: list[dict], model: str, options: dict | None = None, keep_alive=None) -> Generation:
+        payload = self._payload(model, options, keep_alive)
+        payload["messages"] = messages
+        t0 = time.perf_counter()
+        data = self._post("/api/chat", payload).json()
+        return Generation(
+            text=(data.get("message") or {}).get("content", ""), model=model,
+            prompt_tokens=data.get("prompt_eval_count", 0), eval_tokens=data.get("eval_count", 0),
+            duration=time.perf_counter() - t0, engine=self.name, load_time=data.get("load_duration", 0) / 1e9,
+        )
+
+    def embed(self, texts: list[str], model: str) -> list[list[float]]:
+        data = self._post("/api/embed", {"model": model, "input": list(texts)}, timeout=120).json()
+        vectors = data.get("embeddings") or []
+        if len(vectors) != len(texts):
+            raise RuntimeError(f"expected {len(texts)} embeddings from {model}, got {len(vectors)}")
+        return vectors
+
+    def unload(self, model: str) -> bool:
+        self._post("/api/generate", {"model": model, "keep_alive": 0}, timeout=30)
+        return True
+
+_engine = None
+_fallback = None
+_engine_lock = threading.Lock()
+
+def _select_engine():
+    http = HTTPEngine()
+    cli = CLIEngine()
+    if OLLAMA_ENGINE == "cli":
+        return cli, None
+    if OLLAMA_ENGINE == "http":
+        return http, None
+    if http.available() or not cli.available():
+        return http, cli
+    return cli, http
+
+def get_engine():
+    global _engine, _fallback
+    with _engine_lock:
+        if _engine is None:
+            _engine, _fallback = _select_engine()
+        return _engine
+
+def set_engine(engine, fallback=None):
+    global _engine, _fallback
+    with _engine_lock:
+        _engine, _fallback = engine, fallback
+    registry.invalidate()
+
+def supports_context() -> bool:
+    return getattr(get_engine(), "supports_context", False)
+
+def _adapt(engine, args: tuple, kwargs: dict) -> tuple[tuple, dict]:
+    # a prompt continued from a context handle is only a suffix (sent raw, so
+    # the chat template is not wrapped around it); engines without context
+    # support need the full prompt instead
+    kwargs = dict(kwargs)
+    full_prompt = kwargs.pop("full_prompt", None)
+    if kwargs.get("context") and not getattr(engine, "supports_context", False):
+        kwargs.pop("context")
+        kwargs.pop("raw", None)
+        if full_prompt is not None:
+            args = (full_prompt,) + tuple(args[1:])
+    return args, kwargs
+
+def _call(method: str, *args, **kwargs):
+    engine = get_engine()
+    try:
+        a, kw = _adapt(engine, args, kwargs)
+        return getattr(engine, method)(*a, **kw)
+    except EngineUnavailable:
+        if _fallback is None or not _fallback.available():
+            raise
+        print(f"[WARN] {engine.name} engine unavailable, falling back to {_fallback.name}")
+        a, kw = _adapt(_fallback, args, kwargs)
+        return getattr(_fallback, method)(*a, **kw)
+
+def _stream_with_fallback(prompt: str, model: str, **kwargs):
+    engine = get_engine()
+    try:
+        a, kw = _adapt(engine, (prompt, model), kwargs)
+        return (yield from engine.stream(*a, **kw))
+    except EngineUnavailable:
+        if _fallback is None or not _fallback.available():
+            raise
+        print(f"[WARN] {engine.name} engine unavailable, falling back to {_fallback.name}")
+        a, kw = _adapt(_fallback, (prompt, model), kwargs)
+        return (yield from _fallback.stream(*a, **kw))
+
+class ModelRegistry:
+    MISS_REFRESH = 5.0
+
+    def __init__(self, ttl: float = MODELS_TTL):
+        self.ttl = ttl
+        self._names: list[str] | None = None
+        self._fetched = 0.0
+        self._lock = threading.Lock()
+
+    def _fetch(self) -> list[str]:
+        with metrics.span("ollama.list"):
+            names = _call("list_models")
+        self._names, self._fetched = names, time.monotonic()
+        return names
+
+    def models(self, refresh: bool = False) -> list[str]:
+        with self._lock:
+            fresh = self._names is not None and time.monotonic() - self._fetched < self.ttl
+            if fresh and not refresh:
+                return list(self._names)
+            return list(self._fetch())
+
+    def has(self, model: str) -> bool:
+        if model in self.models():
+            return True
+        # a model pulled after the last listing should not wait out the ttl
+        with self._lock:
+            if time.monotonic() - self._fetched < self.MISS_REFRESH:
+                return False
+        return model in self.models(refresh=True)
+
+    def invalidate(self):
+        with self._lock:
+            self._names, self._fetched = None, 0.0
+
+registry = ModelRegistry()
+
+def list_models(refresh: bool = False) -> list[str]:
+    try:
+        return registry.models(refresh=refresh)
     except Exception:
         return []
 
-def generate_text(prompt: str, model: str = "gemma3:4b") -> str | None:
-    if not os.path.exists(OLLAMA_PATH):
-        print(f"[ERROR] Ollama executable not found at {OLLAMA_PATH}")
-        return None
-    env = os.environ.copy()
-    env["OLLAMA_MODELS"] = OLLAMA_MODELS
+def _cache_lookup(prompt: str, model: str, kwargs: dict, lookup: bool = True):
+    cache = active_cache()
+    if cache is None or not cacheable(kwargs):
+        return None, None, None
+    key = cache_key(model, prompt, kwargs)
+    return cache, key, (cache.get(key) if lookup else None)
+
+def _cached_generation(hit: dict, model: str) -> Generation:
+    return Generation(text=hit["text"], model=model, context=hit.get("context"),
+                      prompt_tokens=hit.get("prompt_tokens", 0), eval_tokens=hit.get("eval_tokens", 0),
+                      engine="cache")
+
+def _cache_store(cache, key: str, model: str, gen: Generation | None):
+    if cache is not None and gen is not None and gen.text:
+        cache.put(key, model, {"text": gen.text, "context": gen.context,
+                               "prompt_tokens": gen.prompt_tokens, "eval_tokens": gen.eval_tokens})
+
+def lookup_cached(prompt: str, model: str = "gemma3:4b", **kwargs) -> Generation | None:
+    # peek without generating, so callers can skip scheduling on a hit
+    _, _, hit = _cache_lookup(prompt, model, kwargs)
+    return _cached_generation(hit, model) if hit is not None else None
 
+def generate(prompt: str, model: str = "gemma3:4b", cache_checked: bool = False, model_checked: bool = False,
+             **kwargs) -> Generation | None:
+    # cache_checked: the caller already missed in lookup_cached(), only store the result;
+    # model_checked: the caller already looked the model up in the registry
     try:
-        r_list = subprocess.run(
-            [OLLAMA_PATH, "list"],
-            capture_output=True, text=True, encoding="utf-8", env=env, timeout=30
-        )
-        if "gemma3:4b" not in r_list.stdout:
+        cache, key, hit = _cache_lookup(prompt, model, kwargs, lookup=not cache_checked)
+        if hit is not None:
+            gen = _cached_generation(hit, model)
+            metrics.record_generation(gen)
+            return gen
+        if not model_checked and not registry.has(model):
             print(f"[ERROR] Model {model} not found in {OLLAMA_MODELS}")
             return None
-
-        result = subprocess.run(
-            [OLLAMA_PATH, "run", model, prompt],
-            capture_output=True, text=True, encoding="utf-8", env=env
-        )
-        return _filter_output(result.stdout)
+        with metrics.span("ollama.generate", model=model):
+            gen = _call("generate", prompt, model, **kwargs)
+        metrics.record_generation(gen)
+        _cache_store(cache, key, model, gen)
+        return gen
     except Exception as e:
+        metrics.inc("generations_total", model=model, engine="unknown", outcome="error")
         print(f"[ERROR] generate_text failed: {e}")
         return None
+
+def unload_model(model: str) -> bool:
+    try:
+        return bool(_call("unload", model))
+    except Exception as e:
+        print(f"[ERROR] unload {model} failed: {e}")
+        return False
+
+def embed(texts: list[str], model: str) -> list[list[float]]:
+    # raises on failure; callers decide whether to fall back
+    with metrics.span("ollama.embed", model=model):
+        return _call("embed", list(texts), model)
+
+def generate_text(prompt: str, model: str = "gemma3:4b", **kwargs) -> str | None:
+    gen = generate(prompt, model=model, **kwargs)
+    if gen is None:
+        return None
+    return _filter_output(gen.text)
+
+class TokenStream:
+    def __init__(self, model: str, source=None, error: str | None = None):
+        self.model = model
+        self._source = source
+        self._parts: list[str] = []
+        self.generation: Generation | None = None
+        self.error = error
+        self.aborted = False
+        self.cached = False
+
+    def __iter__(self):
+        if self._source is None:
+            return
+        t0, ttft = time.perf_counter(), None
+        try:
+            while not self.aborted:
+                tok = next(self._source)
+                if ttft is None:
+                    ttft = time.perf_counter() - t0
+                self._parts.append(tok)
+                yield tok
+        except StopIteration as stop:
+            self.generation = stop.value
+        except Exception as e:
+            self.error = str(e)
+            print(f"[ERROR] generate_stream failed: {e}")
+        finally:
+            self.close()
+        if self.generation is not None:
+            metrics.record_generation(self.generation, None if self.cached else ttft)
+        else:
+            metrics.inc("generations_total", model=self.model, engine="stream",
+                        outcome="aborted" if self.aborted else "error")
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def abort(self):
+        # safe from another thread: the iterating thread stops at the next
+        # token and closes the source, which drops the connection to Ollama
+        self.aborted = True
+
+    def close(self):
+        src, self._source = self._source, None
+        if src is not None:
+            src.close()
+
+def _replay(gen: Generation):
+    yield gen.text
+    return gen
+
+def _stream_into_cache(source, cache, key: str, model: str):
+    gen = yield from source
+    _cache_store(cache, key, model, gen)
+    return gen
+
+def generate_stream(prompt: str, model: str = "gemma3:4b", model_checked: bool = False, **kwargs) -> TokenStream:
+    try:
+        cache, key, hit = _cache_lookup(prompt, model, kwargs)
+        if hit is not None:
+            ts = TokenStream(model, _replay(_cached_generation(hit, model)))
+            ts.cached = True
+            return ts
+        if not model_checked and not registry.has(model):
+            print(f"[ERROR] Model {model} not found in {OLLAMA_MODELS}")
+            return TokenStream(model, error=f"model {model} not found")
+        source = _stream_with_fallback(prompt, model, **kwargs)
+        if cache is not None:
+            source = _stream_into_cache(source, cache, key, model)
+        return TokenStream(model, source)
+    except Exception as e:
+        print(f"[ERROR] generate_stream failed: {e}")
+        return TokenStream(model, error=str(e))
+
+def chat_text(messages: list[dict], model: str = "gemma3:4b", **kwargs) -> str | None:
+    try:
+        gen = _call("chat", messages, model, **kwargs)
+    except Exception as e:
+        print(f"[ERROR] chat_text failed: {e}")
+        return None
+    return _filter_output(gen.text)
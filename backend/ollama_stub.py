@@ -0,0 +1,182 @@
+import json, time, hashlib, argparse, threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_MODELS = ["gemma3:4b", "stub:latest", "nomic-embed-text:latest"]
+EMBED_DIM = 64
+
+def stub_reply(prompt: str) -> str:
+    last = ""
+    for line in reversed((prompt or "").splitlines()):
+        t = line.strip()
+        if t.lower().startswith("user:"):
+            last = t.split(":", 1)[1].strip()
+            break
+    return f"Stub reply to: {last}" if last else "Stub reply."
+
+def stub_embedding(text: str) -> list[float]:
+    # bag of words hashed into EMBED_DIM buckets: overlapping words, similar vectors
+    vec = [0.0] * EMBED_DIM
+    for w in (text or "").lower().split():
+        vec[int(hashlib.md5(w.encode("utf-8")).hexdigest(), 16) % EMBED_DIM] += 1.0
+    return vec
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "OllamaStub/0.1"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _json(self, obj: dict, status: int = 200):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        n = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(n) or b"{}")
+        except Exception:
+            return {}
+
+    def _tokens(self, text: str) -> list[str]:
+        words = text.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    def _stream(self, chunks: list[dict], final: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for obj in chunks + [final]:
+                if self.server.token_delay:
+                    time.sleep(self.server.token_delay)
+                line = (json.dumps(obj) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # client stopped the generation, same as Ollama dropping the request
+            self.server.aborted += 1
+            self.close_connection = True
+
+    def _load(self, model: str) -> float:
+        # emulate Ollama keeping at most `max_loaded` models resident
+        srv = self.server
+        with srv.lock:
+            hot = model in srv.loaded
+            srv.loaded[model] = time.time()
+            srv.loaded.move_to_end(model)
+            while len(srv.loaded) > srv.max_loaded:
+                srv.loaded.popitem(last=False)
+            if not hot:
+                srv.loads += 1
+        if hot or not srv.load_delay:
+            return 0.0
+        time.sleep(srv.load_delay)
+        return srv.load_delay
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            return self._json({"version": "0.0.0-stub"})
+        if self.path == "/api/tags":
+            return self._json({"models": [{"name": m, "model": m} for m in self.server.models]})
+        self._json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        data = self._body()
+        model = data.get("model", "")
+        if self.path not in ("/api/generate", "/api/chat", "/api/embed"):
+            return self._json({"error": "not found"}, 404)
+        if model not in self.server.models and f"{model}:latest" not in self.server.models:
+            return self._json({"error": f"model '{model}' not found"}, 404)
+        if self.path == "/api/embed":
+            inputs = data.get("input")
+            inputs = [inputs] if isinstance(inputs, str) else list(inputs or [])
+            with self.server.lock:
+                self.server.requests.append({"path": self.path, "model": model, "body": data})
+            return self._json({"model": model, "embeddings": [stub_embedding(t) for t in inputs]})
+        if data.get("keep_alive") in (0, "0", "0s") and not data.get("prompt") and not data.get("messages"):
+            with self.server.lock:
+                self.server.requests.append({"path": self.path, "model": model, "body": data})
+                self.server.loaded.pop(model, None)
+                self.server.unloads += 1
+            return self._json({"model": model, "done": True, "done_reason": "unload", "response": ""})
+        load = self._load(model)
+
+        if self.path == "/api/generate":
+            prompt = data.get("prompt", "")
+        else:
+            msgs = data.get("messages") or []
+            prompt = "\n".join(f"{m.get('role', 'user').capitalize()}: {m.get('content', '')}" for m in msgs)
+        with self.server.lock:
+            self.server.requests.append({"path": self.path, "model": model, "body": data})
+        reply = self.server.reply_fn(prompt)
+        tokens = self._tokens(reply)
+        stats = {"done": True, "model": model, "prompt_eval_count": len(prompt.split()), "eval_count": len(tokens),
+                 "load_duration": int(load * 1e9)}
+
+        if self.path == "/api/generate":
+            stats["context"] = list(range(len(prompt.split()) + len(tokens)))
+            if data.get("stream", True):
+                return self._stream([{"model": model, "response": t, "done": False} for t in tokens],
+                                    {**stats, "response": ""})
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay * len(tokens))
+            return self._json({**stats, "response": reply})
+
+        if data.get("stream", True):
+            return self._stream([{"model": model, "message": {"role": "assistant", "content": t}, "done": False} for t in tokens],
+                                {**stats, "message": {"role": "assistant", "content": ""}})
+        if self.server.token_delay:
+            time.sleep(self.server.token_delay * len(tokens))
+        self._json({**stats, "message": {"role": "assistant", "content": reply}})
+
+def make_stub_server(host: str = "127.0.0.1", port: int = 0, models=None, token_delay: float = 0.0,
+                     reply_fn=stub_reply, verbose: bool = False, load_delay: float = 0.0,
+                     max_loaded: int = 3) -> ThreadingHTTPServer:
+    srv = ThreadingHTTPServer((host, port), StubHandler)
+    srv.daemon_threads = True
+    srv.models = list(models or STUB_MODELS)
+    srv.token_delay = token_delay
+    srv.reply_fn = reply_fn
+    srv.verbose = verbose
+    srv.requests = []
+    srv.aborted = 0
+    srv.load_delay = load_delay
+    srv.max_loaded = max_loaded
+    srv.loaded = OrderedDict()
+    srv.loads = 0
+    srv.unloads = 0
+    srv.lock = threading.Lock()
+    return srv
+
+def start_stub(**kwargs) -> tuple[ThreadingHTTPServer, str]:
+    srv = make_stub_server(**kwargs)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    host, port = srv.server_address[:2]
+    return srv, f"http://{host}:{port}"
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Offline stand-in for the Ollama HTTP API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11434)
+    ap.add_argument("--model", action="append", dest="models")
+    ap.add_argument("--token-delay", type=float, default=0.0)
+    ap.add_argument("--load-delay", type=float, default=0.0, help="seconds to 'load' a cold model")
+    ap.add_argument("--max-loaded", type=int, default=3)
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args()
+    srv = make_stub_server(args.host, args.port, args.models, args.token_delay, verbose=args.verbose,
+                           load_delay=args.load_delay, max_loaded=args.max_loaded)
+    print(f"Ollama stub listening on http://{args.host}:{srv.server_address[1]} models={srv.models}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
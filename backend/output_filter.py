@@ -0,0 +1,203 @@
+import re
+
+# Strips reasoning/meta lines from model output. Phrases and prefixes are
+# lowercased once and compiled into single alternations; each line is
+# lowercased once and costs one search for the skip phrases plus one anchored
+# match for the meta prefixes.
+
+FALLBACK_REPLY = "Sorry sayang, aku lagi bingung nih... 😢"
+
+SKIP_PHRASES = [
+    "Thinking", "...done thinking",
+    "We need to respond as Changli", "Personality:",
+    "The user says", "We need to be friendly.",
+    "We need to respond to",
+    "The user is",
+    "so address them as",
+    "Keep it friendly, simple, Indonesian slang default.",
+    "So answer",
+    "That is concise.",
+]
+
+_SKIP_LOWER = tuple(sorted({p.lower() for p in SKIP_PHRASES}, key=len, reverse=True))
+_SKIP_RE = re.compile("|".join(re.escape(p) for p in _SKIP_LOWER))
+
+_META_RE = re.compile(
+    r'(?:(?:analysis|reasoning|thoughts?|system|meta|notes?|context|tools?|plan|guidelines'
+    r'|assistant|user|developer|the conversation|final answer)\s*[:\-]'
+    r'|as (?:an )?ai\b)'
+)
+
+_BRACKET_RE = re.compile(r'analysis|system|thought|tool|meta|context')
+
+_LABEL_RE = re.compile(r'the conversation:|assistant:|user:|system:|analysis:|reasoning:')
+
+_PARA_RE = re.compile(r'\n\s*\n')
+
+def keep_line(t: str) -> bool:
+    low = t.lower()
+    if _SKIP_RE.search(low):
+        return False
+    if _META_RE.match(low):
+        return False
+    if ((t[0] == "[" and t[-1] == "]") or (t[0] == "(" and t[-1] == ")")) and _BRACKET_RE.search(low):
+        return False
+    return True
+
+def _fallback_paragraph(s: str) -> str:
+    paras = [p.strip() for p in _PARA_RE.split(s) if p.strip()]
+    for p in reversed(paras):
+        low = p.lower()
+        if _META_RE.match(low) or _LABEL_RE.search(low):
+            continue
+        return p
+    return ""
+
+def _kept_lines(s: str) -> list[str]:
+    return [t for t in (line.strip() for line in s.splitlines()) if t and keep_line(t)]
+
+def filter_output(raw: str) -> str:
+    if not raw:
+        return FALLBACK_REPLY
+    s = raw.replace("```", "\n")
+    out = "\n".join(_kept_lines(s))
+    if out:
+        return out
+    return _fallback_paragraph(s) or FALLBACK_REPLY
+
+# Incremental variant for token streams. Complete lines go through the same
+# pass as filter_output(). The line still being written is shown as it grows:
+# the skip-phrase and bracket-word searches only look at the text that just
+# arrived (plus enough overlap to catch a phrase split across chunks) and the
+# meta-prefix match only at the start of the line, so a token costs about its
+# own length. feed() returns ("append", text) for new text, or ("reset", text)
+# when a line already shown turns out to be filtered. finish() settles on
+# exactly what filter_output() returns for the full text.
+
+_SPAN = max(map(len, _SKIP_LOWER)) - 1    # overlap kept when searching new text
+_META_SPAN = 64     # the meta prefixes are all shorter than this
+_META_FINAL = 24    # past this length a line's meta verdict no longer changes
+_CLOSE = {"[": "]", "(": ")"}
+
+def _push(events: list, kind: str, text: str):
+    # keeps at most one event per call: a reset replaces everything before it
+    if kind == "reset":
+        events[:] = [("reset", text)]
+    elif text:
+        if events:
+            events[-1] = (events[-1][0], events[-1][1] + text)
+        else:
+            events.append(("append", text))
+
+class StreamFilter:
+    def __init__(self):
+        self._raw: list[str] = []
+        self._lines: list[str] = []     # kept complete lines, all shown
+        self._new_line()
+
+    def _new_line(self, s: str = ""):
+        self._line = s
+        self._scan = 0          # how much of _line the phrase searches have covered
+        self._skip = False
+        self._meta = None       # meta-prefix verdict, once it can no longer change
+        self._lead = None       # first non-blank character of _line
+        self._end = 0           # end of _line without trailing blanks
+        self._shown = None      # end of the part of _line on screen, None if hidden
+
+    def _sep(self) -> str:
+        return "\n" if self._lines else ""
+
+    def _close_line(self, line: str, events: list):
+        kept = _kept_lines(line)
+        text = "\n".join(kept)
+        if self._shown is None:
+            if kept:
+                _push(events, "append", self._sep() + text)
+        else:
+            shown = self._line[self._lead:self._shown]
+            if text.startswith(shown) and kept:
+                _push(events, "append", text[len(shown):])
+            else:
+                _push(events, "reset", "\n".join(self._lines + kept))
+        self._lines.extend(kept)
+
+    def _provisional(self, start: int, events: list):
+        s = self._line
+        if not self._skip:
+            self._skip = _SKIP_RE.search(s[max(0, self._scan - _SPAN):].lower()) is not None
+        self._scan = len(s)
+        lead = self._lead
+        if lead is None:
+            rest = s.lstrip()
+            if not rest:
+                return
+            lead = self._lead = len(s) - len(rest)
+        # trailing backticks wait: they may still become a ``` fence
+        tail = s[start:].rstrip()
+        if tail.endswith("`"):
+            tail = tail.rstrip("`").rstrip()
+        end = self._end = start + len(tail) if tail else self._end
+        if self._skip or end <= lead:
+            keep = False
+        else:
+            meta = self._meta
+            if meta is None:
+                meta = _META_RE.match(s[lead:lead + _META_SPAN].lower()) is not None
+                if end - lead > _META_FINAL:
+                    self._meta = meta
+            keep = not meta
+            if keep and _CLOSE.get(s[lead]) == s[end - 1]:
+                keep = not _BRACKET_RE.search(s[lead:end].lower())
+        shown = self._shown
+        if keep:
+            if shown is None:
+                _push(events, "append", self._sep() + s[lead:end])
+            elif end > shown:
+                _push(events, "append", s[shown:end])
+            self._shown = end
+        elif shown is not None:
+            _push(events, "reset", "\n".join(self._lines))
+            self._shown = None
+
+    def feed(self, chunk: str) -> list[tuple[str, str]]:
+        if not chunk:
+            return []
+        self._raw.append(chunk)
+        start = len(self._line)
+        s = self._line + chunk
+        if "`" in chunk:
+            start = max(0, start - 2)
+            if "```" in s[start:]:
+                s = s[:start] + s[start:].replace("```", "\n")
+        events: list[tuple[str, str]] = []
+        nl = s.find("\n", start)
+        if nl < 0:
+            self._line = s
+        else:
+            self._close_line(s[:nl], events)
+            cut = s.rfind("\n")
+            if cut > nl:
+                self._shown = None
+                self._close_line(s[nl + 1:cut], events)
+            self._new_line(s[cut + 1:])
+            start = 0
+        self._provisional(start, events)
+        return events
+
+    def finish(self) -> tuple[str, list[tuple[str, str]]]:
+        shown = "\n".join(self._lines)
+        if self._shown is not None:
+            shown += self._sep() + self._line[self._lead:self._shown]
+        lines = self._lines + _kept_lines(self._line)
+        final = "\n".join(lines) if lines else filter_output(self.text)
+        self._lines = [final]
+        self._new_line()
+        if final == shown:
+            return final, []
+        if final.startswith(shown):
+            return final, [("append", final[len(shown):])]
+        return final, [("reset", final)]
+
+    @property
+    def text(self) -> str:
+        return "".join(self._raw)
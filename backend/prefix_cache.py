@@ -0,0 +1,80 @@
+import threading
+from collections import OrderedDict
+
+# Remembers, per chat, the last prompt sent to the model together with the
+# raw reply and the runtime's `context` handle. When the next prompt starts
+# with exactly that text, only the new suffix is sent along with the handle,
+# so the runtime does not prefill the conversation again. It also tracks how
+# much of each prompt is a byte-identical prefix of the previous one, which is
+# what a runtime-side KV cache can reuse even without a handle.
+
+MAX_CHATS = 256
+
+def _common_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    if a[:n] == b[:n]:
+        return n
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+class PrefixCache:
+    def __init__(self, max_chats: int = MAX_CHATS):
+        self.max_chats = max_chats
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"turns": 0, "prompt_chars": 0, "prefix_chars": 0, "context_hits": 0, "context_chars": 0}
+
+    def lookup(self, chat_id: str, model: str, prompt: str, use_context: bool = True) -> tuple[str, list | None, dict]:
+        with self._lock:
+            ent = self._entries.get(chat_id)
+            if ent is not None:
+                self._entries.move_to_end(chat_id)
+            prev = ent["prompt"] if ent and ent["model"] == model else ""
+            shared = _common_prefix(prev, prompt) if prev else 0
+            send, ctx, continued = prompt, None, 0
+            if use_context and ent and ent["model"] == model and ent.get("context") and ent.get("continued"):
+                key = ent["continued"]
+                if prompt.startswith(key) and len(prompt) > len(key):
+                    send, ctx, continued = prompt[len(key):], ent["context"], len(key)
+            self.stats["turns"] += 1
+            self.stats["prompt_chars"] += len(prompt)
+            self.stats["prefix_chars"] += shared
+            if ctx is not None:
+                self.stats["context_hits"] += 1
+                self.stats["context_chars"] += continued
+        info = {
+            "prefix_ratio": round(shared / len(prompt), 4) if prompt else 0.0,
+            "context_reused": ctx is not None,
+            "sent_chars": len(send),
+            "prompt_chars": len(prompt),
+        }
+        return send, ctx, info
+
+    def store(self, chat_id: str, model: str, prompt: str, raw: str, response: str, context: list | None):
+        raw = (raw or "").strip()
+        # the handle covers the raw reply; it only continues the stored history
+        # when the filter kept the reply unchanged
+        continued = f"{prompt} {raw}" if raw and raw == (response or "").strip() else ""
+        with self._lock:
+            self._entries[chat_id] = {"model": model, "prompt": prompt, "context": context, "continued": continued}
+            self._entries.move_to_end(chat_id)
+            while len(self._entries) > self.max_chats:
+                self._entries.popitem(last=False)
+
+    def forget(self, chat_id: str):
+        with self._lock:
+            self._entries.pop(chat_id, None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            st = dict(self.stats)
+            st["chats"] = len(self._entries)
+        st["prefix_ratio"] = round(st["prefix_chars"] / st["prompt_chars"], 4) if st["prompt_chars"] else 0.0
+        st["context_ratio"] = round(st["context_chars"] / st["prompt_chars"], 4) if st["prompt_chars"] else 0.0
+        return st
@@ -0,0 +1,171 @@
+import re, threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+# Token counting: exact when a tokenizer is configured for the model (via the
+# optional `tokenizers` package and a tokenizer.json path), otherwise a fast
+# estimate of ~4 ASCII chars per token and one token per non-ASCII char.
+
+DEFAULT_BUDGET = 4096
+DEFAULT_RESERVE = 512
+
+_tokenizer_paths: dict[str, str] = {}
+_tokenizers: dict[str, object] = {}
+_tok_lock = threading.Lock()
+
+def configure_tokenizers(paths: dict | None):
+    global _tokenizer_paths
+    paths = {str(k).lower(): str(v) for k, v in (paths or {}).items() if v}
+    if paths != _tokenizer_paths:
+        with _tok_lock:
+            _tokenizer_paths = paths
+            _tokenizers.clear()
+        _count_cached.cache_clear()
+
+def _model_keys(model: str) -> list[str]:
+    m = (model or "").lower()
+    return [m, m.split(":", 1)[0], "default"]
+
+def _tokenizer_for(model: str):
+    for key in _model_keys(model):
+        path = _tokenizer_paths.get(key)
+        if not path:
+            continue
+        with _tok_lock:
+            if path not in _tokenizers:
+                try:
+                    from tokenizers import Tokenizer
+                    _tokenizers[path] = Tokenizer.from_file(path)
+                except Exception as e:
+                    print(f"[WARN] tokenizer {path} unavailable, estimating tokens: {e}")
+                    _tokenizers[path] = None
+            return _tokenizers[path]
+    return None
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    n = len(text)
+    non_ascii = n - len(text.encode("ascii", "ignore"))
+    return (n - non_ascii + 3) // 4 + non_ascii
+
+def has_exact_tokenizer(model: str) -> bool:
+    return _tokenizer_for(model) is not None
+
+@lru_cache(maxsize=8192)
+def _count_cached(model_key: str, text: str) -> int:
+    tok = _tokenizer_for(model_key)
+    if tok is None:
+        return estimate_tokens(text)
+    return len(tok.encode(text, add_special_tokens=False).ids)
+
+def count_tokens(text: str, model: str = "") -> int:
+    if not text:
+        return 0
+    return _count_cached((model or "").lower(), text)
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "", keep: str = "head") -> str:
+    if max_tokens <= 0 or not text:
+        return ""
+    total = count_tokens(text, model)
+    if total <= max_tokens:
+        return text
+    n = len(text)
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        part = text[:mid] if keep == "head" else text[n - mid:]
+        if count_tokens(part, model) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] if keep == "head" else text[n - lo:]
+
+def budget_for(model: str, budgets: dict | None, default: int = DEFAULT_BUDGET) -> int:
+    budgets = {str(k).lower(): v for k, v in (budgets or {}).items()}
+    for key in _model_keys(model):
+        try:
+            if key in budgets:
+                return int(budgets[key])
+        except (TypeError, ValueError):
+            pass
+    return default
+
+@dataclass
+class Section:
+    name: str
+    text: str
+    priority: int
+    required: bool = False
+    turns: list[str] | None = None
+    tail: str = ""
+
+@dataclass
+class PromptBuilder:
+    model: str
+    budget: int = DEFAULT_BUDGET
+    reserve: int = DEFAULT_RESERVE
+    sections: list[Section] = field(default_factory=list)
+
+    def add(self, name: str, text: str, priority: int, required: bool = False):
+        self.sections.append(Section(name, text or "", priority, required))
+        return self
+
+    def add_history(self, name: str, turns: list[str], tail: str, priority: int):
+        self.sections.append(Section(name, "", priority, turns=list(turns or []), tail=tail))
+        return self
+
+    def build(self) -> tuple[str, dict]:
+        limit = max(0, self.budget - self.reserve)
+        out: dict[str, str] = {}
+        report: dict[str, dict] = {}
+
+        # required text and the history tail (the new user message) always go in
+        remaining = limit
+        for sec in self.sections:
+            if sec.required:
+                remaining -= count_tokens(sec.text, self.model)
+            elif sec.turns is not None:
+                remaining -= count_tokens(sec.tail, self.model)
+
+        for sec in sorted(self.sections, key=lambda s: (not s.required, s.priority)):
+            if sec.required:
+                n = count_tokens(sec.text, self.model)
+                out[sec.name], report[sec.name] = sec.text, {"tokens": n, "priority": sec.priority}
+            elif sec.turns is not None:
+                out[sec.name], report[sec.name] = self._fill_history(sec, max(0, remaining))
+                remaining -= report[sec.name]["tokens"] - count_tokens(sec.tail, self.model)
+            else:
+                out[sec.name], report[sec.name] = self._fill(sec, max(0, remaining))
+                remaining -= report[sec.name]["tokens"]
+
+        prompt = "".join(out[s.name] for s in self.sections)
+        return prompt, {
+            "model": self.model,
+            "budget": self.budget,
+            "reserve": self.reserve,
+            "used": sum(r["tokens"] for r in report.values()),
+            "exact": has_exact_tokenizer(self.model),
+            "sections": report,
+        }
+
+    def _fill(self, sec: Section, remaining: int) -> tuple[str, dict]:
+        n = count_tokens(sec.text, self.model)
+        if n <= remaining:
+            return sec.text, {"tokens": n, "priority": sec.priority}
+        cut = truncate_to_tokens(sec.text, remaining, self.model, keep="head")
+        return cut, {"tokens": count_tokens(cut, self.model), "priority": sec.priority, "truncated_from": n}
+
+    def _fill_history(self, sec: Section, remaining: int) -> tuple[str, dict]:
+        left = remaining
+        kept = []
+        for t in reversed(sec.turns):
+            n = count_tokens(t, self.model) + 1
+            if n > left:
+                break
+            kept.append(t)
+            left -= n
+        kept.reverse()
+        text = "\n".join(kept + [sec.tail])
+        return text, {"tokens": remaining - left + count_tokens(sec.tail, self.model), "priority": sec.priority,
+                      "turns": len(kept), "dropped_turns": len(sec.turns) - len(kept)}
@@ -0,0 +1,190 @@
+import os, json, time, sqlite3, hashlib, threading
+from collections import OrderedDict
+from .config import DATA_DIR
+
+# Opt-in cache for deterministic generations. Only calls that pin
+# options.temperature to 0 are cacheable; anything sampled is always
+# regenerated. Keys hash (model, prompt, context handle, options), so a change
+# to any of them is a miss. Entries live in an in-memory LRU and in a SQLite
+# file under data/ that survives restarts; both tiers honour the TTL and have
+# their own size limits (oldest-used entries go first).
+
+RESPONSE_CACHE_DB = os.path.join(DATA_DIR, "response_cache.db")
+
+DEFAULTS = {
+    "enabled": False,
+    "max_entries": 512,      # memory tier
+    "max_disk_mb": 64,       # disk tier
+    "ttl": 7 * 24 * 3600,    # seconds; 0 = never expires
+}
+
+_IGNORED_KWARGS = ("keep_alive", "full_prompt")
+
+def cacheable(kwargs: dict) -> bool:
+    temp = (kwargs.get("options") or {}).get("temperature")
+    try:
+        return temp is not None and float(temp) <= 0
+    except (TypeError, ValueError):
+        return False
+
+def cache_key(model: str, prompt: str, kwargs: dict) -> str:
+    rest = {k: v for k, v in kwargs.items() if k not in _IGNORED_KWARGS and k != "context"}
+    ctx = kwargs.get("context")
+    ctx_hash = hashlib.sha256(json.dumps(ctx).encode()).hexdigest() if ctx else ""
+    raw = json.dumps([model, prompt, ctx_hash, rest], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 512, max_disk_mb: float = 64, ttl: float = DEFAULTS["ttl"],
+                 path: str | None = RESPONSE_CACHE_DB):
+        self.max_entries = max(0, int(max_entries))
+        self.max_disk_bytes = int(float(max_disk_mb) * 1024 * 1024)
+        self.ttl = float(ttl or 0)
+        self.path = path
+        self._mem: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_bytes = 0
+        self.hits = self.disk_hits = self.misses = self.stores = self.evictions = self.expired = 0
+
+    def _conn(self):
+        if self._db is None and self.path and self.max_disk_bytes > 0:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, model TEXT NOT NULL, created REAL NOT NULL,
+                used REAL NOT NULL, size INTEGER NOT NULL, data TEXT NOT NULL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses(used)")
+            self._disk_bytes = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._db = db
+        return self._db
+
+    def _fresh(self, created: float) -> bool:
+        return not self.ttl or time.time() - created < self.ttl
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                if self._fresh(hit[0]):
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return hit[1]
+                del self._mem[key]
+                self.expired += 1
+            db = self._conn()
+            if db is not None:
+                row = db.execute("SELECT created, size, data FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    created, size, data = row
+                    if self._fresh(created):
+                        db.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+                        value = json.loads(data)
+                        self._remember(key, created, value)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                    db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._disk_bytes -= size
+                    self.expired += 1
+            self.misses += 1
+            return None
+
+    def _remember(self, key: str, created: float, value: dict):
+        if self.max_entries <= 0:
+            return
+        self._mem[key] = (created, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, key: str, model: str, value: dict):
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, now, value)
+            self.stores += 1
+            db = self._conn()
+            if db is None or len(data) > self.max_disk_bytes:
+                return
+            old = db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            db.execute("INSERT OR REPLACE INTO responses (key, model, created, used, size, data) VALUES (?, ?, ?, ?, ?, ?)",
+                       (key, model, now, now, len(data), data))
+            self._disk_bytes += len(data) - (old[0] if old else 0)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._trim(db)
+
+    def _trim(self, db):
+        # drop expired rows first, then least recently used until under 90% of the limit
+        if self.ttl:
+            db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        target = int(self.max_disk_bytes * 0.9)
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY used").fetchall():
+            if total <= target:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+        self._disk_bytes = total
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            db = self._conn()
+            if db is not None:
+                db.execute("DELETE FROM responses")
+            self._disk_bytes = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "memory_entries": len(self._mem),
+                "disk_bytes": self._disk_bytes,
+                "max_entries": self.max_entries,
+                "max_disk_bytes": self.max_disk_bytes,
+                "ttl": self.ttl,
+            }
+
+_cache: ResponseCache | None = None
+_settings: dict | None = None
+_settings_lock = threading.Lock()
+
+def configure_response_cache(settings: dict | None) -> ResponseCache | None:
+    global _cache, _settings
+    merged = {**DEFAULTS, **(settings or {})}
+    if os.environ.get("CHANG_LI_RESPONSE_CACHE") in ("1", "true"):
+        merged["enabled"] = True
+    with _settings_lock:
+        if merged == _settings:
+            return _cache
+        old, _settings = _cache, merged
+        _cache = (ResponseCache(merged["max_entries"], merged["max_disk_mb"], merged["ttl"])
+                  if merged["enabled"] else None)
+    if old is not None:
+        old.close()
+    return _cache
+
+def active_cache() -> ResponseCache | None:
+    return _cache
+
+def stats() -> dict:
+    cache = _cache
+    return cache.stats() if cache is not None else {"enabled": False}
@@ -1,13 +1,23 @@
-import time, json, os, re
+import time, json, os, re, threading
 from uuid import uuid4
-from flask import jsonify, request
-from .core import app
+from flask import g, jsonify, request, Response, stream_with_context
+from .core import app, gate
 from . import storage
 from .persona import persona_prompt
-from .ollama_client import generate_text, list_models
-from .config import APP_CONFIG_FILE
+from .ollama_client import generate, generate_stream, lookup_cached, list_models, registry, supports_context, unload_model
+from .response_cache import configure_response_cache
+from . import response_cache, metrics, search
+from .output_filter import filter_output, StreamFilter
+from .config import APP_CONFIG_FILE, GEN_SLOTS, WARM_MODELS
 from .i18n import list_locales, list_locales_detail, load_locale
+from .memory_worker import MemoryWorker
+from .vector_memory import VectorMemory
+from .scheduler import Scheduler, INTERACTIVE, BACKGROUND
+from .prompt import PromptBuilder, budget_for, configure_tokenizers, count_tokens, truncate_to_tokens
+from .prefix_cache import PrefixCache
+from .filecache import file_cache, load_json
 from collections import OrderedDict
+from contextlib import nullcontext
 
 MAX_WINDOW_TURNS = 32
 SUMMERY_EVERY = 10
@@ -51,6 +61,17 @@ DEFAULT_CONFIG = {
     "lang": DEFAULT_LANG,
     "available_languages": LANG_ORDER,
     "language_names": LANG_NAMES,
+    "context_budget": {"default": 4096},
+    "reply_reserve": 512,
+    "summary_dialog_tokens": 1500,
+    "tokenizers": {},
+    "prompt_layout": "budget",
+    "keep_alive": "30m",
+    "generation_options": {},
+    # only temperature-0 calls are cached, so chat replies also need
+    # generation_options = {"temperature": 0}; memory summaries always qualify
+    "response_cache": {"enabled": False},
+    "vector_memory": {"enabled": False},
 }
 
 
@@ -61,30 +82,71 @@ def _lang_items():
     ordered = head + tail
     return [{"code": c, "name": LANG_NAMES.get(c, c)} for c in ordered]
 
+def _load_json_dict(path: str) -> dict:
+    try:
+        data = load_json(path)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
 def _read_app_config():
     cfg = DEFAULT_CONFIG.copy()
-    if os.path.exists(APP_CONFIG_FILE):
-        try:
-            with open(APP_CONFIG_FILE, "r", encoding="utf-8") as f:
-                saved = json.load(f)
-                if isinstance(saved, dict):
-                    cfg.update(saved)
-        except Exception:
-            pass
+    cfg.update(file_cache.get(APP_CONFIG_FILE, lambda: _load_json_dict(APP_CONFIG_FILE)))
 
     avail = set(list_locales())
     if cfg.get("lang") not in avail:
         cfg["lang"] = "en_us" if "en_us" in avail else (next(iter(avail)) if avail else "en_us")
     return cfg
 
+_config_lock = threading.Lock()
+
 def _write_app_config(patch: dict):
-    cur = _read_app_config()
-    cur.update(patch or {})
-    try:
-        with open(APP_CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(cur, f, indent=2, ensure_ascii=False)
-    except Exception:
-        pass
+    with _config_lock:
+        cur = _read_app_config()
+        cur.update(patch or {})
+        try:
+            storage.write_json_atomic(APP_CONFIG_FILE, cur)
+        except Exception:
+            pass
+        file_cache.invalidate(APP_CONFIG_FILE)
+
+STARTED_AT = time.time()
+
+@app.before_request
+def _metrics_begin():
+    if metrics.ENABLED:
+        g.metrics_t0 = time.perf_counter()
+        metrics.trace_begin()
+
+@app.after_request
+def _metrics_end(resp):
+    t0 = g.pop("metrics_t0", None)
+    if t0 is None:
+        return resp
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe("request_seconds", time.perf_counter() - t0,
+                    route=route, method=request.method, status=str(resp.status_code))
+    trace = metrics.trace_end()
+    if trace:
+        resp.headers["Server-Timing"] = metrics.server_timing(trace)
+    return resp
+
+@app.get("/healthz")
+def healthz():
+    # liveness only: no config read, no locale scan, no Ollama round-trip
+    resp = jsonify({"ok": True, "uptime": round(time.time() - STARTED_AT, 1), "queue": gate.snapshot()})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+def warm_up():
+    # deferred start-up work, run in the background once the server is up:
+    # open the chat store (migrations), the search index (backfill) and the
+    # model list, so the UI's first /chats and /models calls do not pay for it
+    for name, fn in (("storage", storage.count_chats), ("search", search.stats), ("models", list_models)):
+        try:
+            fn()
+        except Exception as e:
+            print(f"[WARN] warm-up of {name} failed: {e}")
 
 @app.route('/config', methods=['GET'])
 def get_config():
@@ -149,38 +211,72 @@ def _system_header(user_name: str, ai_name: str, lang: str):
         f"When answering questions from {user}, the answers must be reasonable and easy to understand, complex, and not long-winded.\n"
     )
 
-def _build_memory_block(chat: dict) -> str:
+def _build_memory_block(chat: dict, recall: str = "") -> str:
     summary = (chat.get("memory_summary") or "").strip()
     facts = chat.get("memory_facts") or []
-    if not summary and not facts:
+    if not summary and not facts and not recall:
         return ""
     block = "<<MEMORY>>\n"
     if summary:
         block += f"Summary: {summary}\n"
     if facts:
-        block += "Facts:\n" + "\n".join(f" - {str(x).strip()}" for x in facts if str(x).strip())
+        block += "Facts:\n" + "\n".join(f" - {str(x).strip()}" for x in facts if str(x).strip()) + "\n"
+    block += recall
     block += "<<END>>\n"
     return block
 
-def _recent_window_text(chat: dict, user_input: str) -> str:
-    hist = chat.get("history", [])
-    window = hist[-MAX_WINDOW_TURNS:] if MAX_WINDOW_TURNS > 0 else hist
+vector_memory = VectorMemory()
+
+def _recall_block(chat: dict, query: str, before: int, model: str) -> str:
+    # older turns similar to the new message, oldest first, within the token budget
+    if not vector_memory.enabled:
+        return ""
+    hits = vector_memory.recall(chat["id"], query, before, int(chat.get("recall_floor") or 0))
+    budget = int(vector_memory.settings.get("budget_tokens", 400) or 0)
+    picked, used = [], 0
+    for idx, _, turn in hits:
+        text = _turn_text(turn)
+        cost = count_tokens(text, model)
+        if not text or used + cost > budget:
+            continue
+        picked.append((idx, text))
+        used += cost
+    if not picked:
+        return ""
+    return "Earlier in this chat:\n" + "\n".join(t for _, t in sorted(picked)) + "\n"
+
+def _turn_text(m: dict) -> str:
     buf = []
-    for m in window:
-        u = m.get("user", "")
-        a = m.get("changli", "")
-        if u: buf.append(f"User: {u}")
-        if a: buf.append(f"AI: {a}")
-    buf.append(f"User: {user_input}")
-    buf.append("AI:")
+    u = m.get("user", "")
+    a = m.get("changli", "")
+    if u: buf.append(f"User: {u}")
+    if a: buf.append(f"AI: {a}")
     return "\n".join(buf)
 
+def _recent_turns(chat: dict) -> list[str]:
+    hist = chat.get("history", [])
+    window = hist[-MAX_WINDOW_TURNS:] if MAX_WINDOW_TURNS > 0 else hist
+    return [t for t in (_turn_text(m) for m in window) if t]
+
+def _prompt_builder(cfg: dict, model: str) -> PromptBuilder:
+    configure_tokenizers(cfg.get("tokenizers"))
+    return PromptBuilder(
+        model,
+        budget=budget_for(model, cfg.get("context_budget")),
+        reserve=int(cfg.get("reply_reserve", 512) or 0),
+    )
+
 def _needs_memory_update(chat: dict) -> bool:
-    turns = len(chat.get("history", []))
+    turns = chat.get("turn_count", len(chat.get("history", [])))
     if turns <= MAX_WINDOW_TURNS:
         return False
     return (turns % SUMMERY_EVERY) == 0
 
+def _summary_enabled() -> bool:
+    # "summarize": false lets retrieval memory replace the rolling summary; it
+    # means nothing while retrieval memory is off
+    return not vector_memory.enabled or vector_memory.settings.get("summarize", True)
+
 _SUMMARY_PROMPT_TMPL = """<<TASK>>
 Kamu akan memperbarui MEMORI singkat untuk percakapan berbahasa Indonesia.
 Tujuan: simpan hal-hal penting agar chat tetap nyambung (preferensi user, rencana/komitmen, detail personal yang user bagikan, konteks jangka panjang).
@@ -205,22 +301,17 @@ DIALOG_BARU (ringkas, 1-2 item terakhir bila ada):
 """
 
 def _load_profile():
-    if os.path.exists(PROFILE_PATH):
-        try:
-            with open(PROFILE_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    return {**DEFAULT_PROFILE, **data}
-        except Exception:
-            pass
-    return DEFAULT_PROFILE.copy()
+    data = file_cache.get(PROFILE_PATH, lambda: _load_json_dict(PROFILE_PATH))
+    return {**DEFAULT_PROFILE, **data}
+
+_profile_lock = threading.Lock()
 
 def _save_profile(p):
     try:
-        with open(PROFILE_PATH, "w", encoding="utf-8") as f:
-            json.dump({**DEFAULT_PROFILE, **(p or {})}, f, indent=2, ensure_ascii=False)
+        storage.write_json_atomic(PROFILE_PATH, {**DEFAULT_PROFILE, **(p or {})})
     except Exception:
         pass
+    file_cache.invalidate(PROFILE_PATH)
 
 @app.get("/profile")
 def get_profile():
@@ -229,12 +320,13 @@ def get_profile():
 @app.post("/profile")
 def set_profile():
     data = request.get_json(silent=True) or {}
-    prof = _load_profile()
-    if "about" in data: prof["about"] = str(data.get("about") or "")
-    if "job"   in data: prof["job"]   = str(data.get("job")   or "")
-    if isinstance(data.get("facts"), list):
-        prof["facts"] = [str(x).strip() for x in data["facts"] if str(x).strip()]
-    _save_profile(prof)
+    with _profile_lock:
+        prof = _load_profile()
+        if "about" in data: prof["about"] = str(data.get("about") or "")
+        if "job"   in data: prof["job"]   = str(data.get("job")   or "")
+        if isinstance(data.get("facts"), list):
+            prof["facts"] = [str(x).strip() for x in data["facts"] if str(x).strip()]
+        _save_profile(prof)
     return jsonify({"ok": True, "profile": prof})
 
 def _profile_block():
@@ -289,15 +381,13 @@ def _parse_memory_output(text: str) -> tuple[str, list]:
              uniq.append(f)
     return summary.strip(), uniq[:MAX_FACTS]
 
-def _maybe_update_memory(chat: dict, model: str):
-    if not _needs_memory_update(chat):
-        return
+def _summarize_memory(chat: dict, model: str) -> tuple[str, list] | None:
     hist = chat.get("history", [])
     if not hist:
-        return
+        return None
     old_part = hist[:-MAX_WINDOW_TURNS] if MAX_WINDOW_TURNS > 0 else hist[:-0]
     if not old_part:
-        return
+        return None
 
     old_dialog = []
     for m in old_part:
@@ -314,15 +404,29 @@ def _maybe_update_memory(chat: dict, model: str):
         if m.get("changli"):
             new_tail.append(f"AI: {m['changli']}")
 
+    cfg = _read_app_config()
+    dialog_budget = int(cfg.get("summary_dialog_tokens", 1500) or 0)
     prompt = _SUMMARY_PROMPT_TMPL.format(
         old_summary=chat.get("memory_summary",""),
         old_facts="\n".join(f"- {x}" for x in (chat.get("memory_facts") or [])) or "- (tidak ada)",
-        old_dialog="\n".join(old_dialog)[:6000],
+        old_dialog=truncate_to_tokens("\n".join(old_dialog), dialog_budget, model, keep="tail"),
         new_tail="\n".join(new_tail)
     )
 
-    out = generate_text(prompt, model=model)
-    new_sum, new_facts = _parse_memory_output(out or "")
+    # deterministic, so unchanged history re-summarizes from the response cache
+    configure_response_cache(cfg.get("response_cache"))
+    kw = {"options": {"temperature": 0}}
+    if cfg.get("keep_alive"):
+        kw["keep_alive"] = cfg["keep_alive"]
+    gen = lookup_cached(prompt, model, **kw)
+    if gen is None:
+        with scheduler.slot(model, BACKGROUND) as slot:
+            gen = generate(prompt, model=model, cache_checked=True, **kw)
+            slot["load_time"] = gen.load_time if gen else 0.0
+    out = filter_output(gen.text) if gen else None
+    return _parse_memory_output(out or "")
+
+def _merge_memory(chat: dict, new_sum: str, new_facts: list) -> bool:
     if new_sum:
         chat["memory_summary"] = new_sum
     if new_facts:
@@ -333,51 +437,309 @@ def _maybe_update_memory(chat: dict, model: str):
             if f and f not in merged:
                 merged.append(f)
         chat["memory_facts"] = merged[:MAX_FACTS]
+    return bool(new_sum or new_facts)
+
+def _run_memory_update(chat_id: str, model: str) -> bool:
+    with metrics.span("memory.update"):
+        return _update_memory(chat_id, model)
+
+def _update_memory(chat_id: str, model: str) -> bool:
+    chat = storage.get_chat(chat_id)
+    if not chat:
+        return False
+    result = _summarize_memory(chat, model)
+    if not result:
+        return False
+    with storage.chat_lock(chat_id):
+        cur = storage.get_chat(chat_id, with_history=False)
+        if not cur or not _merge_memory(cur, *result):
+            return False
+        storage.update_chat(chat_id, touch=False, memory_summary=cur.get("memory_summary", ""),
+                            memory_facts=cur.get("memory_facts") or [])
+    return True
+
+memory_worker = MemoryWorker(_run_memory_update)
+vector_worker = MemoryWorker(vector_memory.index_pending, debounce=0.5, name="vector-worker")
 
 @app.get("/models")
 def get_models():
+    refresh = request.args.get("refresh") in ("1", "true")
+    default = _read_app_config().get("default_model", "gemma3:4b")
     try:
-        return jsonify({
-            "models": list_models(),
-            "default": _read_app_config().get("default_model", "gemma3:4b")
-        })
+        return jsonify({"models": list_models(refresh=refresh), "default": default})
     except Exception:
-        return jsonify({
-            "models": [_read_app_config().get("default_model", "gemma3:4b")],
-            "default": _read_app_config().get("default_model", "gemma3:4b")
-        })
+        return jsonify({"models": [default], "default": default})
+
+def _int_arg(name: str):
+    v = request.args.get(name)
+    try:
+        return int(v) if v not in (None, "") else None
+    except ValueError:
+        return None
 
 @app.get("/chats")
 def get_chats():
-    chats = storage.load_chats()
-    summary = [
-        {"id": c["id"], "user_name": c.get("user_name","sayang"),
-         "last_updated": c.get("last_updated","")}
-        for c in chats
-    ]
-    return jsonify(summary)
+    # served from the session index; message bodies are never read
+    limit, offset = _int_arg("limit"), _int_arg("offset")
+    with metrics.span("storage.sessions"):
+        sessions = storage.list_sessions(limit, offset or 0)
+    for s in sessions:
+        s["user_name"] = s["user_name"] or "sayang"
+    return jsonify(sessions)
+
+@app.patch("/chat/<chat_id>")
+def rename_chat(chat_id):
+    data = request.get_json(silent=True) or {}
+    title = data.get("title")
+    if not isinstance(title, str):
+        return jsonify({"error": "title is required"}), 400
+    if not storage.rename_chat(chat_id, title[:200]):
+        return jsonify({"error": "Chat not found"}), 404
+    return jsonify({"ok": True, "chat_id": chat_id, "title": title.strip()[:200]})
+
+@app.delete("/chat/<chat_id>")
+def delete_chat(chat_id):
+    with storage.chat_lock(chat_id):
+        ok = storage.delete_chat(chat_id)
+    if not ok:
+        return jsonify({"error": "Chat not found"}), 404
+    prefix_cache.forget(chat_id)
+    vector_memory.remove(chat_id)
+    return jsonify({"ok": True, "chat_id": chat_id})
+
+@app.get("/search")
+def search_chats():
+    q = (request.args.get("q") or "").strip()
+    limit, offset = _int_arg("limit"), _int_arg("offset")
+    with metrics.span("search"):
+        out = search.search(q, limit=limit or 20, offset=offset or 0, chat_id=request.args.get("chat") or None)
+    if out.get("error"):
+        return jsonify(out), 400
+    chats = {}
+    for r in out["results"]:
+        cid = r["chat_id"]
+        if cid not in chats:
+            chats[cid] = storage.get_chat(cid, with_history=False) or {}
+        c = chats[cid]
+        r["user_name"] = c.get("user_name", "")
+        r["last_updated"] = c.get("last_updated", "")
+    return jsonify(out)
+
+# prompt-layout pins kept in the chat meta for the server's own use
+INTERNAL_FIELDS = ("prompt_anchor", "prompt_memory", "recall_floor")
+
+def _public_chat(chat: dict) -> dict:
+    return {k: v for k, v in chat.items() if k not in INTERNAL_FIELDS}
 
 @app.get("/chat/<chat_id>")
 def get_chat(chat_id):
-    chats = storage.load_chats()
-    chat = next((c for c in chats if c["id"] == chat_id), None)
+    before, limit, since = _int_arg("before"), _int_arg("limit"), _int_arg("since_turn")
+    if before is None and limit is None and since is None:
+        chat = storage.get_chat(chat_id)
+        if not chat:
+            return jsonify({"error": "Chat not found"}), 404
+        return jsonify(_public_chat(chat))
+
+    chat = storage.get_chat(chat_id, with_history=False)
     if not chat:
         return jsonify({"error": "Chat not found"}), 404
-    return jsonify(chat)
+    count = chat.get("turn_count", 0)
+    if since is not None:
+        start, end = max(0, min(since, count)), count
+        if limit is not None:
+            end = min(count, start + max(0, limit))
+    else:
+        end = count if before is None else max(0, min(before, count))
+        start = max(0, end - (limit if limit is not None else 50))
+    chat["history"] = storage.get_turns(chat_id, start, end)
+    chat["start"] = start
+    chat["end"] = end
+    chat["next_before"] = start if start > 0 else None
+    chat["has_more"] = start > 0
+    return jsonify(_public_chat(chat))
+
+def _echo_history(data: dict) -> bool:
+    if request.args.get("history") in ("0", "false"):
+        return False
+    return data.get("echo_history", True) is not False
+
+def _wants_stream(data: dict) -> bool:
+    if request.args.get("stream") in ("1", "true"):
+        return True
+    if data.get("stream") is True:
+        return True
+    return "text/event-stream" in (request.headers.get("Accept") or "")
+
+def _sse(event: str, obj: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(obj, ensure_ascii=False)}\n\n"
+
+prefix_cache = PrefixCache()
+scheduler = Scheduler(GEN_SLOTS, WARM_MODELS, unload_fn=unload_model)
+
+# request_id -> TokenStream for generations that can still be stopped
+_active_streams: dict = {}
+_active_lock = threading.Lock()
+
+def _request_id(data: dict) -> str | None:
+    rid = data.get("request_id") or request.headers.get("X-Request-ID")
+    return str(rid)[:64] if rid else None
+
+def _stream_reply(prompt: str, model: str, on_done, request_id: str | None = None, **gen_kwargs):
+    ts = generate_stream(prompt, model=model, model_checked=True, **gen_kwargs)
+
+    def events(evts):
+        for kind, text in evts:
+            yield _sse("token", {"t": text}) if kind == "append" else _sse("reset", {"text": text})
+
+    def gen():
+        sf = StreamFilter()
+        out = None
+        if request_id:
+            with _active_lock:
+                _active_streams[request_id] = ts
+        try:
+            try:
+                with (nullcontext({}) if ts.cached else scheduler.slot(model, INTERACTIVE)) as slot:
+                    try:
+                        for tok in ts:
+                            yield from events(sf.feed(tok))
+                    finally:
+                        ts.close()
+                        slot["load_time"] = ts.generation.load_time if ts.generation else 0.0
+            finally:
+                if request_id:
+                    with _active_lock:
+                        if _active_streams.get(request_id) is ts:
+                            del _active_streams[request_id]
+            if ts.text:
+                yield from events(sf.finish()[1])
+            out = on_done(ts.text, ts.generation, ts.aborted)
+            if ts.aborted:
+                out["aborted"] = True
+            yield _sse("done", out)
+        except GeneratorExit:
+            # the client went away mid-stream: keep the partial reply, as Stop does
+            if out is None and ts.text:
+                on_done(ts.text, ts.generation, True)
+            raise
+
+    return Response(stream_with_context(gen()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _unknown_model(model: str) -> bool:
+    # checked before a scheduler slot is taken, so a typo never enters the
+    # warm list and pushes a loaded model out; if Ollama is down, generation
+    # reports that itself
+    try:
+        return not registry.has(model)
+    except Exception:
+        return False
+
+def _reply(chat_id: str, prompt: str, model: str, cfg: dict, usage: dict,
+           fallback: str, finish, stream: bool, request_id: str | None = None):
+    if _unknown_model(model):
+        return jsonify({"error": f"Model '{model}' not found", "model": model}), 400
+    configure_response_cache(cfg.get("response_cache"))
+    gen_kwargs = {}
+    if cfg.get("keep_alive"):
+        gen_kwargs["keep_alive"] = cfg["keep_alive"]
+    if cfg.get("generation_options"):
+        gen_kwargs["options"] = dict(cfg["generation_options"])
+    send, ctx, reuse = prefix_cache.lookup(chat_id, model, prompt, use_context=supports_context())
+    usage["prefix_reuse"] = reuse
+    if ctx:
+        gen_kwargs.update(context=ctx, full_prompt=prompt, raw=True)
+
+    def done(raw: str, gen, aborted: bool = False) -> dict:
+        # a stopped reply keeps whatever was generated, never the fallback
+        with metrics.span("filter"):
+            response = (filter_output(raw) if raw else None) or ("" if aborted else fallback)
+        if gen is not None:
+            prefix_cache.store(chat_id, model, prompt, raw, response, gen.context)
+        else:
+            prefix_cache.forget(chat_id)
+        return finish(response)
+
+    if stream:
+        return _stream_reply(send, model, done, request_id, **gen_kwargs)
+    gen = lookup_cached(send, model, **gen_kwargs)
+    if gen is None:
+        with scheduler.slot(model, INTERACTIVE) as slot:
+            gen = generate(send, model=model, cache_checked=True, model_checked=True, **gen_kwargs)
+            slot["load_time"] = gen.load_time if gen else 0.0
+    out = done(gen.text if gen else "", gen)
+    return jsonify(out), (404 if out.get("error") else 200)
+
+def _build_stable_prompt(cfg: dict, chat: dict, model: str, header: str,
+                         custom_prompt: str, user_input: str) -> tuple[str, dict, dict]:
+    # history is anchored at a turn index and only grows; the memory block is
+    # pinned at the anchor so the prefix stays byte-identical between turns.
+    # When the budget overflows, the anchor jumps forward so history fills
+    # about half the budget, giving room for many more turns before the next jump.
+    hist = chat.get("history", [])
+    base = int(chat.get("history_start") or 0)      # turn index of hist[0]
+    count = base + len(hist)
+    anchor = max(base, min(int(chat.get("prompt_anchor") or 0), count))
+    pinned = chat.get("prompt_memory")
+    if pinned is None:
+        pinned = _build_memory_block(chat)
+    profile = _profile_block()
+
+    def build(anchor: int, memory: str):
+        # recalled turns change every message, so they sit after the history
+        recall = _recall_block(chat, user_input, anchor, model)
+        tail = (_build_memory_block({}, recall) if recall else "") + f"User: {user_input}\nAI:"
+        turns = [t for t in (_turn_text(m) for m in hist[anchor - base:]) if t]
+        return (
+            _prompt_builder(cfg, model)
+            .add("header", header, 0, required=True)
+            .add("custom_prompt", f"{custom_prompt}\n", 1)
+            .add("profile", profile, 2)
+            .add("memory", memory, 3)
+            .add_history("history", turns, tail, 4)
+            .build()
+        )
+
+    prompt, usage = build(anchor, pinned)
+    if usage["sections"]["history"]["dropped_turns"] or any(
+            "truncated_from" in v for v in usage["sections"].values()):
+        pinned = _build_memory_block(chat)
+        kept = usage["sections"]["history"]["turns"]
+        anchor = count - max(0, kept // 2)
+        prompt, usage = build(anchor, pinned)
+        usage["reanchored"] = True
+    usage["anchor"] = anchor
+    return prompt, usage, {"prompt_anchor": anchor, "prompt_memory": pinned}
 
 @app.post("/chat/<chat_id>")
 def chat_by_id(chat_id):
-    chats = storage.load_chats()
-    chat = next((c for c in chats if c["id"] == chat_id), None)
+    with metrics.span("storage.load"):
+        chat = storage.get_chat(chat_id, with_history=False)
     if not chat:
         return jsonify({"error": "Chat not found"}), 404
+    count = chat.get("turn_count", 0)
 
     data = request.get_json(silent=True) or {}
     user_input = (data.get("message") or "").strip()
     if not user_input:
-        return jsonify({"history": chat.get("history", []), "chat_id": chat_id, "model": chat.get("model")})
+        out = {"chat_id": chat_id, "model": chat.get("model"), "turn_count": count}
+        if _echo_history(data):
+            out["history"] = storage.get_turns(chat_id)
+        return jsonify(out)
 
     cfg = _read_app_config()
+    vector_memory.configure(cfg.get("vector_memory"))
+    if vector_memory.enabled:
+        vector_memory.prefetch(chat_id, user_input)
+    stable = cfg.get("prompt_layout") == "stable"
+    # only the turns the prompt can use are read: from the pinned anchor, or the recent window
+    if stable:
+        start = min(int(chat.get("prompt_anchor") or 0), count)
+    else:
+        start = max(0, count - MAX_WINDOW_TURNS) if MAX_WINDOW_TURNS > 0 else 0
+    with metrics.span("storage.load"):
+        chat["history"] = storage.get_turns(chat_id, start)
+    chat["history_start"] = start
     user_name = data.get("user_name", chat.get("user_name", "sayang"))
     ai_name   = data.get("ai_name",   chat.get("ai_name",   "Changli"))
     model     = (data.get("model") or chat.get("model") or cfg.get("default_model", "gemma3:4b")).strip()
@@ -386,26 +748,46 @@ def chat_by_id(chat_id):
     raw_cp = data.get("custom_prompt")
     custom_prompt = (raw_cp.strip() if raw_cp else chat.get("custom_prompt", ""))
 
-    header        = _system_header(user_name, ai_name, lang)
-    profile_block = _profile_block()
-    mem_block     = _build_memory_block(chat)
-    history_text  = _recent_window_text(chat, user_input)
-    prompt = f"{header}{custom_prompt}\n{profile_block}{mem_block}{history_text}"
-
-    response = generate_text(prompt, model=model) or f"Sorry {user_name}, aku lagi bingung nih... 😢"
-
-    chat["user_name"]     = user_name
-    chat["ai_name"]       = ai_name
-    chat["model"]         = model
-    chat["custom_prompt"] = custom_prompt
-    chat.setdefault("history", []).append({"user": user_input, "changli": response})
-
-    _maybe_update_memory(chat, model=model)
-
-    storage.touch_chat(chat)
-    storage.save_chats(chats)
-
-    return jsonify({"response": response, "history": chat["history"], "chat_id": chat_id, "model": model}), 200
+    pin = {}
+    with metrics.span("prompt.build"):
+        header = _system_header(user_name, ai_name, lang)
+        if stable:
+            prompt, usage, pin = _build_stable_prompt(cfg, chat, model, header, custom_prompt, user_input)
+        else:
+            prompt, usage = (
+                _prompt_builder(cfg, model)
+                .add("header", header, 0, required=True)
+                .add("custom_prompt", f"{custom_prompt}\n", 1)
+                .add("profile", _profile_block(), 2)
+                .add("memory", _build_memory_block(chat, _recall_block(
+                    chat, user_input, count - MAX_WINDOW_TURNS, model)), 3)
+                .add_history("history", _recent_turns(chat), f"User: {user_input}\nAI:", 4)
+                .build()
+            )
+    fallback = f"Sorry {user_name}, aku lagi bingung nih... 😢"
+    echo = _echo_history(data)
+
+    def finish(response: str) -> dict:
+        turn = {"user": user_input, "changli": response}
+        try:
+            with metrics.span("storage.save"), storage.chat_lock(chat_id):
+                count = storage.append_turn(chat_id, turn, user_name=user_name, ai_name=ai_name,
+                                            model=model, custom_prompt=custom_prompt, **pin)
+        except KeyError:
+            # the chat was deleted while the reply was generating
+            prefix_cache.forget(chat_id)
+            return {"error": "Chat not found", "chat_id": chat_id, "response": response}
+        if _needs_memory_update({"turn_count": count}) and _summary_enabled():
+            memory_worker.schedule(chat_id, model)
+        if vector_memory.enabled:
+            vector_worker.schedule(chat_id, model)
+        out = {"response": response, "chat_id": chat_id, "model": model,
+               "turn_count": count, "prompt_usage": usage}
+        if echo:
+            out["history"] = storage.get_turns(chat_id)
+        return out
+
+    return _reply(chat_id, prompt, model, cfg, usage, fallback, finish, _wants_stream(data), _request_id(data))
 
 def _prompt_header(user_name, ai_name):
     ai = ai_name or "AI"
@@ -428,33 +810,103 @@ def new_chat():
 
     if not user_input:
         return jsonify({"error": f"Halo {user_name}, ketik sesuatu dulu ya 😘"}), 400
-
-    header = _system_header(user_name, ai_name, lang)
-    prompt = f"{header}{custom_prompt}\nUser: {user_input}\nAI:"
-
-    response = generate_text(prompt, model=model) or f"Sorry {user_name}, aku lagi bingung nih... 😢"
-
-    chat = {
-        "id": str(uuid4()),
-        "user_name": user_name,
-        "ai_name": ai_name,
-        "model": model,
-        "custom_prompt": custom_prompt,
-        "history": [{"user": user_input, "changli": response}],
-        "memory_summary": "",
-        "memory_facts": [],
-        "last_updated": time.strftime("%Y-%m-%dT%H:%M:%S")
-    }
-    chats = storage.load_chats(); chats.append(chat); storage.save_chats(chats)
-    return jsonify({"response": response, "history": chat["history"], "chat_id": chat["id"], "model": model})
+    vector_memory.configure(cfg.get("vector_memory"))
+
+    with metrics.span("prompt.build"):
+        prompt, usage = (
+            _prompt_builder(cfg, model)
+            .add("header", _system_header(user_name, ai_name, lang), 0, required=True)
+            .add("custom_prompt", f"{custom_prompt}\n", 1)
+            .add_history("history", [], f"User: {user_input}\nAI:", 4)
+            .build()
+        )
+    fallback = f"Sorry {user_name}, aku lagi bingung nih... 😢"
+
+    chat_id = str(uuid4())
+    echo = _echo_history(data)
+
+    def finish(response: str) -> dict:
+        chat = {
+            "id": chat_id,
+            "user_name": user_name,
+            "ai_name": ai_name,
+            "model": model,
+            "custom_prompt": custom_prompt,
+            "history": [{"user": user_input, "changli": response}],
+            "memory_summary": "",
+            "memory_facts": [],
+            "last_updated": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }
+        with metrics.span("storage.save"):
+            storage.create_chat(chat)
+        if vector_memory.enabled:
+            vector_worker.schedule(chat_id, model)
+        out = {"response": response, "chat_id": chat["id"], "model": model,
+               "turn_count": 1, "prompt_usage": usage}
+        if echo:
+            out["history"] = chat["history"]
+        return out
+
+    return _reply(chat_id, prompt, model, cfg, usage, fallback, finish, _wants_stream(data), _request_id(data))
+
+@app.post("/abort/<request_id>")
+def abort_generation(request_id):
+    with _active_lock:
+        ts = _active_streams.get(request_id)
+    if ts is None:
+        return jsonify({"ok": False, "request_id": request_id, "error": "no active generation"}), 404
+    ts.abort()
+    return jsonify({"ok": True, "request_id": request_id})
 
 @app.post("/chat/<chat_id>/memory/clear")
 def clear_chat_memory(chat_id):
-    chats = storage.load_chats()
-    chat = next((c for c in chats if c["id"] == chat_id), None)
-    if not chat:
+    with storage.chat_lock(chat_id):
+        chat = storage.get_chat(chat_id, with_history=False)
+        # recall skips everything said before the clear; the vectors stay in place
+        ok = chat is not None and storage.update_chat(chat_id, touch=False, memory_summary="", memory_facts=[],
+                                                      prompt_memory=None, recall_floor=chat.get("turn_count", 0))
+    if not ok:
         return jsonify({"error": "Chat not found"}), 404
-    chat["memory_summary"] = ""
-    chat["memory_facts"] = []
-    storage.save_chats(chats)
     return jsonify({"ok": True, "chat_id": chat_id})
+
+@app.get("/chat/<chat_id>/memory/status")
+def chat_memory_status(chat_id):
+    chat = storage.get_chat(chat_id, with_history=False)
+    if not chat:
+        return jsonify({"error": "Chat not found"}), 404
+    job = memory_worker.status(chat_id) or {"chat_id": chat_id, "state": "idle"}
+    return jsonify({
+        "chat_id": chat_id,
+        "job": job,
+        "queue": memory_worker.pending(),
+        "memory_summary": chat.get("memory_summary", ""),
+        "memory_facts": chat.get("memory_facts") or [],
+        "vector": {**vector_memory.status(chat_id), "job": vector_worker.status(chat_id),
+                   "recall_floor": chat.get("recall_floor", 0)},
+    })
+
+@app.get("/cache/stats")
+def cache_stats():
+    configure_response_cache(_read_app_config().get("response_cache"))
+    return jsonify(response_cache.stats())
+
+@app.post("/cache/clear")
+def cache_clear():
+    cache = configure_response_cache(_read_app_config().get("response_cache"))
+    if cache is not None:
+        cache.clear()
+    return jsonify({"ok": True, **response_cache.stats()})
+
+@app.get("/metrics")
+def get_metrics():
+    if not metrics.ENABLED:
+        return jsonify({"error": "metrics disabled, set CHANG_LI_METRICS=1"}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.get("/scheduler/stats")
+def scheduler_stats():
+    return jsonify(scheduler.snapshot())
+
+@app.get("/prompt/stats")
+def prompt_stats():
+    return jsonify(prefix_cache.snapshot())
@@ -0,0 +1,177 @@
+import itertools, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+from . import metrics
+
+# Decides which generation talks to Ollama next. Every call takes a slot
+# through `scheduler.slot(model, priority)`:
+#  - at most `slots` generations run at once;
+#  - interactive turns always go before background (memory) work;
+#  - among waiting requests, ones for a model that is already running or warm
+#    go first, so requests to a loaded model are batched instead of forcing a
+#    swap, but a request that has been passed over `max_skip` times blocks
+#    everything behind it so nobody starves;
+#  - a cold model only starts once nothing else is running;
+#  - the `warm` most recently used models are kept loaded (requests carry
+#    keep_alive); the model that falls off the MRU list is unloaded.
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+class Ticket:
+    __slots__ = ("seq", "model", "priority", "enqueued", "granted", "skipped")
+
+    def __init__(self, seq: int, model: str, priority: int):
+        self.seq = seq
+        self.model = model
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.skipped = 0
+
+class Scheduler:
+    def __init__(self, slots: int = 2, warm: int = 2, max_skip: int = 4, unload_fn=None):
+        self.slots = max(1, int(slots))
+        self.warm = max(1, int(warm))
+        self.max_skip = max(0, int(max_skip))
+        self.unload_fn = unload_fn
+        self._cv = threading.Condition()
+        self._seq = itertools.count()
+        self._queues: dict[str, list[Ticket]] = {}      # model -> waiting tickets, in arrival order
+        self._running: dict[str, int] = {}              # model -> generations in flight
+        self._mru: OrderedDict[str, float] = OrderedDict()
+        self._stats: dict[str, dict] = {}
+        self._evicted: list[str] = []
+
+    def _model_stats(self, model: str) -> dict:
+        st = self._stats.get(model)
+        if st is None:
+            st = self._stats[model] = {"requests": 0, "background": 0, "loads": 0, "load_s": 0.0,
+                                       "unloads": 0, "wait_s": 0.0, "max_wait_s": 0.0, "batched": 0}
+        return st
+
+    def _startable(self, t: Ticket) -> bool:
+        running = sum(self._running.values())
+        if running >= self.slots:
+            return False
+        return running == 0 or t.model in self._running or t.model in self._mru
+
+    def _dispatch(self):
+        while sum(self._running.values()) < self.slots:
+            waiting = [t for q in self._queues.values() for t in q]
+            if not waiting:
+                return
+            top = min(t.priority for t in waiting)
+            waiting = sorted((t for t in waiting if t.priority == top), key=lambda t: t.seq)
+            head = waiting[0]
+            if head.skipped >= self.max_skip:
+                pick = head if self._startable(head) else None
+            else:
+                hot = [t for t in waiting if t.model in self._running and self._startable(t)]
+                warm = [t for t in waiting if t.model in self._mru and self._startable(t)]
+                cold = [t for t in waiting if self._startable(t)]
+                pick = (hot or warm or cold or [None])[0]
+            if pick is None:
+                return
+            for t in waiting:
+                if t.seq < pick.seq:
+                    t.skipped += 1
+            self._queues[pick.model].remove(pick)
+            if not self._queues[pick.model]:
+                del self._queues[pick.model]
+            if pick.model in self._running:
+                self._model_stats(pick.model)["batched"] += 1
+            self._running[pick.model] = self._running.get(pick.model, 0) + 1
+            self._touch(pick.model)
+            pick.granted = True
+            self._cv.notify_all()
+
+    def _touch(self, model: str):
+        self._mru[model] = time.time()
+        self._mru.move_to_end(model)
+        for old in list(self._mru):
+            if len(self._mru) <= self.warm:
+                break
+            if old in self._running:
+                continue
+            del self._mru[old]
+            self._evicted.append(old)
+            self._model_stats(old)["unloads"] += 1
+
+    def _flush_unloads(self):
+        with self._cv:
+            evicted, self._evicted = self._evicted, []
+        if self.unload_fn is None:
+            return
+        for model in evicted:
+            threading.Thread(target=self.unload_fn, args=(model,), name=f"unload-{model}", daemon=True).start()
+
+    def acquire(self, model: str, priority: int = INTERACTIVE) -> Ticket:
+        with self._cv:
+            t = Ticket(next(self._seq), model, priority)
+            self._queues.setdefault(model, []).append(t)
+            self._dispatch()
+            while not t.granted:
+                self._cv.wait()
+            wait = time.monotonic() - t.enqueued
+            st = self._model_stats(model)
+            st["requests"] += 1
+            st["background"] += priority == BACKGROUND
+            st["wait_s"] += wait
+            st["max_wait_s"] = max(st["max_wait_s"], wait)
+        metrics.observe("queue_wait_seconds", wait, stage="scheduler",
+                        priority="background" if priority == BACKGROUND else "interactive")
+        self._flush_unloads()
+        return t
+
+    def release(self, t: Ticket, load_time: float = 0.0):
+        with self._cv:
+            n = self._running.get(t.model, 0) - 1
+            if n > 0:
+                self._running[t.model] = n
+            else:
+                self._running.pop(t.model, None)
+            if load_time > 0.05:
+                st = self._model_stats(t.model)
+                st["loads"] += 1
+                st["load_s"] += load_time
+            self._dispatch()
+        self._flush_unloads()
+
+    @contextmanager
+    def slot(self, model: str, priority: int = INTERACTIVE):
+        t = self.acquire(model, priority)
+        holder = {"load_time": 0.0}
+        try:
+            yield holder
+        finally:
+            self.release(t, holder["load_time"])
+
+    def warm_models(self) -> list[str]:
+        with self._cv:
+            return list(reversed(self._mru))
+
+    def snapshot(self) -> dict:
+        with self._cv:
+            models = {}
+            for m, st in self._stats.items():
+                out = dict(st)
+                n = out["requests"] or 1
+                out["avg_wait_s"] = round(out["wait_s"] / n, 3)
+                out["wait_s"] = round(out["wait_s"], 3)
+                out["max_wait_s"] = round(out["max_wait_s"], 3)
+                out["load_s"] = round(out["load_s"], 3)
+                out["queued"] = len(self._queues.get(m, []))
+                out["running"] = self._running.get(m, 0)
+                out["warm"] = m in self._mru
+                models[m] = out
+            return {
+                "slots": self.slots,
+                "warm_limit": self.warm,
+                "warm": list(reversed(self._mru)),
+                "running": sum(self._running.values()),
+                "queued": sum(len(q) for q in self._queues.values()),
+                "loads": sum(s["loads"] for s in self._stats.values()),
+                "unloads": sum(s["unloads"] for s in self._stats.values()),
+                "models": models,
+            }
@@ -0,0 +1,203 @@
+import os, re, html, sqlite3, threading, time
+from .config import SEARCH_DB
+
+# Full-text index over chat turns (SQLite FTS5, data/search.db). Storage
+# calls index_turn/index_chat/remove_chat as it writes, so the index grows one
+# turn at a time; a chat store that predates the index is backfilled once in
+# a background thread. `docs` maps each FTS rowid to (chat_id, idx) so a chat
+# can be dropped without scanning the whole index.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    rowid   INTEGER PRIMARY KEY,
+    chat_id TEXT NOT NULL,
+    idx     INTEGER NOT NULL,
+    UNIQUE (chat_id, idx)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(
+    user, ai, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+CREATE TABLE IF NOT EXISTS search_info (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+MAX_LIMIT = 100
+SNIPPET_TOKENS = 16
+CANDIDATES = 5000      # newest matches that get ranked
+_HL_OPEN, _HL_CLOSE = "\x02", "\x03"
+_TOKEN = re.compile(r'"([^"]+)"|(\w+)', re.UNICODE)
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+_backfill: threading.Thread | None = None
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(SEARCH_DB, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _db() -> sqlite3.Connection:
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(SEARCH_DB)), exist_ok=True)
+        conn = _local.conn = _connect()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.executescript(_SCHEMA)
+                _initialized = True
+                _start_backfill(conn)
+    return conn
+
+def _insert(conn: sqlite3.Connection, chat_id: str, idx: int, turn: dict):
+    cur = conn.execute("INSERT OR IGNORE INTO docs(chat_id, idx) VALUES (?, ?)", (chat_id, idx))
+    if cur.rowcount:
+        conn.execute("INSERT INTO turns_fts(rowid, user, ai) VALUES (?, ?, ?)",
+                     (cur.lastrowid, str(turn.get("user") or ""), str(turn.get("changli") or "")))
+
+def _delete(conn: sqlite3.Connection, chat_id: str):
+    conn.execute("DELETE FROM turns_fts WHERE rowid IN (SELECT rowid FROM docs WHERE chat_id=?)", (chat_id,))
+    conn.execute("DELETE FROM docs WHERE chat_id=?", (chat_id,))
+
+def index_turn(chat_id: str, idx: int, turn: dict):
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _insert(conn, chat_id, idx, turn)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def index_chat(chat_id: str, history: list):
+    # replaces whatever was indexed for the chat
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _delete(conn, chat_id)
+        for i, t in enumerate(history or []):
+            if isinstance(t, dict):
+                _insert(conn, chat_id, i, t)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def remove_chat(chat_id: str):
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _delete(conn, chat_id)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def _start_backfill(conn: sqlite3.Connection):
+    global _backfill
+    if conn.execute("SELECT 1 FROM search_info WHERE key='backfilled'").fetchone():
+        return
+    _backfill = threading.Thread(target=rebuild, kwargs={"missing_only": True}, name="search-backfill", daemon=True)
+    _backfill.start()
+
+def rebuild(missing_only: bool = False) -> int:
+    # index every stored turn; with missing_only, turns already present are skipped
+    from . import storage
+    conn = _db()
+    added = 0
+    if not missing_only:
+        conn.execute("DELETE FROM turns_fts")
+        conn.execute("DELETE FROM docs")
+    for chat in storage.list_chats():
+        have = conn.execute("SELECT COUNT(*) FROM docs WHERE chat_id=?", (chat["id"],)).fetchone()[0]
+        if have >= chat.get("turn_count", 0):
+            continue
+        # turns appended meanwhile may already be there; _insert skips those
+        turns = storage.get_turns(chat["id"])
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for i, t in enumerate(turns):
+                _insert(conn, chat["id"], i, t)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        added += len(turns) - have
+    conn.execute("INSERT OR REPLACE INTO search_info(key, value) VALUES ('backfilled', ?)",
+                 (time.strftime("%Y-%m-%dT%H:%M:%S"),))
+    conn.execute("INSERT INTO turns_fts(turns_fts) VALUES ('optimize')")
+    return added
+
+def compact():
+    # fold small segments left by one-turn inserts so queries touch fewer b-trees
+    _db().execute("INSERT INTO turns_fts(turns_fts, rank) VALUES ('merge', 200)")
+
+def indexing() -> bool:
+    return _backfill is not None and _backfill.is_alive()
+
+def to_match(query: str) -> str:
+    # user text -> FTS5 query: every word/phrase must appear, the last bare
+    # word also matches as a prefix so results update while typing
+    parts = []
+    for m in _TOKEN.finditer(query or ""):
+        phrase, word = m.group(1), m.group(2)
+        if phrase:
+            words = re.findall(r"\w+", phrase, re.UNICODE)
+            if words:
+                parts.append('"' + " ".join(words) + '"')
+        elif word:
+            parts.append(f'"{word}"')
+    if parts and not query.rstrip().endswith('"') and not query.endswith(" "):
+        parts[-1] += "*"
+    return " ".join(parts)
+
+def _highlight(snippet: str) -> str:
+    return html.escape(snippet, quote=False).replace(_HL_OPEN, "<b>").replace(_HL_CLOSE, "</b>")
+
+def search(query: str, limit: int = 20, offset: int = 0, chat_id: str | None = None) -> dict:
+    match = to_match(query)
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    offset = max(0, int(offset))
+    out = {"query": query, "results": [], "offset": offset, "limit": limit,
+           "next_offset": None, "has_more": False, "indexing": indexing()}
+    if not match:
+        return out
+    t0 = time.perf_counter()
+    conn = _db()
+    window = max(CANDIDATES, offset + limit + 1)
+    scope, scope_args = "", []
+    if chat_id:
+        scope, scope_args = " AND turns_fts.rowid IN (SELECT rowid FROM docs WHERE chat_id = ?)", [chat_id]
+    try:
+        # bm25 has to score every match, which is slow for broad prefixes,
+        # so only the newest `window` matches are ranked (rowids only grow)
+        row = conn.execute("SELECT rowid FROM turns_fts WHERE turns_fts MATCH ?" + scope +
+                           " ORDER BY rowid DESC LIMIT 1 OFFSET ?", [match, *scope_args, window - 1]).fetchone()
+        rows = conn.execute(
+            "SELECT d.chat_id, d.idx, snippet(turns_fts, -1, ?, ?, '…', ?), bm25(turns_fts, 1.0, 0.8) AS score"
+            " FROM turns_fts JOIN docs d ON d.rowid = turns_fts.rowid"
+            " WHERE turns_fts MATCH ? AND turns_fts.rowid >= ?" + scope +
+            " ORDER BY score, turns_fts.rowid DESC LIMIT ? OFFSET ?",
+            [_HL_OPEN, _HL_CLOSE, SNIPPET_TOKENS, match, row[0] if row else 0, *scope_args, limit + 1, offset],
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        return {**out, "error": f"bad query: {e}"}
+    out["took_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    out["has_more"] = len(rows) > limit
+    out["next_offset"] = offset + limit if out["has_more"] else None
+    out["results"] = [{"chat_id": cid, "turn": idx, "snippet": _highlight(snip), "score": round(-score, 4)}
+                      for cid, idx, snip, score in rows[:limit]]
+    return out
+
+def stats() -> dict:
+    conn = _db()
+    return {
+        "turns": conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0],
+        "chats": conn.execute("SELECT COUNT(DISTINCT chat_id) FROM docs").fetchone()[0],
+        "indexing": indexing(),
+    }
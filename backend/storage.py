@@ -1,27 +1,420 @@
-import os, json, time
+import os, json, time, sqlite3, threading, tempfile
+from contextlib import contextmanager
+from functools import wraps
 from json import JSONDecodeError
-from .config import HISTORY_FILE, DATA_DIR
+from .config import HISTORY_FILE, DATA_DIR, CHATS_DB, SESSIONS_FILE, CHAT_STORE
+from . import search
 
-def _init_files():
-    os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(HISTORY_FILE) or os.path.getsize(HISTORY_FILE) == 0:
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            f.write("[]")
+# Chats live in SQLite (WAL mode): one row of metadata per chat in `chats`
+# and one row per turn in `turns`, keyed by (chat_id, idx). Appending a turn
+# touches a single chat row and a single turn row, independent of archive size.
+#
+# Concurrency: every write is one BEGIN IMMEDIATE transaction, so writers from
+# any thread or process serialize on the database and never see a stale
+# snapshot (append_turn picks the next idx inside the transaction). Within a
+# process, chat_lock(chat_id) additionally serializes read-modify-write
+# sequences that span more than one call, such as the memory update after a
+# turn. Plain JSON files (config, profile) go through write_json_atomic.
+#
+# The `chats` row doubles as the session index (title, created, updated,
+# turn count), so listing chats never touches message bodies.
+#
+# With CHANG_LI_STORE=files (or set_store("files")) the same functions are
+# served by filestore.FileStore, one set of files per chat; see filestore.py.
 
-def load_chats():
-    _init_files()
+META_FIELDS = ("user_name", "ai_name", "model", "custom_prompt", "memory_summary", "memory_facts")
+ROW_FIELDS = ("id", "history", "last_updated", "turn_count", "title", "created")
+TITLE_CHARS = 36
+COMPACT_EVERY = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id           TEXT PRIMARY KEY,
+    meta         TEXT NOT NULL DEFAULT '{}',
+    turn_count   INTEGER NOT NULL DEFAULT 0,
+    last_updated TEXT NOT NULL DEFAULT '',
+    title        TEXT NOT NULL DEFAULT '',
+    created      TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS turns (
+    chat_id TEXT NOT NULL,
+    idx     INTEGER NOT NULL,
+    data    TEXT NOT NULL,
+    PRIMARY KEY (chat_id, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS store_info (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_local = threading.local()
+_chat_locks: dict[str, list] = {}             # chat id -> [lock, holders and waiters]
+_chat_locks_guard = threading.Lock()
+_init_lock = threading.Lock()
+_initialized = False
+_writes = 0
+_writes_lock = threading.Lock()
+_store_name = CHAT_STORE
+_files = None
+_store_lock = threading.Lock()
+
+def _file_store():
+    global _files
+    if _files is None:
+        with _store_lock:
+            if _files is None:
+                from .filestore import FileStore
+                store = FileStore()
+                if store.created and (os.path.exists(CHATS_DB) or os.path.exists(HISTORY_FILE)):
+                    _import_into(store)
+                _files = store
+    return _files
+
+def _routed(fn):
+    # the public chat functions below are the SQLite store; with the file
+    # store selected the call goes to the FileStore method of the same name
+    @wraps(fn)
+    def call(*args, **kwargs):
+        if _store_name == "files":
+            return getattr(_file_store(), fn.__name__)(*args, **kwargs)
+        return fn(*args, **kwargs)
+    return call
+
+def set_store(name: str):
+    global _store_name, _files
+    if name not in ("sqlite", "files"):
+        raise ValueError(f"unknown chat store: {name}")
+    with _store_lock:
+        if _files is not None and name != "files":
+            _files.close()
+            _files = None
+        _store_name = name
+
+def _import_into(store):
+    # first start on the file store: copy what the SQLite store holds (which
+    # has already taken in chat_history.json); chats.db is left as it was
+    for c in list_chats.__wrapped__():
+        c.pop("turn_count", None)
+        c["history"] = get_turns.__wrapped__(c["id"])
+        try:
+            store.put(c)
+        except ValueError as e:
+            print(f"[WARN] chat not imported into the file store: {e}")
+
+def write_json_atomic(path: str, data, **dump_kwargs):
+    dump_kwargs.setdefault("indent", 2)
+    dump_kwargs.setdefault("ensure_ascii", False)
+    d = os.path.dirname(os.path.abspath(path))
+    os.makedirs(d, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=d)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+@contextmanager
+def chat_lock(chat_id: str):
+    # an entry only lives while someone holds or waits for it
+    with _chat_locks_guard:
+        entry = _chat_locks.get(chat_id)
+        if entry is None:
+            entry = _chat_locks[chat_id] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _chat_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _chat_locks[chat_id]
+
+def _reindex(fn, *args):
+    # the search index is derived data; a failed update must not fail the write
+    try:
+        fn(*args)
+    except Exception as e:
+        print(f"[WARN] search index update failed: {e}")
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(CHATS_DB, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+def _db() -> sqlite3.Connection:
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        conn = _local.conn = _connect()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.executescript(_SCHEMA)
+                _migrate_json(conn)
+                _migrate_sessions(conn)
+                _initialized = True
+    return conn
+
+class _tx:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        if exc_type is None:
+            _after_write(self.conn)
+        return False
+
+def _after_write(conn: sqlite3.Connection):
+    global _writes
+    with _writes_lock:
+        _writes += 1
+        due = _writes % COMPACT_EVERY == 0
+    if due:
+        compact(conn)
+
+@_routed
+def compact(conn: sqlite3.Connection | None = None):
+    conn = conn or _db()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA optimize")
+    _reindex(search.compact)
+
+def _load_legacy() -> list:
+    if not os.path.exists(HISTORY_FILE) or os.path.getsize(HISTORY_FILE) == 0:
+        return []
     try:
         with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except JSONDecodeError:
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            f.write("[]")
+            data = json.load(f)
+        return data if isinstance(data, list) else []
+    except (JSONDecodeError, OSError):
         return []
 
+def _migrate_json(conn: sqlite3.Connection):
+    if conn.execute("SELECT 1 FROM store_info WHERE key='migrated_json'").fetchone():
+        return
+    chats = _load_legacy()
+    with _tx(conn):
+        for c in chats:
+            if isinstance(c, dict) and c.get("id"):
+                _insert_chat(conn, c)
+        conn.execute("INSERT OR REPLACE INTO store_info(key, value) VALUES ('migrated_json', ?)", (_now(),))
+
+def _title_from(text) -> str:
+    line = str(text or "").strip().split("\n", 1)[0].strip()
+    return line[:TITLE_CHARS]
+
+def _ui_time(ts: str) -> str:
+    # chat_sessions.json used "YYYY-MM-DD HH:MM"
+    try:
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.strptime(ts, "%Y-%m-%d %H:%M"))
+    except (TypeError, ValueError):
+        return ""
+
+def _migrate_sessions(conn: sqlite3.Connection):
+    # older stores have no title/created columns and keep titles in the UI's
+    # chat_sessions.json; both are folded into `chats` once
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(chats)")}
+    for col in ("title", "created"):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE chats ADD COLUMN {col} TEXT NOT NULL DEFAULT ''")
+    conn.execute("CREATE INDEX IF NOT EXISTS chats_updated ON chats(last_updated)")
+    if conn.execute("SELECT 1 FROM store_info WHERE key='migrated_sessions'").fetchone():
+        return
+    try:
+        with open(SESSIONS_FILE, "r", encoding="utf-8") as f:
+            sessions = json.load(f)
+    except (OSError, JSONDecodeError):
+        sessions = {}
+    with _tx(conn):
+        for chat_id, first in conn.execute(
+                "SELECT c.id, t.data FROM chats c LEFT JOIN turns t ON t.chat_id = c.id AND t.idx = 0"
+                " WHERE c.title = ''").fetchall():
+            title = _title_from(json.loads(first).get("user")) if first else ""
+            conn.execute("UPDATE chats SET title=? WHERE id=?", (title, chat_id))
+        conn.execute("UPDATE chats SET created=last_updated WHERE created=''")
+        for sess in (sessions.values() if isinstance(sessions, dict) else []):
+            if not isinstance(sess, dict) or not sess.get("id"):
+                continue
+            title = (sess.get("title") or "").strip()
+            if title and title != "(untitled)":
+                conn.execute("UPDATE chats SET title=? WHERE id=?", (title, sess["id"]))
+            created = _ui_time(sess.get("created"))
+            if created:
+                conn.execute("UPDATE chats SET created=? WHERE id=?", (created, sess["id"]))
+        conn.execute("INSERT OR REPLACE INTO store_info(key, value) VALUES ('migrated_sessions', ?)", (_now(),))
+
+def _split_meta(chat: dict) -> dict:
+    return {k: v for k, v in chat.items() if k not in ROW_FIELDS}
+
+def _insert_chat(conn: sqlite3.Connection, chat: dict):
+    hist = chat.get("history") or []
+    now = _now()
+    title = chat.get("title")
+    if title is None:
+        title = _title_from(hist[0].get("user")) if hist and isinstance(hist[0], dict) else ""
+    conn.execute(
+        "INSERT OR REPLACE INTO chats(id, meta, turn_count, last_updated, title, created) VALUES (?, ?, ?, ?, ?, ?)",
+        (chat["id"], json.dumps(_split_meta(chat), ensure_ascii=False), len(hist),
+         chat.get("last_updated") or now, title, chat.get("created") or chat.get("last_updated") or now)
+    )
+    conn.execute("DELETE FROM turns WHERE chat_id=?", (chat["id"],))
+    conn.executemany(
+        "INSERT INTO turns(chat_id, idx, data) VALUES (?, ?, ?)",
+        [(chat["id"], i, json.dumps(t, ensure_ascii=False)) for i, t in enumerate(hist)]
+    )
+
+_CHAT_COLS = "id, meta, turn_count, last_updated, title, created"
+
+def _row_to_chat(row) -> dict:
+    chat_id, meta, turn_count, last_updated, title, created = row
+    chat = {"id": chat_id}
+    chat.update(json.loads(meta or "{}"))
+    chat["turn_count"] = turn_count
+    chat["last_updated"] = last_updated
+    chat["title"] = title
+    chat["created"] = created
+    return chat
+
+@_routed
+def get_turns(chat_id: str, start: int = 0, end: int | None = None) -> list[dict]:
+    sql = "SELECT data FROM turns WHERE chat_id=? AND idx>=?"
+    args = [chat_id, max(0, start)]
+    if end is not None:
+        sql += " AND idx<?"
+        args.append(end)
+    rows = _db().execute(sql + " ORDER BY idx", args).fetchall()
+    return [json.loads(r[0]) for r in rows]
+
+@_routed
+def get_chat(chat_id: str, with_history: bool = True) -> dict | None:
+    row = _db().execute(f"SELECT {_CHAT_COLS} FROM chats WHERE id=?", (chat_id,)).fetchone()
+    if not row:
+        return None
+    chat = _row_to_chat(row)
+    if with_history:
+        chat["history"] = get_turns(chat_id)
+    return chat
+
+@_routed
+def list_chats() -> list[dict]:
+    rows = _db().execute(f"SELECT {_CHAT_COLS} FROM chats").fetchall()
+    return [_row_to_chat(r) for r in rows]
+
+@_routed
+def list_sessions(limit: int | None = None, offset: int = 0) -> list[dict]:
+    # newest first; reads the index columns only, no message bodies
+    rows = _db().execute(
+        "SELECT id, title, created, last_updated, turn_count, json_extract(meta, '$.user_name'),"
+        " json_extract(meta, '$.model') FROM chats ORDER BY last_updated DESC, id LIMIT ? OFFSET ?",
+        (-1 if limit is None else max(0, limit), max(0, offset))
+    ).fetchall()
+    return [{"id": r[0], "title": r[1], "created": r[2], "last_updated": r[3], "turn_count": r[4],
+             "user_name": r[5] or "", "model": r[6] or ""} for r in rows]
+
+@_routed
+def count_chats() -> int:
+    return _db().execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+@_routed
+def create_chat(chat: dict) -> dict:
+    chat.setdefault("last_updated", _now())
+    with _tx(_db()) as conn:
+        _insert_chat(conn, chat)
+    _reindex(search.index_chat, chat["id"], chat.get("history") or [])
+    return chat
+
+@_routed
+def update_chat(chat_id: str, touch: bool = True, **fields) -> bool:
+    # background writes (memory, summary) pass touch=False so the chat keeps
+    # its place in the history list
+    with _tx(_db()) as conn:
+        row = conn.execute("SELECT meta, last_updated FROM chats WHERE id=?", (chat_id,)).fetchone()
+        if not row:
+            return False
+        meta = json.loads(row[0] or "{}")
+        meta.update({k: v for k, v in fields.items() if k not in ROW_FIELDS})
+        updated = fields.get("last_updated") or (_now() if touch else row[1])
+        conn.execute(
+            "UPDATE chats SET meta=?, last_updated=? WHERE id=?",
+            (json.dumps(meta, ensure_ascii=False), updated, chat_id)
+        )
+        if fields.get("title") is not None:
+            conn.execute("UPDATE chats SET title=? WHERE id=?", (str(fields["title"]).strip(), chat_id))
+    return True
+
+@_routed
+def rename_chat(chat_id: str, title: str) -> bool:
+    with _tx(_db()) as conn:
+        return conn.execute("UPDATE chats SET title=? WHERE id=?", (title.strip(), chat_id)).rowcount > 0
+
+@_routed
+def append_turn(chat_id: str, turn: dict, **fields) -> int:
+    with _tx(_db()) as conn:
+        row = conn.execute("SELECT meta, turn_count FROM chats WHERE id=?", (chat_id,)).fetchone()
+        if not row:
+            raise KeyError(chat_id)
+        meta, idx = json.loads(row[0] or "{}"), row[1]
+        conn.execute("INSERT INTO turns(chat_id, idx, data) VALUES (?, ?, ?)",
+                     (chat_id, idx, json.dumps(turn, ensure_ascii=False)))
+        if fields:
+            meta.update({k: v for k, v in fields.items() if k not in ROW_FIELDS})
+        conn.execute(
+            "UPDATE chats SET meta=?, turn_count=?, last_updated=? WHERE id=?",
+            (json.dumps(meta, ensure_ascii=False), idx + 1, _now(), chat_id)
+        )
+    _reindex(search.index_turn, chat_id, idx, turn)
+    return idx + 1
+
+@_routed
+def delete_chat(chat_id: str) -> bool:
+    with _tx(_db()) as conn:
+        conn.execute("DELETE FROM turns WHERE chat_id=?", (chat_id,))
+        deleted = conn.execute("DELETE FROM chats WHERE id=?", (chat_id,)).rowcount > 0
+    _reindex(search.remove_chat, chat_id)
+    return deleted
+
+def load_chats():
+    chats = list_chats()
+    for c in chats:
+        c["history"] = get_turns(c["id"])
+    return chats
+
+@_routed
 def save_chats(chats):
-    _init_files()
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(chats or [], f, indent=2, ensure_ascii=False)
+    # replaces the whole store, as writing chat_history.json did
+    chats = chats or []
+    keep = {c["id"] for c in chats}
+    with _tx(_db()) as conn:
+        gone = [r[0] for r in conn.execute("SELECT id FROM chats").fetchall() if r[0] not in keep]
+        for chat_id in gone:
+            conn.execute("DELETE FROM turns WHERE chat_id=?", (chat_id,))
+            conn.execute("DELETE FROM chats WHERE id=?", (chat_id,))
+        for c in chats:
+            _insert_chat(conn, c)
+    for chat_id in gone:
+        _reindex(search.remove_chat, chat_id)
+    for c in chats:
+        _reindex(search.index_chat, c["id"], c.get("history") or [])
 
 def touch_chat(chat: dict):
-    chat["last_updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    chat["last_updated"] = _now()
@@ -0,0 +1,316 @@
+import os, re, json, math, mmap, array, hashlib, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from .config import DATA_DIR
+from . import storage, metrics
+
+# Retrieval memory. Every finished turn is embedded in the background and
+# appended to a per-chat vector file (data/vectors/<chat_id>.f32, one float32
+# row per turn, row i = turn i). When a prompt is built, the new message is
+# embedded and the most similar turns that fell out of the prompt window are
+# recalled under a token budget. The message is embedded on a small pool as
+# soon as the request arrives (prefetch); recall waits at most `query_wait`
+# seconds for it and otherwise uses the newest indexed turn as the query, so a
+# slow embedding model never holds up the reply.
+#
+# Embeddings come from the inference backend (Ollama /api/embed) or, when
+# that is unavailable or `embedder` is "hash", from a deterministic hashing
+# embedder. A chat keeps the embedder it was started with (recorded in
+# <chat_id>.json) so its rows stay comparable. NumPy is optional: with it the
+# index is memory-mapped and scored in one matrix product; without it the
+# same file is scanned in pure Python. It is imported on first use, since
+# retrieval memory is off by default.
+
+VECTORS_DIR = os.path.join(DATA_DIR, "vectors")
+
+DEFAULTS = {
+    "enabled": False,
+    "embedder": "ollama",            # ollama | hash
+    "embed_model": "nomic-embed-text",
+    "hash_dim": 256,
+    "top_k": 4,
+    "min_score": 0.25,
+    "budget_tokens": 400,
+    "query_wait": 0.15,              # seconds recall waits for the message embedding
+    "summarize": True,               # keep the periodic LLM summary as well
+}
+
+MAX_EMBED_CHARS = 2000
+EMBED_BATCH = 32
+QUERY_CACHE = 64
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_np = None
+_np_checked = False
+
+def _numpy():
+    global _np, _np_checked
+    if not _np_checked:
+        try:
+            import numpy as _np
+        except ImportError:      # optional
+            _np = None
+        _np_checked = True
+    return _np
+
+def _normalize(vec: list[float]) -> list[float]:
+    n = math.sqrt(sum(x * x for x in vec))
+    return [x / n for x in vec] if n else vec
+
+class HashingEmbedder:
+    # signed feature hashing of words and word pairs; same text, same vector
+    def __init__(self, dim: int = 256):
+        self.dim = int(dim)
+        self.name = f"hash-{self.dim}"
+
+    def _embed_one(self, text: str) -> list[float]:
+        vec = [0.0] * self.dim
+        words = [w.lower() for w in _WORD.findall(text or "")]
+        feats = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for f in feats:
+            h = int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        return _normalize(vec)
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed_one(t) for t in texts]
+
+class OllamaEmbedder:
+    def __init__(self, model: str):
+        self.model = model
+        self.name = f"ollama:{model}"
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        from .ollama_client import embed
+        return [_normalize([float(x) for x in v]) for v in embed(texts, self.model)]
+
+class VectorIndex:
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._row = dim * 4
+
+    def __len__(self) -> int:
+        try:
+            return os.path.getsize(self.path) // self._row
+        except OSError:
+            return 0
+
+    def append(self, vectors: list[list[float]]):
+        buf = array.array("f")
+        for v in vectors:
+            if len(v) != self.dim:
+                raise ValueError(f"expected {self.dim} dims, got {len(v)}")
+            buf.extend(v)
+        if buf.itemsize != 4:
+            raise RuntimeError("float32 arrays are required")
+        with open(self.path, "ab") as f:
+            f.write(buf.tobytes())
+
+    def truncate(self, rows: int):
+        with open(self.path, "r+b") as f:
+            f.truncate(rows * self._row)
+
+    def row(self, i: int) -> list[float]:
+        with open(self.path, "rb") as f:
+            f.seek(i * self._row)
+            buf = array.array("f")
+            buf.frombytes(f.read(self._row))
+        return buf.tolist()
+
+    def top_k(self, query: list[float], k: int, start: int = 0, before: int | None = None) -> list[tuple[int, float]]:
+        # best rows in [start, before); newer turns are already in the prompt
+        n = len(self)
+        if before is not None:
+            n = min(n, max(0, before))
+        start = max(0, start)
+        if n <= start or k <= 0:
+            return []
+        np = _numpy()
+        if np is not None:
+            # the mapping is closed before returning, so the file can be deleted
+            # (Windows refuses while a view is open)
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), n * self._row, access=mmap.ACCESS_READ) as mm:
+                mat = np.frombuffer(mm, dtype="<f4", count=(n - start) * self.dim, offset=start * self._row)
+                scores = mat.reshape(-1, self.dim) @ np.asarray(query, dtype=np.float32)
+                del mat
+            k = min(k, len(scores))
+            idx = np.argpartition(-scores, k - 1)[:k]
+            return sorted(((start + int(i), float(scores[i])) for i in idx), key=lambda t: (-t[1], t[0]))
+        rows = array.array("f")
+        with open(self.path, "rb") as f:
+            f.seek(start * self._row)
+            rows.frombytes(f.read((n - start) * self._row))
+        d = self.dim
+        scored = [(start + i, sum(a * b for a, b in zip(rows[i * d:(i + 1) * d], query))) for i in range(n - start)]
+        scored.sort(key=lambda t: (-t[1], t[0]))
+        return scored[:k]
+
+class VectorMemory:
+    def __init__(self, root: str = VECTORS_DIR):
+        self.root = root
+        self.settings = dict(DEFAULTS)
+        self._locks: dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self._pool = ThreadPoolExecutor(2, thread_name_prefix="recall-embed")
+        self._queries: OrderedDict[tuple, object] = OrderedDict()
+        self.stats = {"embedded": 0, "recalls": 0, "recalled_turns": 0, "fallbacks": 0, "query_timeouts": 0}
+
+    def configure(self, settings: dict | None):
+        self.settings = {**DEFAULTS, **(settings or {})}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.settings.get("enabled"))
+
+    def _lock(self, chat_id: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(chat_id, threading.Lock())
+
+    def _paths(self, chat_id: str) -> tuple[str, str]:
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", chat_id)
+        return os.path.join(self.root, f"{safe}.f32"), os.path.join(self.root, f"{safe}.json")
+
+    def _meta(self, chat_id: str) -> dict | None:
+        try:
+            with open(self._paths(chat_id)[1], "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _embedder_for(self, meta: dict | None):
+        name = (meta or {}).get("embedder")
+        if name is None:
+            if self.settings.get("embedder") == "hash":
+                return HashingEmbedder(self.settings.get("hash_dim", 256))
+            return OllamaEmbedder(self.settings.get("embed_model") or DEFAULTS["embed_model"])
+        if name.startswith("hash-"):
+            return HashingEmbedder(int(name[5:]))
+        return OllamaEmbedder(name.split(":", 1)[1])
+
+    def _embed(self, embedder, texts: list[str], meta: dict | None):
+        # -> (embedder actually used, vectors); a new chat whose backend
+        # embedder fails starts on the hashing one instead
+        try:
+            return embedder, embedder.embed(texts)
+        except Exception as e:
+            if meta is not None or isinstance(embedder, HashingEmbedder):
+                raise
+            print(f"[WARN] {embedder.name} unavailable, using hashing embedder: {e}")
+            self.stats["fallbacks"] += 1
+            fallback = HashingEmbedder(self.settings.get("hash_dim", 256))
+            return fallback, fallback.embed(texts)
+
+    @staticmethod
+    def turn_text(turn: dict) -> str:
+        parts = []
+        if turn.get("user"):
+            parts.append(f"User: {turn['user']}")
+        if turn.get("changli"):
+            parts.append(f"AI: {turn['changli']}")
+        return "\n".join(parts)[:MAX_EMBED_CHARS]
+
+    def index_pending(self, chat_id: str, model: str = "") -> bool:
+        # embed turns the index does not have yet; runs on the background worker
+        chat = storage.get_chat(chat_id, with_history=False)
+        if not chat:
+            self.remove(chat_id)
+            return False
+        with self._lock(chat_id), metrics.span("memory.embed"):
+            vec_path, meta_path = self._paths(chat_id)
+            meta = self._meta(chat_id)
+            embedder = self._embedder_for(meta)
+            index = VectorIndex(vec_path, meta["dim"]) if meta else None
+            have = len(index) if index else 0
+            total = chat.get("turn_count", 0)
+            if have > total:            # history was rewritten
+                index.truncate(0)
+                have = 0
+            added = 0
+            while have < total:
+                turns = storage.get_turns(chat_id, have, min(total, have + EMBED_BATCH))
+                if not turns:
+                    break
+                embedder, vectors = self._embed(embedder, [self.turn_text(t) for t in turns], meta)
+                if meta is None:
+                    os.makedirs(self.root, exist_ok=True)
+                    meta = {"embedder": embedder.name, "dim": len(vectors[0])}
+                    storage.write_json_atomic(meta_path, meta)
+                    index = VectorIndex(vec_path, meta["dim"])
+                index.append(vectors)
+                have += len(vectors)
+                added += len(vectors)
+            self.stats["embedded"] += added
+            return added > 0
+
+    def prefetch(self, chat_id: str, query: str):
+        # start embedding the new message while the request reads and builds the prompt
+        meta = self._meta(chat_id)
+        if not meta or not (query or "").strip():
+            return None
+        key = (chat_id, meta["embedder"], query[:MAX_EMBED_CHARS])
+        with self._guard:
+            fut = self._queries.get(key)
+            if fut is None:
+                embedder = self._embedder_for(meta)
+                fut = self._queries[key] = self._pool.submit(lambda: embedder.embed([key[2]])[0])
+                while len(self._queries) > QUERY_CACHE:
+                    self._queries.popitem(last=False)
+            self._queries.move_to_end(key)
+        return fut
+
+    def _query_vector(self, chat_id: str, query: str, index: VectorIndex) -> list[float] | None:
+        fut = self.prefetch(chat_id, query)
+        if fut is None:
+            return None
+        try:
+            return fut.result(timeout=float(self.settings.get("query_wait", DEFAULTS["query_wait"])))
+        except FutureTimeout:
+            # fall back to the latest exchange, which is already indexed
+            self.stats["query_timeouts"] += 1
+            n = len(index)
+            return index.row(n - 1) if n else None
+        except Exception as e:
+            print(f"[WARN] recall embedding failed: {e}")
+            return None
+
+    def recall(self, chat_id: str, query: str, before: int, start: int = 0) -> list[tuple[int, float, dict]]:
+        # -> [(turn index, score, turn)] best first, turns in [start, before) only
+        meta = self._meta(chat_id)
+        if not meta or not (query or "").strip() or before <= start:
+            return []
+        vec_path, _ = self._paths(chat_id)
+        index = VectorIndex(vec_path, meta["dim"])
+        with metrics.span("memory.recall"):
+            q = self._query_vector(chat_id, query, index)
+            if q is None:
+                return []
+            if len(q) != meta["dim"]:
+                return []
+            k = int(self.settings.get("top_k", 4))
+            hits = [(i, s) for i, s in index.top_k(q, k, start, before) if s >= float(self.settings.get("min_score", 0))]
+            out = []
+            for i, s in hits:
+                turns = storage.get_turns(chat_id, i, i + 1)
+                if turns:
+                    out.append((i, s, turns[0]))
+        self.stats["recalls"] += 1
+        self.stats["recalled_turns"] += len(out)
+        return out
+
+    def remove(self, chat_id: str):
+        with self._guard:
+            for key in [k for k in self._queries if k[0] == chat_id]:
+                del self._queries[key]
+        with self._lock(chat_id):
+            for p in self._paths(chat_id):
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+
+    def status(self, chat_id: str) -> dict:
+        meta = self._meta(chat_id) or {}
+        rows = len(VectorIndex(self._paths(chat_id)[0], meta["dim"])) if meta else 0
+        return {"enabled": self.enabled, "embedder": meta.get("embedder"), "dim": meta.get("dim"),
+                "indexed_turns": rows, "numpy": _numpy() is not None}
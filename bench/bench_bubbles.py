@@ -0,0 +1,101 @@
+import os, sys, json, time, random, argparse
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtCore import QModelIndex
+from PySide6.QtGui import QPixmap
+from PySide6.QtWidgets import QApplication, QStyleOptionViewItem
+
+from ui.widgets.bubbles import make_tail_pixmap, tail_pixmap, clear_tail_cache, install_app_styles, BUBBLE_COLORS
+from ui.widgets.chat_view import ChatView
+
+WORDS = "aku kamu sayang hari ini cuaca bagus makan kopi kerja malam senang ngobrol".split()
+
+def synthetic_pairs(n: int, rng: random.Random) -> list[tuple[str, str]]:
+    out = []
+    for i in range(n):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 30))) for _ in range(rng.randint(1, 3))]
+        out.append(("user" if i % 2 == 0 else "ai", "\n".join(lines)))
+    return out
+
+def _timed(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000
+
+def bench_tails(calls: int, dpr: float) -> dict:
+    sides = [("right", BUBBLE_COLORS["user"]), ("left", BUBBLE_COLORS["ai"])]
+    uncached = _timed(lambda: [make_tail_pixmap(*sides[i % 2], dpr) for i in range(calls)])
+    clear_tail_cache()
+    cached = _timed(lambda: [tail_pixmap(*sides[i % 2], dpr) for i in range(calls)])
+    return {"calls": calls, "dpr": dpr, "uncached_ms": round(uncached, 2), "cached_ms": round(cached, 2)}
+
+def bench_view(messages: int, frames: int, width: int, height: int) -> dict:
+    rng = random.Random(42)
+    pairs = synthetic_pairs(messages, rng)
+    view = ChatView()
+    view.resize(width, height)
+    view.show()
+    QApplication.processEvents()
+
+    def append_all():
+        for role, text in pairs:
+            view.add_message(role, text)
+    append_ms = _timed(append_all)
+    layout_ms = _timed(QApplication.processEvents)
+
+    view.clear()
+    bulk_ms = _timed(lambda: view.set_messages(pairs))
+
+    delegate, model = view.itemDelegate(), view.model()
+    opt = QStyleOptionViewItem()
+    size_ms = _timed(lambda: [delegate.sizeHint(opt, model.index(r, 0, QModelIndex())) for r in range(model.rowCount())])
+
+    view.scrollToBottom()
+    QApplication.processEvents()
+    target = QPixmap(view.viewport().size())
+    sb = view.verticalScrollBar()
+    def scroll_frames():
+        for i in range(frames):
+            sb.setValue(int(sb.maximum() * (1 - i / max(1, frames - 1))))
+            view.viewport().render(target)
+    frames_ms = _timed(scroll_frames)
+
+    return {
+        "messages": messages,
+        "append_ms": round(append_ms, 2),
+        "append_layout_ms": round(layout_ms, 2),
+        "bulk_insert_ms": round(bulk_ms, 2),
+        "size_hint_ms": round(size_ms, 2),
+        "frames": frames,
+        "frame_ms": round(frames_ms / max(1, frames), 3),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmark for the chat bubble view")
+    ap.add_argument("--messages", type=int, default=10000)
+    ap.add_argument("--frames", type=int, default=60)
+    ap.add_argument("--size", default="900x640")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    install_app_styles(app)
+    w, h = (int(x) for x in args.size.lower().split("x"))
+
+    results = {
+        "tails": [bench_tails(args.messages, d) for d in (1.0, 2.0)],
+        "view": bench_view(args.messages, args.frames, w, h),
+    }
+    for t in results["tails"]:
+        print(f"tail pixmaps x{t['calls']} @{t['dpr']}x  uncached {t['uncached_ms']} ms  cached {t['cached_ms']} ms")
+    v = results["view"]
+    print(f"{v['messages']} messages  append {v['append_ms']} ms (+{v['append_layout_ms']} ms layout)"
+          f"  bulk {v['bulk_insert_ms']} ms  sizeHint {v['size_hint_ms']} ms  frame {v['frame_ms']} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os, sys, json, time, random, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.output_filter import filter_output, StreamFilter
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "filter_corpus.json")
+
+def _apply(shown: str, events) -> str:
+    for kind, text in events:
+        shown = shown + text if kind == "append" else text
+    return shown
+
+def stream_filter(text: str, rng: random.Random) -> str:
+    sf, shown, i = StreamFilter(), "", 0
+    while i < len(text):
+        n = rng.randint(1, 6)
+        shown = _apply(shown, sf.feed(text[i:i + n]))
+        i += n
+    final, events = sf.finish()
+    shown = _apply(shown, events)
+    assert shown == final
+    return shown
+
+def check_corpus(path: str = CORPUS) -> list[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    rng = random.Random(0)
+    failures = []
+    for c in cases:
+        got = filter_output(c["input"])
+        if got != c["expected"]:
+            failures.append(f"{c['name']} (batch): {got!r} != {c['expected']!r}")
+        if c["input"]:
+            got = stream_filter(c["input"], rng)
+            if got != c["expected"]:
+                failures.append(f"{c['name']} (stream): {got!r} != {c['expected']!r}")
+    return failures
+
+def synthetic_output(lines: int, rng: random.Random) -> str:
+    words = "aku kamu sayang hari ini cuaca bagus makan kopi kerja malam senang ngobrol".split()
+    meta = ["Thinking...", "Analysis: plan the reply", "The user says hi", "(system note)", ""]
+    out = []
+    for i in range(lines):
+        if rng.random() < 0.1:
+            out.append(rng.choice(meta))
+        else:
+            out.append(" ".join(rng.choice(words) for _ in range(rng.randint(4, 24))))
+    return "\n".join(out)
+
+def bench(lines: int, repeat: int) -> dict:
+    rng = random.Random(42)
+    text = synthetic_output(lines, rng)
+    tokens = [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        filter_output(text)
+    batch = (time.perf_counter() - t0) / repeat
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        sf = StreamFilter()
+        for tok in tokens:
+            sf.feed(tok)
+        sf.finish()
+    stream = (time.perf_counter() - t0) / repeat
+
+    return {
+        "lines": lines,
+        "chars": len(text),
+        "batch_ms": round(batch * 1000, 3),
+        "batch_mb_s": round(len(text) / batch / 1e6, 2),
+        "stream_ms": round(stream * 1000, 3),
+        "stream_tokens": len(tokens),
+        "stream_us_per_token": round(stream / len(tokens) * 1e6, 3),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Regression check and benchmark for backend.output_filter")
+    ap.add_argument("--lines", type=int, nargs="*", default=[50, 500, 5000])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    failures = check_corpus()
+    for f in failures:
+        print(f"FAIL {f}")
+    results = {"corpus_failures": len(failures), "runs": [bench(n, args.repeat) for n in args.lines]}
+    for r in results["runs"]:
+        print(f"{r['lines']:>6} lines {r['chars']:>8} chars  batch {r['batch_ms']:>8} ms ({r['batch_mb_s']} MB/s)"
+              f"  stream {r['stream_ms']:>8} ms ({r['stream_us_per_token']} us/token)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+import os, sys, json, time, random, shutil, logging, argparse, hashlib, platform, subprocess, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Offline benchmark for the Flask backend. Generation is replaced by a
+# deterministic in-process engine with a fixed per-token latency, so the
+# numbers measure our own overhead (routing, prompt assembly, storage,
+# streaming) and can be compared across commits:
+#
+#   python bench/bench_server.py --json before.json
+#   python bench/bench_server.py --json after.json --compare before.json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = "aku kamu sayang hari ini cuaca bagus makan kopi kerja malam senang ngobrol".split()
+MODEL = "bench:fake"
+
+class FakeEngine:
+    # same interface as HTTPEngine; output depends only on the prompt
+    name = "fake"
+    supports_context = True
+
+    def __init__(self, token_latency: float = 0.002, tokens: int = 64, models=(MODEL,)):
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.models = list(models)
+
+    def available(self, timeout: float = 0.5) -> bool:
+        return True
+
+    def list_models(self) -> list[str]:
+        return list(self.models)
+
+    def _tokens(self, prompt: str) -> list[str]:
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        return [(" " if i else "") + rng.choice(WORDS) for i in range(self.tokens)]
+
+    def _generation(self, prompt: str, model: str, toks: list[str], t0: float, context) -> object:
+        from backend.ollama_client import Generation
+        return Generation(text="".join(toks), model=model, context=(context or []) + [len(prompt)],
+                          prompt_tokens=len(prompt) // 4, eval_tokens=len(toks),
+                          duration=time.perf_counter() - t0, engine=self.name)
+
+    def generate(self, prompt: str, model: str, options: dict | None = None,
+                 context: list | None = None, keep_alive=None, raw: bool = False):
+        t0 = time.perf_counter()
+        toks = self._tokens(prompt)
+        time.sleep(self.token_latency * len(toks))
+        return self._generation(prompt, model, toks, t0, context)
+
+    def stream(self, prompt: str, model: str, options: dict | None = None,
+               context: list | None = None, keep_alive=None, raw: bool = False):
+        t0 = time.perf_counter()
+        toks = self._tokens(prompt)
+        for tok in toks:
+            time.sleep(self.token_latency)
+            yield tok
+        return self._generation(prompt, model, toks, t0, context)
+
+    def chat(self, messages: list[dict], model: str, options: dict | None = None, keep_alive=None):
+        return self.generate("\n".join(m.get("content", "") for m in messages), model)
+
+    def unload(self, model: str) -> bool:
+        return True
+
+def _pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+def _summary(ms: list[float]) -> dict:
+    return {
+        "n": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50_ms": round(_pct(ms, 50), 3),
+        "p95_ms": round(_pct(ms, 95), 3),
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+    }
+
+def _message(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20)))
+
+class Client:
+    def __init__(self, base: str):
+        import requests
+        self.base = base
+        self.sess = requests.Session()
+
+    def chat(self, chat_id: str | None, text: str, stream: bool) -> tuple[int, str | None, float, float | None]:
+        # -> (status, chat_id, total seconds, seconds to first token)
+        url = f"{self.base}/chat/{chat_id}" if chat_id else f"{self.base}/chat"
+        body = {"message": text, "model": MODEL, "stream": stream, "echo_history": False}
+        t0 = time.perf_counter()
+        if not stream:
+            r = self.sess.post(url, json=body, timeout=120)
+            dt = time.perf_counter() - t0
+            return r.status_code, (r.json().get("chat_id") if r.ok else chat_id), dt, None
+        ttft, event, cid = None, None, chat_id
+        with self.sess.post(url, json=body, timeout=120, stream=True) as r:
+            if not r.ok:
+                return r.status_code, chat_id, time.perf_counter() - t0, None
+            for line in r.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: "):
+                    if event == "token" and ttft is None:
+                        ttft = time.perf_counter() - t0
+                    elif event == "done":
+                        cid = json.loads(line[6:]).get("chat_id", cid)
+        return r.status_code, cid, time.perf_counter() - t0, ttft
+
+def start_server(app):
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    srv = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=srv.serve_forever, name="bench-server", daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_port}"
+
+def bench_latency(base: str, requests_: int, engine: FakeEngine) -> dict:
+    rng = random.Random(1)
+    floor_ms = engine.token_latency * engine.tokens * 1000
+    out = {"model_floor_ms": round(floor_ms, 3)}
+    for stream in (False, True):
+        c = Client(base)
+        first, follow, ttft = [], [], []
+        chat_id = None
+        for i in range(requests_):
+            status, cid, dt, t1 = c.chat(None if i % 8 == 0 else chat_id, _message(rng), stream)
+            if status != 200:
+                continue
+            (first if i % 8 == 0 else follow).append(dt * 1000)
+            chat_id = cid
+            if t1 is not None:
+                ttft.append(t1 * 1000)
+        key = "stream" if stream else "json"
+        out[key] = {"new_chat": _summary(first), "chat_by_id": _summary(follow)}
+        out[key]["overhead_p50_ms"] = round(_pct(follow, 50) - floor_ms, 3)
+        if ttft:
+            out[key]["ttft"] = _summary(ttft)
+    return out
+
+def bench_concurrency(base: str, clients: list[int], per_client: int, stream: bool) -> list[dict]:
+    runs = []
+    for n in clients:
+        lat, statuses = [], {}
+        lock = threading.Lock()
+
+        def worker(seed: int):
+            rng = random.Random(seed)
+            c = Client(base)
+            chat_id = None
+            for _ in range(per_client):
+                status, cid, dt, _ = c.chat(chat_id, _message(rng), stream)
+                with lock:
+                    statuses[status] = statuses.get(status, 0) + 1
+                    if status == 200:
+                        lat.append(dt * 1000)
+                        chat_id = cid
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(n) as ex:
+            list(ex.map(worker, range(n)))
+        wall = time.perf_counter() - t0
+        runs.append({"clients": n, "requests": n * per_client, "wall_s": round(wall, 3),
+                     "throughput_rps": round(len(lat) / wall, 2), "status": statuses, **_summary(lat)})
+    return runs
+
+def bench_storage(sizes: list[int], turns: int, probes: int) -> list[dict]:
+    from backend import storage
+    rng = random.Random(2)
+    runs, made = [], []
+    for size in sizes:
+        t0 = time.perf_counter()
+        while len(made) < size:
+            cid = f"bench-{len(made):06d}"
+            storage.create_chat({"id": cid, "user_name": "bench", "ai_name": "Changli", "model": MODEL,
+                                 "history": [{"user": _message(rng), "changli": _message(rng)} for _ in range(turns)],
+                                 "memory_summary": "", "memory_facts": [], "last_updated": storage._now()})
+            made.append(cid)
+        fill = time.perf_counter() - t0
+        sample = [rng.choice(made) for _ in range(probes)]
+        append, load, tail = [], [], []
+        for cid in sample:
+            t = time.perf_counter()
+            storage.append_turn(cid, {"user": _message(rng), "changli": _message(rng)})
+            append.append((time.perf_counter() - t) * 1000)
+            t = time.perf_counter()
+            storage.get_chat(cid)
+            load.append((time.perf_counter() - t) * 1000)
+            t = time.perf_counter()
+            storage.get_turns(cid, max(0, turns - 20))
+            tail.append((time.perf_counter() - t) * 1000)
+        t = time.perf_counter()
+        n = len(storage.list_chats())
+        listing = (time.perf_counter() - t) * 1000
+        runs.append({"chats": size, "chats_in_db": n, "turns_per_chat": turns, "fill_s": round(fill, 3),
+                     "append_turn": _summary(append), "get_chat": _summary(load),
+                     "get_turns_tail": _summary(tail), "list_chats_ms": round(listing, 3)})
+    return runs
+
+def bench_prompt(history: list[int], repeat: int) -> list[dict]:
+    import backend.routes as routes
+    rng = random.Random(3)
+    runs = []
+    for layout in ("window", "stable"):
+        cfg = {"prompt_layout": layout}
+        for n in history:
+            chat = {"history": [{"user": _message(rng), "changli": _message(rng)} for _ in range(n)],
+                    "memory_summary": _message(rng), "memory_facts": [_message(rng) for _ in range(8)]}
+            header = routes._system_header("bench", "Changli", "en_us")
+            ms = []
+            for _ in range(repeat):
+                t = time.perf_counter()
+                if layout == "stable":
+                    routes._build_stable_prompt(cfg, chat, MODEL, header, "", "halo")
+                else:
+                    (routes._prompt_builder(cfg, MODEL)
+                     .add("header", header, 0, required=True)
+                     .add("custom_prompt", "\n", 1)
+                     .add("profile", routes._profile_block(), 2)
+                     .add("memory", routes._build_memory_block(chat), 3)
+                     .add_history("history", routes._recent_turns(chat), "User: halo\nAI:", 4)
+                     .build())
+                ms.append((time.perf_counter() - t) * 1000)
+            runs.append({"layout": layout, "turns": n, **_summary(ms)})
+    return runs
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def _flatten(obj, prefix: str = "") -> dict:
+    out = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            out.update(_flatten(v, f"{prefix}.{k}" if prefix else k))
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            tag = next((f"{k}={v[k]}" for k in ("layout", "clients", "chats") if isinstance(v, dict) and k in v), str(i))
+            if isinstance(v, dict) and "turns" in v and "layout" in v:
+                tag += f",turns={v['turns']}"
+            out.update(_flatten(v, f"{prefix}[{tag}]"))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix] = obj
+    return out
+
+def compare(old: dict, new: dict, threshold: float) -> list[str]:
+    a, b = _flatten(old["results"]), _flatten(new["results"])
+    lines = []
+    for k in sorted(a.keys() & b.keys()):
+        # max is a single sample and sub-50us moves are timer noise
+        if not (k.endswith("_ms") or k.endswith("_rps")) or k.endswith("max_ms") or not a[k]:
+            continue
+        if k.endswith("_ms") and abs(b[k] - a[k]) < 0.05:
+            continue
+        change = (b[k] - a[k]) / a[k]
+        worse = change < 0 if k.endswith("_rps") else change > 0
+        if abs(change) >= threshold:
+            lines.append(f"{'REGRESSION' if worse else 'improved  '} {k}: {a[k]} -> {b[k]} ({change:+.1%})")
+    return lines
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline backend benchmark with a fake inference engine")
+    ap.add_argument("--token-latency", type=float, default=0.002, help="seconds per generated token")
+    ap.add_argument("--tokens", type=int, default=64, help="tokens per reply")
+    ap.add_argument("--requests", type=int, default=48, help="sequential requests per latency run")
+    ap.add_argument("--clients", type=int, nargs="*", default=[1, 4, 16])
+    ap.add_argument("--per-client", type=int, default=8)
+    ap.add_argument("--chats", type=int, nargs="*", default=[100, 1000])
+    ap.add_argument("--turns", type=int, default=40, help="turns per chat in the storage run")
+    ap.add_argument("--history", type=int, nargs="*", default=[8, 64, 512])
+    ap.add_argument("--repeat", type=int, default=50)
+    ap.add_argument("--only", nargs="*", choices=["latency", "concurrency", "storage", "prompt"])
+    ap.add_argument("--store", choices=["sqlite", "files"], default=os.environ.get("CHANG_LI_STORE", "sqlite"),
+                    help="chat store backend")
+    ap.add_argument("--json", help="write results to this file")
+    ap.add_argument("--compare", help="earlier results file to diff against")
+    ap.add_argument("--threshold", type=float, default=0.10, help="relative change reported by --compare")
+    args = ap.parse_args()
+
+    # everything the backend writes goes to a throwaway data dir
+    data_dir = tempfile.mkdtemp(prefix="chang-li-bench-")
+    os.environ["CHANG_LI_DATA"] = data_dir
+    os.environ["CHANG_LI_STORE"] = args.store
+    os.environ.setdefault("CHANG_LI_MAX_CONCURRENT", str(max(args.clients + [4])))
+    os.environ.setdefault("CHANG_LI_MAX_QUEUE", str(max(args.clients + [16])))
+    from backend import ollama_client
+    from backend.core import app
+    import backend.routes  # noqa: F401  (registers the routes)
+
+    engine = FakeEngine(args.token_latency, args.tokens)
+    ollama_client.set_engine(engine)
+    only = set(args.only or ["latency", "concurrency", "storage", "prompt"])
+    results = {}
+    srv, base = start_server(app)
+    try:
+        if "latency" in only:
+            results["latency"] = bench_latency(base, args.requests, engine)
+            for key in ("json", "stream"):
+                r = results["latency"][key]
+                print(f"latency {key:<6} new {r['new_chat']['p50_ms']:>8} ms  follow-up p50 {r['chat_by_id']['p50_ms']:>8} ms"
+                      f"  p95 {r['chat_by_id']['p95_ms']:>8} ms  overhead {r['overhead_p50_ms']} ms")
+        if "concurrency" in only:
+            results["concurrency"] = bench_concurrency(base, args.clients, args.per_client, stream=True)
+            for r in results["concurrency"]:
+                print(f"clients {r['clients']:>3}  {r['throughput_rps']:>8} req/s  p50 {r['p50_ms']:>8} ms"
+                      f"  p95 {r['p95_ms']:>8} ms  status {r['status']}")
+        if "storage" in only:
+            results["storage"] = bench_storage(sorted(args.chats), args.turns, min(args.repeat, 200))
+            for r in results["storage"]:
+                print(f"chats {r['chats']:>6}  append {r['append_turn']['p50_ms']:>7} ms  load {r['get_chat']['p50_ms']:>7} ms"
+                      f"  tail {r['get_turns_tail']['p50_ms']:>7} ms  list {r['list_chats_ms']:>8} ms")
+        if "prompt" in only:
+            results["prompt"] = bench_prompt(args.history, args.repeat)
+            for r in results["prompt"]:
+                print(f"prompt {r['layout']:<6} {r['turns']:>5} turns  p50 {r['p50_ms']:>7} ms  p95 {r['p95_ms']:>7} ms")
+    finally:
+        srv.shutdown()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "meta": {"git": _git_rev(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "args": vars(args)},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    regressions = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        lines = compare(old, report, args.threshold)
+        regressions = sum(l.startswith("REGRESSION") for l in lines)
+        print(f"\ncompared with {args.compare} ({old['meta'].get('git')}):")
+        for l in lines or ["no change beyond threshold"]:
+            print("  " + l)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import os, sys, tempfile
+
+# the backend reads its data dir at import time, so point it at a throwaway
+# directory before anything under backend/ is imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["CHANG_LI_DATA"] = tempfile.mkdtemp(prefix="chang-li-tests-")
+
+import pytest
+from bench.bench_server import FakeEngine, MODEL
+from backend import ollama_client, storage
+from backend.core import app, gate
+import backend.routes as routes
+
+@pytest.fixture(scope="session", autouse=True)
+def engine():
+    eng = FakeEngine(token_latency=0.0, tokens=16)
+    ollama_client.set_engine(eng)
+    routes.PROFILE_PATH = os.path.join(os.environ["CHANG_LI_DATA"], "profile.json")
+    return eng
+
+@pytest.fixture(params=["sqlite", "files"])
+def store(request):
+    storage.set_store(request.param)
+    yield request.param
+    storage.set_store("sqlite")
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+@pytest.fixture
+def model():
+    return MODEL
+
+@pytest.fixture
+def admission():
+    saved = gate.max_concurrent, gate.max_queue
+    yield gate
+    gate.max_concurrent, gate.max_queue = saved
@@ -0,0 +1,49 @@
+import asyncio, json, time
+import pytest
+
+pytest.importorskip("asgiref")
+from backend import asgi
+import backend.routes as routes
+
+async def _request(method: str, path: str, body: dict | None = None) -> tuple[int, float]:
+    # drives the ASGI app directly, the way uvicorn would for one request
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    scope = {"type": "http", "http_version": "1.1", "method": method, "path": path, "root_path": "",
+             "query_string": b"", "scheme": "http", "server": ("127.0.0.1", 5000), "client": ("127.0.0.1", 1),
+             "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())]}
+    sent, status = False, []
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.sleep(3600)
+        sent = True
+        return {"type": "http.request", "body": data, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    t0 = time.perf_counter()
+    await asgi.app(scope, receive, send)
+    return status[0], time.perf_counter() - t0
+
+def test_generations_overlap_and_healthz_answers_at_once(engine, model, admission, monkeypatch):
+    n, one = 3, 0.5
+    monkeypatch.setattr(engine, "token_latency", one / engine.tokens)
+    monkeypatch.setattr(routes.scheduler, "slots", n)
+    admission.max_concurrent = n
+
+    async def run():
+        chats = [asyncio.create_task(_request("POST", "/chat", {"message": f"halo {i}", "model": model}))
+                 for i in range(n)]
+        await asyncio.sleep(0.1)
+        health = await _request("GET", "/healthz")
+        return health, await asyncio.gather(*chats)
+
+    t0 = time.perf_counter()
+    (hstatus, hsecs), chats = asyncio.run(run())
+    wall = time.perf_counter() - t0
+    assert hstatus == 200 and hsecs < 0.2
+    assert [s for s, _ in chats] == [200] * n
+    assert wall < one * 2
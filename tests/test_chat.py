@@ -0,0 +1,122 @@
+import json, threading, time
+from uuid import uuid4
+from backend import storage
+from backend.core import app
+import backend.routes as routes
+
+def _events(body: bytes) -> list[tuple[str, dict]]:
+    out = []
+    for block in body.decode("utf-8").split("\n\n"):
+        lines = block.strip().splitlines()
+        if len(lines) == 2 and lines[0].startswith("event: ") and lines[1].startswith("data: "):
+            out.append((lines[0][7:], json.loads(lines[1][6:])))
+    return out
+
+def _session(title: str) -> dict:
+    return next(s for s in storage.list_sessions() if s["title"] == title)
+
+def test_chat_turns_round_trip(client, model):
+    first = client.post("/chat", json={"message": "halo", "model": model}).get_json()
+    assert first["response"] and [t["user"] for t in first["history"]] == ["halo"]
+    nxt = client.post(f"/chat/{first['chat_id']}", json={"message": "lagi", "model": model,
+                                                         "echo_history": False}).get_json()
+    assert nxt["turn_count"] == 2 and "history" not in nxt
+    echoed = client.post(f"/chat/{first['chat_id']}", json={"message": "dan lagi", "model": model}).get_json()
+    assert [t["user"] for t in echoed["history"]] == ["halo", "lagi", "dan lagi"]
+    assert "history" not in client.post(f"/chat/{first['chat_id']}?history=0", json={}).get_json()
+
+def test_chat_payload_hides_prompt_pins(client, model, monkeypatch):
+    monkeypatch.setattr(routes, "_read_app_config", lambda: {**routes.DEFAULT_CONFIG, "prompt_layout": "stable"})
+    cid = client.post("/chat", json={"message": "halo", "model": model}).get_json()["chat_id"]
+    client.post(f"/chat/{cid}", json={"message": "lagi", "model": model})
+    assert "prompt_anchor" in storage.get_chat(cid, with_history=False)
+    assert not {"prompt_anchor", "prompt_memory", "recall_floor"} & set(client.get(f"/chat/{cid}").get_json())
+
+def test_unknown_model_is_rejected_before_scheduling(client):
+    warm = routes.scheduler.warm_models()
+    r = client.post("/chat", json={"message": "halo", "model": "no-such:model"})
+    assert r.status_code == 400
+    assert routes.scheduler.warm_models() == warm
+
+def test_admission_rejects_with_429_when_full(client, admission, model):
+    admission.max_concurrent, admission.max_queue = 1, 0
+    assert admission.acquire() is None
+    try:
+        r = client.post("/chat", json={"message": "halo", "model": model})
+        assert r.status_code == 429
+        assert int(r.headers["Retry-After"]) >= 1
+        assert client.get("/healthz").status_code == 200
+    finally:
+        admission.release(0.0)
+    assert client.post("/chat", json={"message": "halo", "model": model}).status_code == 200
+
+def test_abort_keeps_the_partial_reply(client, engine, model, monkeypatch):
+    monkeypatch.setattr(engine, "token_latency", 0.01)
+    monkeypatch.setattr(engine, "tokens", 300)
+    rid = uuid4().hex
+    stopper = threading.Timer(0.3, lambda: app.test_client().post(f"/abort/{rid}"))
+    stopper.start()
+    r = client.post("/chat", json={"message": "halo", "model": model, "stream": True, "request_id": rid})
+    stopper.join()
+    kind, done = _events(r.data)[-1]
+    assert kind == "done" and done["aborted"]
+    assert 0 < len(done["response"].split()) < 300
+    assert storage.get_chat(done["chat_id"])["history"][0]["changli"] == done["response"]
+
+def test_abort_unknown_request_is_404(client):
+    assert client.post(f"/abort/{uuid4().hex}").status_code == 404
+
+def test_disconnect_keeps_the_partial_reply(client, engine, model, monkeypatch):
+    monkeypatch.setattr(engine, "token_latency", 0.005)
+    monkeypatch.setattr(engine, "_tokens", lambda prompt: [f"baris {i}\n" for i in range(100)])
+    title = f"putus {uuid4().hex[:8]}"
+    r = client.post("/chat", json={"message": title, "model": model, "stream": True}, buffered=False)
+    it = iter(r.response)
+    assert b"baris 0" in next(it)
+    r.close()
+    saved = storage.get_chat(_session(title)["id"])
+    reply = saved["history"][0]["changli"]
+    assert reply.startswith("baris 0") and len(reply.splitlines()) < 100
+
+def test_first_token_arrives_before_done(client, engine, model, monkeypatch):
+    # a reply with no newline must still stream token by token
+    monkeypatch.setattr(engine, "token_latency", 0.02)
+    t0, seen = time.perf_counter(), {}
+    r = client.post("/chat", json={"message": f"halo {uuid4().hex}", "model": model, "stream": True}, buffered=False)
+    for chunk in r.response:
+        for kind, _ in _events(chunk):
+            seen.setdefault(kind, time.perf_counter() - t0)
+    r.close()
+    assert seen["token"] < seen["done"] / 2
+
+def test_chat_deleted_mid_reply(client, engine, model, monkeypatch):
+    cid = client.post("/chat", json={"message": "halo", "model": model}).get_json()["chat_id"]
+    monkeypatch.setattr(engine, "token_latency", 0.01)
+    deleter = threading.Timer(0.05, lambda: app.test_client().delete(f"/chat/{cid}"))
+    deleter.start()
+    r = client.post(f"/chat/{cid}", json={"message": "lagi", "model": model, "stream": True})
+    deleter.join()
+    kind, done = _events(r.data)[-1]
+    assert kind == "done" and done["error"] == "Chat not found"
+    assert storage.get_chat(cid) is None
+
+    cid = client.post("/chat", json={"message": "halo", "model": model}).get_json()["chat_id"]
+    deleter = threading.Timer(0.05, lambda: app.test_client().delete(f"/chat/{cid}"))
+    deleter.start()
+    r = client.post(f"/chat/{cid}", json={"message": "lagi", "model": model})
+    deleter.join()
+    assert r.status_code == 404 and storage.get_chat(cid) is None
+
+def test_summarize_flag_needs_retrieval_memory(client, model, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(routes.memory_worker, "schedule", lambda chat_id, model: scheduled.append(chat_id))
+    monkeypatch.setattr(routes.vector_worker, "schedule", lambda chat_id, model: None)
+    for enabled, expect in ((False, 1), (True, 0)):
+        cfg = {**routes.DEFAULT_CONFIG, "vector_memory": {"enabled": enabled, "summarize": False, "embedder": "hash"}}
+        monkeypatch.setattr(routes, "_read_app_config", lambda: cfg)
+        chat = {"id": uuid4().hex, "model": model, "history": [{"user": f"u{i}", "changli": f"a{i}"} for i in range(39)]}
+        storage.create_chat(chat)
+        scheduled.clear()
+        assert client.post(f"/chat/{chat['id']}", json={"message": "lagi", "model": model}).status_code == 200
+        assert len(scheduled) == expect
+    routes.vector_memory.configure(None)
@@ -0,0 +1,17 @@
+from backend.core import app
+from bench.bench_server import start_server
+from ui.client import Client
+
+def test_clear_during_stream_keeps_the_new_chat(model):
+    srv, base = start_server(app)
+    try:
+        c = Client(base, model=model)
+        events = c.send_stream("halo")
+        assert next(events)[0] == "token"
+        c.chat_id = None        # the user pressed Clear mid-reply
+        assert [k for k, _ in events][-1] == "done"
+        assert c.chat_id is None
+        list(c.send_stream("halo lagi"))
+        assert c.chat_id
+    finally:
+        srv.shutdown()
@@ -0,0 +1,23 @@
+import os, stat, sys
+import pytest
+from backend.ollama_client import CLIEngine
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="stands in for ollama with a shebang script")
+
+def _ollama(tmp_path, body: str) -> CLIEngine:
+    exe = tmp_path / "ollama"
+    exe.write_text(f"#!{sys.executable}\nimport sys\n{body}\n")
+    exe.chmod(exe.stat().st_mode | stat.S_IXUSR)
+    return CLIEngine(path=str(exe), models_dir=str(tmp_path))
+
+def test_cli_failure_is_an_error_not_a_reply(tmp_path):
+    eng = _ollama(tmp_path, "sys.stdin.read(); sys.stderr.write('Error: model not found'); sys.exit(1)")
+    with pytest.raises(RuntimeError, match="model not found"):
+        eng.generate("halo", "no-such:model")
+    with pytest.raises(RuntimeError, match="exited with code 1"):
+        list(eng.stream("halo", "no-such:model"))
+
+def test_cli_reply(tmp_path):
+    eng = _ollama(tmp_path, "sys.stdout.write('halo ' + sys.stdin.read())")
+    assert eng.generate("juga", "m:1").text == "halo juga"
+    assert "".join(eng.stream("juga", "m:1")) == "halo juga"
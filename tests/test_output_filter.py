@@ -0,0 +1,55 @@
+import json, os, random
+import pytest
+from backend.output_filter import FALLBACK_REPLY, StreamFilter, filter_output
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "filter_corpus.json")
+
+with open(CORPUS, "r", encoding="utf-8") as f:
+    CASES = json.load(f)
+
+def _stream(text: str, rng: random.Random) -> tuple[str, str]:
+    # -> (what the client ends up showing, what finish() settled on)
+    sf, shown, i = StreamFilter(), "", 0
+    while i < len(text):
+        n = rng.randint(1, 6)
+        for kind, chunk in sf.feed(text[i:i + n]):
+            shown = shown + chunk if kind == "append" else chunk
+        i += n
+    final, events = sf.finish()
+    for kind, chunk in events:
+        shown = shown + chunk if kind == "append" else chunk
+    return shown, final
+
+@pytest.mark.parametrize("case", CASES, ids=[c["name"] for c in CASES])
+def test_corpus_batch(case):
+    assert filter_output(case["input"]) == case["expected"]
+
+@pytest.mark.parametrize("case", [c for c in CASES if c["input"]], ids=[c["name"] for c in CASES if c["input"]])
+def test_corpus_stream(case):
+    shown, final = _stream(case["input"], random.Random(0))
+    assert shown == final == case["expected"]
+
+def test_stream_matches_batch_on_random_text():
+    rng = random.Random(1)
+    pieces = ["a", "b", " ", "\n", "`", "```", "\r", "Thinking", "User: x", "(system)", "The user is", "\n\n"]
+    for _ in range(2000):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(1, 30)))
+        shown, final = _stream(text, rng)
+        assert shown == final == filter_output(text), repr(text)
+
+def test_stream_shows_the_partial_line():
+    sf = StreamFilter()
+    assert sf.feed("Halo sa") == [("append", "Halo sa")]
+    assert sf.feed("yang\nThinking...\nApa") == [("append", "yang\nApa")]
+    assert sf.feed(" kabar?") == [("append", " kabar?")]
+    assert sf.finish() == ("Halo sayang\nApa kabar?", [])
+
+def test_stream_takes_back_a_line_that_turns_out_filtered():
+    sf = StreamFilter()
+    assert sf.feed("Oke.\nThe user") == [("append", "Oke.\nThe user")]
+    assert sf.feed(" says hi") == [("reset", "Oke.")]
+    assert sf.feed("\nDah") == [("append", "\nDah")]
+    assert sf.finish() == ("Oke.\nDah", [])
+
+def test_only_meta_falls_back():
+    assert filter_output("Analysis: nothing to say") == FALLBACK_REPLY
@@ -0,0 +1,36 @@
+from uuid import uuid4
+from backend import search, storage
+
+def _chat_with(text: str) -> dict:
+    chat = {"id": str(uuid4()), "user_name": "tester",
+            "history": [{"user": "halo", "changli": "hai"}, {"user": text, "changli": "siap"}]}
+    storage.create_chat(chat)
+    return chat
+
+def test_search_finds_turn_with_highlight(client):
+    word = "zanzibar" + uuid4().hex[:6]
+    chat = _chat_with(f"besok ke {word} ya")
+    out = client.get(f"/search?q={word}").get_json()
+    assert [(r["chat_id"], r["turn"]) for r in out["results"]] == [(chat["id"], 1)]
+    assert f"<b>{word}</b>" in out["results"][0]["snippet"]
+
+def test_search_indexes_appended_turns_and_forgets_deleted_chats():
+    word = "kopitubruk" + uuid4().hex[:6]
+    chat = _chat_with("biasa saja")
+    storage.append_turn(chat["id"], {"user": f"mau {word}", "changli": "oke"})
+    assert [r["turn"] for r in search.search(word)["results"]] == [2]
+    storage.delete_chat(chat["id"])
+    assert search.search(word)["results"] == []
+
+def test_search_escapes_html_and_pages():
+    word = "lumpia" + uuid4().hex[:6]
+    for _ in range(3):
+        _chat_with(f"<i>{word}</i>")
+    first = search.search(word, limit=2)
+    assert first["has_more"] and len(first["results"]) == 2
+    assert "&lt;i&gt;" in first["results"][0]["snippet"]
+    rest = search.search(word, limit=2, offset=first["next_offset"])
+    assert len(rest["results"]) == 1 and not rest["has_more"]
+
+def test_search_rejects_empty_query(client):
+    assert client.get("/search?q=").get_json()["results"] == []
@@ -0,0 +1,68 @@
+from uuid import uuid4
+from backend import storage
+
+def _chat(turns: int = 0) -> dict:
+    return {"id": str(uuid4()), "user_name": "tester", "model": "bench:fake",
+            "history": [{"user": f"pesan {i}", "changli": f"balasan {i}"} for i in range(turns)]}
+
+def test_append_turn_counts_and_keeps_order(store):
+    chat = _chat(1)
+    storage.create_chat(chat)
+    for i in range(1, 5):
+        assert storage.append_turn(chat["id"], {"user": f"pesan {i}", "changli": f"balasan {i}"}) == i + 1
+    got = storage.get_chat(chat["id"])
+    assert got["turn_count"] == 5
+    assert [t["user"] for t in got["history"]] == [f"pesan {i}" for i in range(5)]
+    assert got["title"] == "pesan 0"
+
+def test_append_turn_updates_meta(store):
+    chat = _chat(1)
+    storage.create_chat(chat)
+    storage.append_turn(chat["id"], {"user": "a", "changli": "b"}, model="other:model")
+    assert storage.get_chat(chat["id"], with_history=False)["model"] == "other:model"
+
+def test_get_turns_pages(store):
+    chat = _chat(12)
+    storage.create_chat(chat)
+    assert [t["user"] for t in storage.get_turns(chat["id"], 10)] == ["pesan 10", "pesan 11"]
+    assert [t["user"] for t in storage.get_turns(chat["id"], 3, 5)] == ["pesan 3", "pesan 4"]
+    assert storage.get_turns(chat["id"], 12) == []
+
+def test_history_endpoint_pages_backwards(store, client):
+    chat = _chat(12)
+    storage.create_chat(chat)
+    page = client.get(f"/chat/{chat['id']}?limit=5").get_json()
+    assert (page["start"], page["end"], page["has_more"]) == (7, 12, True)
+    page = client.get(f"/chat/{chat['id']}?before={page['next_before']}&limit=5").get_json()
+    assert [t["user"] for t in page["history"]] == [f"pesan {i}" for i in range(2, 7)]
+    page = client.get(f"/chat/{chat['id']}?before=2&limit=5").get_json()
+    assert (page["start"], page["has_more"], page["next_before"]) == (0, False, None)
+
+def test_list_sessions_newest_first(store):
+    a, b = _chat(1), _chat(1)
+    a["last_updated"], b["last_updated"] = "2001-01-01T00:00:00", "2001-01-01T00:00:01"
+    storage.create_chat(a)
+    storage.create_chat(b)
+    storage.append_turn(a["id"], {"user": "x", "changli": "y"})
+    ids = [s["id"] for s in storage.list_sessions()]
+    assert ids.index(a["id"]) < ids.index(b["id"])
+    assert [s["id"] for s in storage.list_sessions(limit=2, offset=1)] == ids[1:3]
+
+def test_delete_chat(store):
+    chat = _chat(2)
+    storage.create_chat(chat)
+    before = storage.count_chats()
+    assert storage.delete_chat(chat["id"])
+    assert storage.get_chat(chat["id"]) is None
+    assert storage.count_chats() == before - 1
+    assert not storage.delete_chat(chat["id"])
+
+def test_memory_updates_do_not_touch_last_updated(store, client):
+    chat = {**_chat(2), "last_updated": "2001-01-01T00:00:00"}
+    storage.create_chat(chat)
+    assert storage.update_chat(chat["id"], touch=False, memory_summary="ringkasan")
+    assert client.post(f"/chat/{chat['id']}/memory/clear").status_code == 200
+    got = storage.get_chat(chat["id"], with_history=False)
+    assert got["last_updated"] == "2001-01-01T00:00:00" and got["memory_summary"] == ""
+    storage.update_chat(chat["id"], user_name="lain")
+    assert storage.get_chat(chat["id"], with_history=False)["last_updated"] > "2001-01-01T00:00:00"
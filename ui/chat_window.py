@@ -1,21 +1,18 @@
-import os, sys, time, threading, subprocess, json
-from dataclasses import dataclass
-from datetime import datetime
+import os, sys, subprocess, json
 
 from PySide6.QtCore import Qt, QTimer
-from PySide6.QtGui import QColor
 from PySide6.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QListWidget, QListWidgetItem,
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout,
     QFrame, QLabel, QLineEdit, QPushButton, QMessageBox, QDialog, QComboBox,
     QTextEdit
 )
 
 from .client import Client
 from .worker import Worker
-from .widgets.settings import ChatSettings
-from .widgets.history import ChatHistoryDialog
-from .widgets.bubbles import make_tail_pixmap, esc_html
-from .widgets.identity import IdentityDialog
+from .health import HealthMonitor
+from .widgets.chat_view import ChatView, Message
+from .widgets.bubbles import install_app_styles
+from . import startup
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
@@ -23,10 +20,12 @@ os.makedirs(DATA_DIR, exist_ok=True)
 
 API_BASE    = os.environ.get("CHANG_LI_API", "http://127.0.0.1:5000").rstrip("/")
 BACKEND_APP = os.environ.get("CHANG_LI_BACKEND", os.path.join(BASE_DIR, "app.py"))
+SPAWN_BACKEND = os.environ.get("CHANG_LI_SPAWN_BACKEND", "1") != "0"   # app.py sets 0, it runs the backend itself
 
 UI_CFG_FILE   = os.path.join(DATA_DIR, "ui_chat_config.json")
 IDENTITY_FILE = os.path.join(DATA_DIR, "config.json")
-SESS_FILE     = os.path.join(DATA_DIR, "chat_sessions.json")
+
+HISTORY_PAGE = 50
 
 _I18N = {"lang": "en_us", "keys": {}}
 
@@ -41,6 +40,7 @@ _DEFAULT_I18N = {
     "btn.profile": "Profile",
     "btn.clearmem": "Clear Memory",
     "btn.send": "Send",
+    "btn.stop": "Stop",
 
     "label.language": "Language",
     "label.typing": "{ai} is typing",
@@ -64,16 +64,12 @@ def tr(key: str, **fmt):
     except Exception:
         return val
 
-@dataclass
-class Message:
-    role: str
-    text: str
-    ts: datetime
-
 class ChatUI(QWidget):
     def __init__(self):
         super().__init__()
         self.setObjectName("ChatWindow")
+        if QApplication.instance() is not None:
+            install_app_styles(QApplication.instance())
         self.resize(980, 720)
 
         self.ui_config = self._load_json(UI_CFG_FILE, {"bg_mode":"color","bg_color":"#0E1426","bg_image":""})
@@ -85,24 +81,29 @@ class ChatUI(QWidget):
             custom_prompt=self.identity.get("custom_prompt",""),
             ai_name=self.identity.get("ai_name", "AI")
         )
-        cfg = self.client.get_config()
-        self.client.model = cfg.get("default_model", "gemma3:4b")
-
-        self._available_langs = cfg.get("available_languages", ["en_us","id"])
-        self._lang_names = cfg.get("language_names", {
+        # config, i18n and models arrive after the window is up (see _startup)
+        self._available_langs = ["en_us","id"]
+        self._lang_names = {
             "en_us":"English (US)","id":"Bahasa Indonesia","en_gb":"English (UK)",
             "ja":"日本語 (Japanese)","ko":"한국어 (Korean)","zh":"中文（简体）",
             "pt":"Português","es":"Español","ar":"العربية"
-        })
-        _I18N["lang"] = cfg.get("lang", "en_us")
-        self._reload_i18n(_I18N["lang"])
+        }
+        self._config_loaded = False
+        self._spawned = False
 
         self.setWindowTitle(tr("app.title", ai=self.identity.get('ai_name','Changli')))
         self.setStyleSheet("QWidget#ChatWindow{background:#0B0F1A;}")
 
         self.worker = Worker(self.client)
         self.worker.done.connect(self._on_ai)
+        self.worker.chunk.connect(self._on_chunk)
+        self.worker.reset.connect(self._on_reset)
         self.worker.error.connect(self._on_err)
+        self.worker.stopped.connect(self._on_stopped)
+        self.worker.busy.connect(self._set_busy)
+        self._busy = False
+        self._stream_msg = None
+        self._stream_text = ""
 
         root = QVBoxLayout(self); root.setContentsMargins(12,12,12,12); root.setSpacing(8)
 
@@ -120,10 +121,7 @@ class ChatUI(QWidget):
 
         for b in (self.btn_settings, self.btn_history, self.btn_clear, self.btn_profile, self.btn_memclr):
             b.setFixedHeight(28); b.setCursor(Qt.PointingHandCursor)
-            b.setStyleSheet(
-                "QPushButton{background:#1C2238;border:1px solid #2D3550;border-radius:8px;color:#EAF2FF;padding:2px 10px;}"
-                "QPushButton:hover{background:#233054;}"
-            )
+            b.setProperty("role", "toolbar")
 
         top.addWidget(self.title); top.addStretch(1)
         top.addWidget(self.btn_settings); top.addWidget(self.btn_history)
@@ -136,13 +134,12 @@ class ChatUI(QWidget):
         line = QFrame(); line.setFrameShape(QFrame.HLine); line.setStyleSheet("color:#2A314A;")
         root.addWidget(line)
 
-        self.list = QListWidget()
-        self.list.setSpacing(6)
-        self.list.setUniformItemSizes(False)
-        self.list.setWordWrap(True)
-        self.list.setFrameShape(QFrame.NoFrame)
-        self.list.setStyleSheet("QListWidget{background:transparent;border:none;} QListView{background:transparent;border:none;}")
+        self.list = ChatView()
+        self.list.setStyleSheet("QListView{background:transparent;border:none;}")
         self.list.viewport().setAutoFillBackground(False)
+        self.list.verticalScrollBar().valueChanged.connect(self._on_scroll)
+        self._hist_before = None
+        self._hist_loading = False
         root.addWidget(self.list, 1)
 
         self._apply_background(self.ui_config)
@@ -174,7 +171,7 @@ class ChatUI(QWidget):
         self.model_box.activated.connect(self._on_model_activated)
 
         self.btn_send = QPushButton(tr("btn.send")); self.btn_send.setFixedHeight(44)
-        self.btn_send.clicked.connect(self._send)
+        self.btn_send.clicked.connect(self._send_or_stop)
         self.btn_send.setStyleSheet(
             "QPushButton{background:#18233F;border:1px solid #2D3550;border-radius:10px;color:#5CE1E6;font:600 15px 'Inter';padding:8px 18px;}"
             "QPushButton:hover{background:#1C2A4D;}"
@@ -186,29 +183,65 @@ class ChatUI(QWidget):
         bottom.addWidget(self.btn_send, 0)
         root.addLayout(bottom)
 
-        self._health = QTimer(self); self._health.setInterval(1200)
-        self._health.timeout.connect(self._ping); self._health.start()
+        self.health = HealthMonitor(API_BASE)
+        self.health.changed.connect(self._on_health)
         self._typing = QTimer(self); self._typing.setInterval(350)
         self._typing.timeout.connect(self._tick); self._phase=0
 
-        self._load_models()
-
-        self._ensure_backend()
         self._add_msg("ai", f"Halo {self.identity.get('user_name','sayang')}~  Aku {self.identity.get('ai_name','Changli')}. Tulis pesanmu ya...")
 
-        self._ensure_history_state()
         self._apply_i18n_labels()
+        startup.mark("window built")
+        QTimer.singleShot(0, self._startup)
+
+    def _startup(self):
+        # runs once the event loop is up and the window has been shown; nothing
+        # here blocks the GUI thread
+        startup.mark("event loop")
+        startup.expect("backend online", "config + i18n", "models")
+        self.health.start()
+        self.worker.submit(self.client.healthy, on_done=self._on_first_probe, on_error=lambda e: self._on_first_probe(False))
+
+    def _on_first_probe(self, online: bool):
+        if online:
+            self._on_health(True)
+        else:
+            self._ensure_backend()
 
-    def _reload_i18n(self, lang: str):
-        try:
-            data = self.client.get_i18n(lang)
-            _I18N["lang"] = data.get("lang", lang)
-            _I18N["keys"] = data.get("keys", {})
-        except Exception:
-            _I18N["lang"] = lang
-            _I18N["keys"] = {}
+    def _load_backend_data(self):
+        if self._config_loaded:
+            return
+        self._config_loaded = True
+
+        def fetch():
+            cfg = self.client.get_config()
+            return cfg, self.client.get_i18n(cfg.get("lang", "en_us"))
+
+        def failed(e):
+            self._config_loaded = False     # retried when the backend comes online
+            startup.done("config + i18n")
+
+        self.worker.submit(fetch, on_done=self._apply_backend_config, on_error=failed)
+        self._load_models()
+
+    def _apply_backend_config(self, data):
+        cfg, i18n = data
+        self._available_langs = cfg.get("available_languages", self._available_langs)
+        self._lang_names = cfg.get("language_names", self._lang_names)
+        _I18N["lang"] = i18n.get("lang", cfg.get("lang", "en_us"))
+        _I18N["keys"] = i18n.get("keys", {})
+        self._apply_i18n_labels()
+        if self.health.online is not None:
+            self._on_health(self.health.online)     # relabel in the new language
+        startup.done("config + i18n")
+
+    def closeEvent(self, event):
+        self.health.stop()
+        self.worker.shutdown()
+        super().closeEvent(event)
 
     def _apply_i18n_labels(self):
+        self.setWindowTitle(tr("app.title", ai=self.identity.get('ai_name','Changli')))
         self.title.setText(tr("app.title", ai=self.identity.get('ai_name','Changli')))
         self.btn_settings.setText(tr("btn.settings"))
         self.btn_history.setText(tr("btn.history"))
@@ -216,49 +249,58 @@ class ChatUI(QWidget):
         self.btn_profile.setText(tr("btn.profile"))
         self.btn_memclr.setText(tr("btn.clearmem"))
         self.inp.setPlaceholderText(tr("placeholder.input"))
-        self.btn_send.setText(tr("btn.send"))
+        self.btn_send.setText(tr("btn.stop") if self._busy else tr("btn.send"))
 
     def _set_language(self, code: str):
-        try:
-            self.client.set_settings({"lang": code})
-            self._reload_i18n(code)
+        def apply(data):
+            _I18N["lang"] = data.get("lang", code)
+            _I18N["keys"] = data.get("keys", {})
             self._apply_i18n_labels()
             self._system(f"Language set: {code}")
-        except Exception as e:
-            self._system(f"⚠️ Failed to set language: {e}")
+
+        def run():
+            self.client.set_settings({"lang": code})
+            return self.client.get_i18n(code)
+
+        self.worker.submit(run, on_done=apply,
+                           on_error=lambda e: self._system(f"⚠️ Failed to set language: {e}"))
 
     def _load_models(self):
-        try:
-            data = self.client.get_models()
-            models = data.get("models", [])
-            default = data.get("default", self.client.model or "gemma3:4b")
-
-            if isinstance(models, str):
-                models = [models]
-            elif isinstance(models, dict):
-                models = list(models.keys())
-            elif not isinstance(models, (list, tuple)):
-                models = []
-            models = [str(m) for m in models if isinstance(m, (str, bytes)) and str(m).strip()]
+        self.worker.submit(self.client.get_models, on_done=self._apply_models, on_error=self._models_failed)
 
-            self.model_box.blockSignals(True)
-            self.model_box.clear()
-            if models:
-                self.model_box.addItems(models)
-                if default in models:
-                    self.model_box.setCurrentText(default)
-                    self.client.model = default
-                elif self.client.model in models:
-                    self.model_box.setCurrentText(self.client.model)
-            else:
-                self.model_box.addItem(self.client.model or "gemma3:4b")
-            self.model_box.blockSignals(False)
-        except Exception as e:
-            self._system(tr("err.load.models", err=str(e)))
-            self.model_box.blockSignals(True)
-            self.model_box.clear()
+    def _apply_models(self, data):
+        startup.done("models")
+        models = data.get("models", [])
+        default = data.get("default", self.client.model or "gemma3:4b")
+
+        if isinstance(models, str):
+            models = [models]
+        elif isinstance(models, dict):
+            models = list(models.keys())
+        elif not isinstance(models, (list, tuple)):
+            models = []
+        models = [str(m) for m in models if isinstance(m, (str, bytes)) and str(m).strip()]
+
+        self.model_box.blockSignals(True)
+        self.model_box.clear()
+        if models:
+            self.model_box.addItems(models)
+            if default in models:
+                self.model_box.setCurrentText(default)
+                self.client.model = default
+            elif self.client.model in models:
+                self.model_box.setCurrentText(self.client.model)
+        else:
             self.model_box.addItem(self.client.model or "gemma3:4b")
-            self.model_box.blockSignals(False)
+        self.model_box.blockSignals(False)
+
+    def _models_failed(self, e):
+        startup.done("models")
+        self._system(tr("err.load.models", err=str(e)))
+        self.model_box.blockSignals(True)
+        self.model_box.clear()
+        self.model_box.addItem(self.client.model or "gemma3:4b")
+        self.model_box.blockSignals(False)
 
     def _on_model_activated(self, index: int):
         text = self.model_box.itemText(index)
@@ -276,14 +318,16 @@ class ChatUI(QWidget):
         return fallback.copy()
 
     def _save_json(self, path, data):
+        tmp = f"{path}.tmp"
         try:
-            with open(path, "w", encoding="utf-8") as f:
+            with open(tmp, "w", encoding="utf-8") as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp, path)
         except Exception:
             pass
 
     def _apply_background(self, cfg):
-        self.list.setStyleSheet("QListWidget{background:transparent;border:none;} QListView{background:transparent;border:none;}")
+        self.list.setStyleSheet("QListView{background:transparent;border:none;}")
         self.list.viewport().setAutoFillBackground(False)
         if cfg.get("bg_mode") == "image" and cfg.get("bg_image"):
             url = cfg["bg_image"].replace("\\", "/")
@@ -306,7 +350,10 @@ class ChatUI(QWidget):
             self._open_identity_dialog()
 
         def open_language():
-            cfg = self.client.get_config()
+            # the dialog opens once /config arrives; offline it falls back to what is known
+            self.worker.submit(self.client.get_config, on_done=show_language, on_error=lambda e: show_language({}))
+
+        def show_language(cfg):
             langs_detail = cfg.get("available_languages_detail", [])
             if not langs_detail:
                 codes = cfg.get("available_languages", self._available_langs)
@@ -339,6 +386,7 @@ class ChatUI(QWidget):
                 if code and code != current_lang:
                     self._set_language(code)
 
+        from .widgets.settings import ChatSettings
         settings_dialog = ChatSettings(self, self.ui_config,
                                        on_open_identity=open_identity,
                                        on_open_language=open_language)
@@ -348,11 +396,13 @@ class ChatUI(QWidget):
             self._save_json(UI_CFG_FILE, self.ui_config)
 
     def _open_identity_dialog(self):
-        def fetch_default_prompt(user_name: str) -> str:
-            cfg = self.client.get_config()
-            text = cfg.get("custom_prompt", "")
-            return text.replace("{user_name}", user_name or "sayang")
+        def fetch_default_prompt(user_name: str, on_done, on_error):
+            def done(cfg):
+                on_done(cfg.get("custom_prompt", "").replace("{user_name}", user_name or "sayang"))
+            if self.worker.submit(self.client.get_config, on_done=done, on_error=on_error) is None:
+                on_error("Too many pending requests, try again in a moment.")
 
+        from .widgets.identity import IdentityDialog
         dlg = IdentityDialog(self, {
             "ai_name": self.identity.get("ai_name","Changli"),
             "user_name": self.identity.get("user_name","sayang"),
@@ -379,25 +429,25 @@ class ChatUI(QWidget):
         if not self.client.chat_id:
             self._system(tr("err.nochat.clear"))
             return
-        try:
-            self.client.clear_memory(self.client.chat_id)
-            self._system(tr("msg.mem.cleared"))
-        except Exception as e:
-            self._system(f"⚠️ {e}")
+        self.worker.submit(self.client.clear_memory, self.client.chat_id,
+                           on_done=lambda _: self._system(tr("msg.mem.cleared")),
+                           on_error=lambda e: self._system(f"⚠️ {e}"))
 
     def _open_profile_dialog(self):
+        self.btn_profile.setEnabled(False)
+        def show(prof):
+            self.btn_profile.setEnabled(True)
+            self._show_profile_dialog(prof or {})
+        self.worker.submit(self.client.get_profile, on_done=show, on_error=lambda e: show({}))
+
+    def _show_profile_dialog(self, prof: dict):
         dlg = QDialog(self)
         ai_display = (self.identity.get("ai_name") or "AI").strip()
         dlg.setWindowTitle(f"User Profile — {ai_display}")
         lay = QVBoxLayout(dlg); lay.setContentsMargins(12,12,12,12); lay.setSpacing(8)
 
-        about = ""; job = ""
-        try:
-            prof = self.client.get_profile()
-            about = prof.get("about","")
-            job   = prof.get("job","")
-        except Exception:
-            pass
+        about = prof.get("about","")
+        job   = prof.get("job","")
 
         lab1 = QLabel(f"Anything else {ai_display} should know about you?")
         txt_about = QTextEdit(); txt_about.setPlainText(about)
@@ -420,14 +470,14 @@ class ChatUI(QWidget):
         lay.addLayout(btn_row)
 
         if dlg.exec() == QDialog.Accepted:
-            try:
-                self.client.save_profile(txt_about.toPlainText().strip(), in_job.text().strip())
-                self._system("✅ Profile disimpan. (Ingat lintas chat)")
-            except Exception as e:
-                self._system(f"⚠️ Gagal simpan profile: {e}")
+            self.worker.submit(self.client.save_profile, txt_about.toPlainText().strip(), in_job.text().strip(),
+                               on_done=lambda _: self._system("✅ Profile disimpan. (Ingat lintas chat)"),
+                               on_error=lambda e: self._system(f"⚠️ Gagal simpan profile: {e}"))
 
     def _ensure_backend(self):
-        if self.client.healthy(): return
+        # called after the first health probe failed; the monitor keeps probing
+        if self._spawned or not SPAWN_BACKEND: return
+        self._spawned = True
         flags=0
         if os.name=="nt":
             CREATE_NO_WINDOW=0x08000000; DETACHED_PROCESS=0x00000008
@@ -439,42 +489,77 @@ class ChatUI(QWidget):
                              cwd=BASE_DIR)
         except Exception as e:
             QMessageBox.critical(self,"Gagal start backend",str(e)); return
-        t0=time.time()
-        def wait():
-            while time.time()-t0<25:
-                if self.client.healthy(): break
-                time.sleep(0.6)
-        threading.Thread(target=wait, daemon=True).start()
-
-    def _ping(self):
-        online = self.client.healthy()
+        self.health.poke()
+
+    def _on_health(self, online: bool):
+        if online:
+            startup.done("backend online")
+            self._load_backend_data()
         self.status.setText(tr("status.online") if online else tr("status.offline"))
         self.status.setStyleSheet(f"color:{'#5CE1E6' if online else '#FF678A'};font:600 13px 'Inter';")
 
+    def _send_or_stop(self):
+        if self._busy:
+            self.btn_send.setEnabled(False)
+            self.worker.stop_generation()
+        else:
+            self._send()
+
+    def _set_busy(self, on: bool):
+        self._busy = on
+        self.btn_send.setEnabled(True)
+        self.btn_send.setText(tr("btn.stop") if on else tr("btn.send"))
+
     def _send(self):
+        if self._busy: return
         msg = self.inp.text().strip()
         if not msg: return
         self.inp.clear()
         self._add_msg("user", msg)
-        self._record_first_user_title(msg)
-        self.btn_send.setEnabled(False)
         self._set_typing(True)
+        self._stream_msg = None
+        self._stream_text = ""
         self.worker.client = self.client
         self.worker.send(msg)
 
+    def _on_chunk(self, text):
+        if not text: return
+        self._stream_text += text
+        if self._stream_msg is None:
+            self._set_typing(False)
+            self._stream_msg = self._add_msg("ai", self._stream_text)
+        else:
+            self._update_msg(self._stream_msg, self._stream_text)
+
+    def _on_reset(self, text):
+        self._stream_text = ""
+        if self._stream_msg is None:
+            self._on_chunk(text)
+        else:
+            self._stream_text = text
+            self._update_msg(self._stream_msg, text)
+
     def _on_ai(self, role, text):
-        self._maybe_create_session_after_first_ai()
-        self._touch_session_updated()
+        if self.client.chat_id:
+            self.btn_memclr.setEnabled(True)
         self._set_typing(False)
-        self.btn_send.setEnabled(True)
-        self._add_msg(role, text)
+        if self._stream_msg is not None:
+            self._update_msg(self._stream_msg, text)
+            self._stream_msg = None
+        else:
+            self._add_msg(role, text)
 
     def _on_err(self, err):
-        self._touch_session_updated()
         self._set_typing(False)
-        self.btn_send.setEnabled(True)
+        self._stream_msg = None
         self._system(f"⚠️ {err}")
 
+    def _on_stopped(self, text):
+        self._set_typing(False)
+        if self._stream_msg is not None and text:
+            self._update_msg(self._stream_msg, text)
+        self._stream_msg = None
+
     def _set_typing(self, on: bool):
         if on:
             self._phase = 0
@@ -488,159 +573,142 @@ class ChatUI(QWidget):
         dots = "." * (self._phase % 4); self._phase += 1
         self.typ_lbl.setText(tr("label.typing", ai=self.identity.get('ai_name','Changli')) + dots)
 
-    def _load_history(self):
-        try:
-            if os.path.exists(SESS_FILE):
-                with open(SESS_FILE, "r", encoding="utf-8") as f:
-                    return json.load(f)
-        except Exception:
-            pass
-        return {}
-
-    def _save_history(self):
-        try:
-            with open(SESS_FILE, "w", encoding="utf-8") as f:
-                json.dump(self._history, f, indent=2)
-        except Exception:
-            pass
-
     def _load_and_render_history(self, chat_id: str):
-        try:
-            data = self.client.get_history(chat_id)
-            hist = data.get("history", [])
-            self._render_history_list(hist)
-            self._current_session_id = chat_id
-            self.client.chat_id = chat_id
-            self.btn_memclr.setEnabled(True)
-
-            m = data.get("model")
-            if m:
-                if self.model_box.findText(m) == -1:
-                    self.model_box.addItem(m)
-                self.model_box.blockSignals(True)
-                self.model_box.setCurrentText(m)
-                self.model_box.blockSignals(False)
-                self.client.model = m
-
-            self._touch_session_updated()
-            self._system(tr("msg.loaded.history"))
-        except Exception as e:
-            self._system(f"⚠️ Gagal memuat history: {e}")
+        self.worker.submit(self.client.get_history, chat_id, limit=HISTORY_PAGE,
+                           on_done=lambda data: self._show_history(chat_id, data),
+                           on_error=lambda e: self._system(f"⚠️ Gagal memuat history: {e}"))
+
+    def _show_history(self, chat_id: str, data: dict):
+        hist = data.get("history", [])
+        self._hist_before = data.get("next_before")
+        self._render_history_list(hist)
+        self.client.chat_id = chat_id
+        self.btn_memclr.setEnabled(True)
+
+        m = data.get("model")
+        if m:
+            if self.model_box.findText(m) == -1:
+                self.model_box.addItem(m)
+            self.model_box.blockSignals(True)
+            self.model_box.setCurrentText(m)
+            self.model_box.blockSignals(False)
+            self.client.model = m
 
-    def _ensure_history_state(self):
-        if not hasattr(self, "_history"):
-            self._history = self._load_history()
-        if not hasattr(self, "_current_session_id"):
-            self._current_session_id = None
-        if not hasattr(self, "_pending_title"):
-            self._pending_title = None
+        self._system(tr("msg.loaded.history"))
 
     def _start_new_session(self):
         self.client.chat_id = None
-        self._current_session_id = None
-        self._pending_title = None
+        self._hist_before = None
         self.list.clear()
         self._system(tr("msg.newchat"))
         self.btn_memclr.setEnabled(False)
 
-    def _record_first_user_title(self, msg_text: str):
-        if self._current_session_id is None and self.client.chat_id is None:
-            self._pending_title = (msg_text or "").strip()[:36] or "(untitled)"
-
-    def _maybe_create_session_after_first_ai(self):
-        if self._current_session_id is None and self.client.chat_id:
-            sid = self.client.chat_id
-            if sid not in self._history:
-                now = datetime.now().strftime("%Y-%m-%d %H:%M")
-                self._history[sid] = {
-                    "id": sid,
-                    "title": self._pending_title or "(untitled)",
-                    "created": now,
-                    "updated": now
-                }
-                self._current_session_id = sid
-                self._save_history()
-            else:
-                self._current_session_id = sid
-
-            self.btn_memclr.setEnabled(True)
-
-    def _touch_session_updated(self):
-        if getattr(self, "_current_session_id", None) and self._current_session_id in self._history:
-            self._history[self._current_session_id]["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-            self._save_history()
-
-    def _render_history_list(self, hist):
-        self.list.clear()
+    def _history_pairs(self, hist):
+        out = []
         for item in hist:
             try:
                 if isinstance(item, dict):
                     if "user" in item or "changli" in item:
                         u = item.get("user")
                         a = item.get("changli")
-                        if u: self._add_msg("user", str(u))
-                        if a: self._add_msg("ai", str(a))
+                        if u: out.append(("user", str(u)))
+                        if a: out.append(("ai", str(a)))
                     elif "role" in item and "text" in item:
-                        self._add_msg("user" if item["role"]=="user" else "ai", str(item["text"]))
+                        out.append(("user" if item["role"]=="user" else "ai", str(item["text"])))
                     else:
-                        self._add_msg("ai", str(item))
+                        out.append(("ai", str(item)))
                 elif isinstance(item, (list, tuple)) and len(item) >= 2:
                     role, text = item[0], item[1]
-                    self._add_msg("user" if str(role).lower()=="user" else "ai", str(text))
+                    out.append(("user" if str(role).lower()=="user" else "ai", str(text)))
                 else:
-                    self._add_msg("ai", str(item))
+                    out.append(("ai", str(item)))
             except Exception:
                 continue
+        return out
+
+    def _render_history_list(self, hist, prepend: bool = False):
+        pairs = self._history_pairs(hist)
+        if prepend:
+            return self.list.prepend_messages(pairs)
+        self.list.set_messages(pairs)
         self.list.scrollToBottom()
+        return len(pairs)
+
+    def _on_scroll(self, value: int):
+        sb = self.list.verticalScrollBar()
+        if value == sb.minimum() and self._hist_before and not self._hist_loading and self.client.chat_id:
+            self._load_older_history()
+
+    def _load_older_history(self):
+        self._hist_loading = True
+        chat_id = self.client.chat_id
+
+        def show(data):
+            self._hist_loading = False
+            if chat_id != self.client.chat_id:
+                return
+            self._hist_before = data.get("next_before")
+            added = self._render_history_list(data.get("history", []), prepend=True)
+            if added:
+                self.list.scrollTo(self.list.model().index(added, 0), ChatView.PositionAtTop)
+
+        def failed(e):
+            self._hist_loading = False
+            self._system(f"⚠️ Gagal memuat history: {e}")
+
+        job = self.worker.submit(self.client.get_history, chat_id, before=self._hist_before, limit=HISTORY_PAGE,
+                                 on_done=show, on_error=failed)
+        if job is None:
+            self._hist_loading = False
+
+    def _search_history(self, query: str, offset: int, on_done):
+        self.worker.submit(self.client.search, query, offset=offset, on_done=on_done,
+                           on_error=lambda e: on_done({"query": query, "offset": offset, "results": [],
+                                                       "error": str(e)}), kind="search")
+
+    def _rename_chat(self, chat_id: str, title: str, on_done):
+        self.worker.submit(self.client.rename_chat, chat_id, title, on_done=lambda _: on_done(),
+                           on_error=lambda e: self._system(f"⚠️ Gagal mengganti judul: {e}"))
+
+    def _delete_chat(self, chat_id: str, on_done):
+        def done(_):
+            if self.client.chat_id == chat_id:
+                self._start_new_session()
+            on_done()
+        self.worker.submit(self.client.delete_chat, chat_id, on_done=done,
+                           on_error=lambda e: self._system(f"⚠️ Gagal menghapus chat: {e}"))
 
     def _open_history(self):
-        dlg = ChatHistoryDialog(self, self._history.copy())
+        # the session list comes from the backend's index (GET /chats)
+        self.btn_history.setEnabled(False)
+
+        def failed(e):
+            self.btn_history.setEnabled(True)
+            self._system(f"⚠️ Gagal memuat daftar chat: {e}")
+
+        if self.worker.submit(self.client.list_chats, on_done=self._show_history_dialog, on_error=failed) is None:
+            self.btn_history.setEnabled(True)
+
+    def _show_history_dialog(self, sessions: list):
+        self.btn_history.setEnabled(True)
+        from .widgets.history import ChatHistoryDialog
+        dlg = ChatHistoryDialog(self, {s["id"]: s for s in sessions or []}, search_fn=self._search_history,
+                                rename_fn=self._rename_chat, delete_fn=self._delete_chat)
         if dlg.exec() == QDialog.Accepted:
             action = dlg.result_action
-            self._history = dlg.sessions
-            self._save_history()
             if action == "new":
                 self._start_new_session()
             elif action == "open" and dlg.result_id:
-                sid = dlg.result_id
-                if sid in self._history:
-                    self.client.chat_id = sid
-                    self._current_session_id = sid
-                    self._pending_title = None
-                    self._load_and_render_history(sid)
-
-    def _add_msg(self, role: str, text: str):
-        item_widget = QWidget()
-        row = QHBoxLayout(item_widget); row.setContentsMargins(10,2,10,2); row.setSpacing(0)
-
-        stack = QVBoxLayout(); stack.setContentsMargins(0,0,0,0); stack.setSpacing(2)
-        bubble = QFrame(); bubble.setObjectName("bubble")
-        bubble_layout = QVBoxLayout(bubble); bubble_layout.setContentsMargins(12,10,12,8); bubble_layout.setSpacing(4)
-
-        text_lbl = QLabel(); text_lbl.setTextFormat(Qt.RichText)
-        text_lbl.setText(f"<span style=\"font:15px 'Segoe UI','Inter'; line-height:1.5; color:#FFFFFF;\">{esc_html(text)}</span>")
-        text_lbl.setWordWrap(True); text_lbl.setTextInteractionFlags(Qt.TextSelectableByMouse)
-        time_lbl = QLabel(datetime.now().strftime("%H:%M")); time_lbl.setStyleSheet("color:#9AA7BF;font:12px 'Inter';"); time_lbl.setAlignment(Qt.AlignRight)
-        bubble_layout.addWidget(text_lbl); bubble_layout.addWidget(time_lbl)
-
-        if role == "user":
-            col = QColor(37, 98, 122, 230)
-            bubble.setStyleSheet("QFrame#bubble{background:rgba(37,98,122,0.90);border:1px solid rgba(255,255,255,0.06);border-radius:18px 18px 8px 18px;}")
-            tail = QLabel(); tail.setPixmap(make_tail_pixmap("right", col)); tail.setFixedSize(16,12)
-            stack.addWidget(bubble, 0, Qt.AlignRight); stack.addWidget(tail, 0, Qt.AlignRight)
-            row.addStretch(1); row.addLayout(stack, 0)
-        else:
-            col = QColor(20, 28, 48, 235)
-            bubble.setStyleSheet("QFrame#bubble{background:rgba(20,28,48,0.92);border:1px solid rgba(255,255,255,0.06);border-radius:18px 18px 18px 8px;}")
-            tail = QLabel(); tail.setPixmap(make_tail_pixmap("left", col)); tail.setFixedSize(16,12)
-            stack.addWidget(bubble, 0, Qt.AlignLeft); stack.addWidget(tail, 0, Qt.AlignLeft)
-            row.addLayout(stack, 0); row.addStretch(1)
-
-        item = QListWidgetItem(); item.setSizeHint(item_widget.sizeHint())
-        self.list.addItem(item); self.list.setItemWidget(item, item_widget)
+                self._load_and_render_history(dlg.result_id)
+
+    def _add_msg(self, role: str, text: str, row: int | None = None, scroll: bool = True) -> Message:
+        msg = self.list.add_message(role, text, row)
+        if scroll: self.list.scrollToBottom()
+        return msg
+
+    def _update_msg(self, msg: Message, text: str):
+        self.list.update_message(msg, text)
         self.list.scrollToBottom()
 
     def _system(self, text):
-        item = QListWidgetItem(f"   {text}")
-        item.setForeground(QColor("#A5AFBF"))
-        self.list.addItem(item); self.list.scrollToBottom()
+        self._add_msg("system", text)
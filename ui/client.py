@@ -1,10 +1,28 @@
-import requests
+import json, threading
+from uuid import uuid4
+
+# (connect, read) seconds; for streams the read timeout is the longest gap between tokens
+TIMEOUTS = {
+    "health":  0.8,
+    "default": (3, 10),
+    "models":  (3, 8),
+    "history": (3, 15),
+    "send":    (5, 320),
+    "stream":  (5, 90),
+    "abort":   (2, 5),
+}
+
+class Cancelled(Exception):
+    pass
 
 class Client:
-    def __init__(self, base: str, user_name: str = "sayang", custom_prompt: str = "", ai_name: str = "Changli", model: str = "gemma3:4b"):
+    def __init__(self, base: str, user_name: str = "sayang", custom_prompt: str = "", ai_name: str = "Changli",
+                 model: str = "gemma3:4b", timeouts: dict | None = None):
         self.base = base.rstrip("/")
-        self.sess = requests.Session()
-        self.chat_id = None
+        self._local = threading.local()
+        self.timeouts = {**TIMEOUTS, **(timeouts or {})}
+        self._chat_id = None
+        self._switches = 0
         self.user_name = user_name
         self.custom_prompt = custom_prompt
         self.ai_name = ai_name
@@ -18,36 +36,64 @@ class Client:
         if model is not None:
             self.model = model
 
-    def healthy(self, timeout=0.8) -> bool:
+    @property
+    def chat_id(self):
+        return self._chat_id
+
+    @chat_id.setter
+    def chat_id(self, value):
+        # every switch (Clear, opening another chat) is counted, so a reply that
+        # finishes afterwards cannot switch the window back to its own chat
+        self._chat_id = value
+        self._switches += 1
+
+    @property
+    def sess(self):
+        # requests.Session is not thread-safe; each executor thread gets its own.
+        # requests is imported on first use, off the GUI thread, to keep startup short
+        s = getattr(self._local, "sess", None)
+        if s is None:
+            import requests
+            s = self._local.sess = requests.Session()
+        return s
+
+    def _timeout(self, kind: str, timeout=None):
+        return timeout if timeout is not None else self.timeouts.get(kind, self.timeouts["default"])
+
+    def healthy(self, timeout=None) -> bool:
         try:
-            r = self.sess.get(self.base + "/config", timeout=timeout)
+            r = self.sess.get(self.base + "/healthz", timeout=self._timeout("health", timeout))
             return r.ok
         except Exception:
             return False
 
-    def get_config(self, timeout=5):
-        r = self.sess.get(self.base + "/config", timeout=timeout)
+    def get_config(self, timeout=None):
+        r = self.sess.get(self.base + "/config", timeout=self._timeout("default", timeout))
         r.raise_for_status()
         return r.json()
     
-    def get_models(self, timeout=8):
-        r = self.sess.get(self.base + "/models", timeout=timeout)
+    def get_models(self, timeout=None):
+        r = self.sess.get(self.base + "/models", timeout=self._timeout("models", timeout))
         r.raise_for_status()
         return r.json()
 
-    def send(self, text: str, timeout=320) -> str:
+    def send(self, text: str, timeout=None) -> str:
+        timeout = self._timeout("send", timeout)
         payload = {
             "message": text,
             "user_name": self.user_name,
             "custom_prompt": self.custom_prompt,
             "ai_name": self.ai_name,
             "model" : self.model,
+            "echo_history": False,
         }
         if not self.chat_id:
+            switches = self._switches
             r = self.sess.post(self.base + "/chat", json=payload, timeout=timeout)
             r.raise_for_status()
             data = r.json()
-            self.chat_id = data.get("chat_id")
+            if self._switches == switches:
+                self.chat_id = data.get("chat_id")
             self.model = data.get("model", self.model)
             return data.get("response", "")
         else:
@@ -57,34 +103,116 @@ class Client:
             self.model = data.get("model", self.model)
             return data.get("response", "")
 
-    def get_history(self, chat_id: str, timeout=15):
-        r = self.sess.get(self.base + f"/chat/{chat_id}", timeout=timeout)
+    def send_stream(self, text: str, timeout=None, request_id: str | None = None, cancelled=None, on_open=None):
+        # request_id lets abort() stop the generation server-side; cancelled is
+        # an optional threading.Event that drops the connection client-side;
+        # on_open receives the response so another thread can close() it mid-read
+        timeout = self._timeout("stream", timeout)
+        payload = {
+            "message": text,
+            "user_name": self.user_name,
+            "custom_prompt": self.custom_prompt,
+            "ai_name": self.ai_name,
+            "model" : self.model,
+            "stream": True,
+            "echo_history": False,
+            "request_id": request_id or uuid4().hex,
+        }
+        # a new chat's id is only adopted if the user has not switched chats
+        # or pressed Clear while the reply was streaming
+        started, switches = self.chat_id, self._switches
+        url = self.base + (f"/chat/{started}" if started else "/chat")
+        headers = {"Accept": "text/event-stream"}
+        with self.sess.post(url, json=payload, timeout=timeout, stream=True, headers=headers) as r:
+            r.raise_for_status()
+            if on_open is not None:
+                on_open(r)
+            event, data_lines = "message", []
+            for line in r.iter_lines(decode_unicode=True):
+                if cancelled is not None and cancelled.is_set():
+                    raise Cancelled("request cancelled")
+                if line is None:
+                    continue
+                if line == "":
+                    if data_lines:
+                        data = json.loads("\n".join(data_lines))
+                        if event == "token":
+                            yield "token", data.get("t", "")
+                        elif event == "reset":
+                            yield "reset", data.get("text", "")
+                        elif event == "done":
+                            if data.get("error"):
+                                raise RuntimeError(data["error"])
+                            if data.get("chat_id") and self._switches == switches:
+                                self.chat_id = data["chat_id"]
+                            self.model = data.get("model", self.model)
+                            yield "done", data.get("response", "")
+                            return
+                        elif event == "error":
+                            raise RuntimeError(data.get("error", "stream error"))
+                    event, data_lines = "message", []
+                elif line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data_lines.append(line[5:].lstrip())
+        raise RuntimeError("stream ended before reply was complete")
+
+    def get_history(self, chat_id: str, before: int | None = None, limit: int | None = None,
+                    since_turn: int | None = None, timeout=None):
+        params = {k: v for k, v in (("before", before), ("limit", limit), ("since_turn", since_turn)) if v is not None}
+        r = self.sess.get(self.base + f"/chat/{chat_id}", params=params, timeout=self._timeout("history", timeout))
         r.raise_for_status()
         return r.json() 
     
-    def get_profile(self, timeout=8):
-        r = self.sess.get(self.base + "/profile", timeout=timeout)
+    def search(self, q: str, limit: int = 20, offset: int = 0, timeout=None):
+        params = {"q": q, "limit": limit, "offset": offset}
+        r = self.sess.get(self.base + "/search", params=params, timeout=self._timeout("history", timeout))
+        r.raise_for_status()
+        return r.json()
+
+    def list_chats(self, limit: int | None = None, offset: int = 0, timeout=None):
+        params = {"offset": offset} if limit is None else {"limit": limit, "offset": offset}
+        r = self.sess.get(self.base + "/chats", params=params, timeout=self._timeout("history", timeout))
+        r.raise_for_status()
+        return r.json()
+
+    def rename_chat(self, chat_id: str, title: str, timeout=None):
+        r = self.sess.patch(self.base + f"/chat/{chat_id}", json={"title": title}, timeout=self._timeout("default", timeout))
         r.raise_for_status()
         return r.json()
 
-    def save_profile(self, about: str, job: str, facts: list[str] | None = None, timeout=10):
+    def delete_chat(self, chat_id: str, timeout=None):
+        r = self.sess.delete(self.base + f"/chat/{chat_id}", timeout=self._timeout("default", timeout))
+        r.raise_for_status()
+        return r.json()
+
+    def get_profile(self, timeout=None):
+        r = self.sess.get(self.base + "/profile", timeout=self._timeout("default", timeout))
+        r.raise_for_status()
+        return r.json()
+
+    def save_profile(self, about: str, job: str, facts: list[str] | None = None, timeout=None):
         payload = {"about": about, "job": job}
         if facts is not None: payload["facts"] = facts
-        r = self.sess.post(self.base + "/profile", json=payload, timeout=timeout)
+        r = self.sess.post(self.base + "/profile", json=payload, timeout=self._timeout("default", timeout))
         r.raise_for_status()
         return r.json()
 
-    def clear_memory(self, chat_id: str, timeout=8):
-        r = self.sess.post(self.base + f"/chat/{chat_id}/memory/clear", timeout=timeout)
+    def clear_memory(self, chat_id: str, timeout=None):
+        r = self.sess.post(self.base + f"/chat/{chat_id}/memory/clear", timeout=self._timeout("default", timeout))
         r.raise_for_status()
         return r.json()
 
-    def get_i18n(self, lang: str, timeout=5):
-        r = self.sess.get(self.base + f"/i18n/{(lang or 'en_us').lower()}", timeout=timeout)
+    def get_i18n(self, lang: str, timeout=None):
+        r = self.sess.get(self.base + f"/i18n/{(lang or 'en_us').lower()}", timeout=self._timeout("default", timeout))
         r.raise_for_status()
         return r.json()
 
-    def set_settings(self, patch: dict, timeout=5):
-        r = self.sess.post(self.base + "/settings", json=(patch or {}), timeout=timeout)
+    def set_settings(self, patch: dict, timeout=None):
+        r = self.sess.post(self.base + "/settings", json=(patch or {}), timeout=self._timeout("default", timeout))
         r.raise_for_status()
         return r.json()
+
+    def abort(self, request_id: str, timeout=None) -> bool:
+        r = self.sess.post(self.base + f"/abort/{request_id}", timeout=self._timeout("abort", timeout))
+        return r.ok
@@ -0,0 +1,60 @@
+import threading, time
+from PySide6.QtCore import QObject, Signal
+
+class HealthMonitor(QObject):
+    # probes /healthz off the GUI thread; interval backs off while the backend is down
+    changed = Signal(bool)
+    checked = Signal(bool, float)
+
+    INTERVAL = 1.2
+    MAX_INTERVAL = 10.0
+    TIMEOUT = 0.8
+
+    def __init__(self, base: str, interval: float = INTERVAL, max_interval: float = MAX_INTERVAL):
+        super().__init__()
+        self.base = base.rstrip("/")
+        self.interval = interval
+        self.max_interval = max_interval
+        self.online = None
+        self._sess = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="health-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def poke(self):
+        # probe now and drop any backoff, e.g. right after spawning the backend
+        self._wake.set()
+
+    def probe(self) -> bool:
+        try:
+            if self._sess is None:      # first probe, on the monitor thread
+                import requests
+                self._sess = requests.Session()
+            return self._sess.get(self.base + "/healthz", timeout=self.TIMEOUT).ok
+        except Exception:
+            return False
+
+    def _loop(self):
+        delay = self.interval
+        while not self._stop.is_set():
+            t0 = time.monotonic()
+            ok = self.probe()
+            if self._stop.is_set():
+                break
+            self.checked.emit(ok, time.monotonic() - t0)
+            if ok != self.online:
+                self.online = ok
+                self.changed.emit(ok)
+            delay = self.interval if ok else min(self.max_interval, delay * 2)
+            if self._wake.wait(delay):
+                self._wake.clear()
+                delay = self.interval
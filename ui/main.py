@@ -1,17 +1,33 @@
 import sys, os
-from PySide6.QtWidgets import QApplication
-from PySide6.QtCore import Qt
 
 if __package__ is None or __package__ == "":
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from ui.chat_window import ChatUI
+    from ui import startup
 else:
-    from .chat_window import ChatUI
+    from . import startup
+
+PROFILE_FLAG = "--profile-startup"
+PROFILE_TIMEOUT_MS = 30000      # report whatever finished by then
 
 def main():
+    if PROFILE_FLAG in sys.argv:
+        sys.argv.remove(PROFILE_FLAG)
+        startup.enable("ui.main")
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtCore import QTimer
+    startup.mark("import Qt")
     app = QApplication(sys.argv)
+    startup.mark("QApplication")
+    if __package__ is None or __package__ == "":
+        from ui.chat_window import ChatUI
+    else:
+        from .chat_window import ChatUI
+    startup.mark("import chat_window")
     ui = ChatUI()
     ui.show()
+    startup.mark("window shown")
+    if startup.enabled:
+        QTimer.singleShot(PROFILE_TIMEOUT_MS, startup.report)
     sys.exit(app.exec())
 
 if __name__ == "__main__":
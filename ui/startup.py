@@ -0,0 +1,49 @@
+import sys, time
+
+# Startup timing for `--profile-startup` (ui.main and app.py). mark() is a
+# no-op until enable() is called, so the marks stay in place. Phases that
+# finish after the window is up (config, models, backend online) are declared
+# with expect() and the breakdown is printed once they are all done().
+
+T0 = time.perf_counter()
+
+enabled = False
+_marks: list[tuple[str, float]] = []
+_waiting: set[str] = set()
+_reported = False
+
+def enable(label: str = "startup"):
+    global enabled
+    enabled = True
+    _marks.append((label, T0))
+
+def mark(name: str):
+    if enabled:
+        _marks.append((name, time.perf_counter()))
+
+def expect(*names: str):
+    if enabled:
+        _waiting.update(names)
+
+def done(name: str):
+    if not enabled or name not in _waiting:
+        return
+    mark(name)
+    _waiting.discard(name)
+    if not _waiting:
+        report()
+
+def report(file=None):
+    global _reported
+    if not enabled or _reported:
+        return
+    _reported = True
+    out = file or sys.stderr
+    print(f"{'phase':<28} {'step ms':>9} {'total ms':>9}", file=out)
+    prev = T0
+    for name, t in _marks[1:]:
+        print(f"{name:<28} {(t - prev) * 1000:>9.1f} {(t - T0) * 1000:>9.1f}", file=out)
+        prev = t
+    if _waiting:
+        print(f"still pending: {', '.join(sorted(_waiting))}", file=out)
+    out.flush()
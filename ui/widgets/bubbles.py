@@ -1,9 +1,31 @@
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QPixmap, QPainter, QPainterPath, QColor
 
-def make_tail_pixmap(side: str, color: QColor) -> QPixmap:
-    w, h = 16, 12
-    pm = QPixmap(w, h); pm.fill(Qt.transparent)
+TAIL_W, TAIL_H = 16, 12
+
+BUBBLE_COLORS = {
+    "user": QColor(37, 98, 122, 230),
+    "ai":   QColor(20, 28, 48, 235),
+}
+
+# one stylesheet for the whole app; widgets pick a rule with setProperty("role", ...)
+# instead of carrying their own sheet, so Qt resolves each rule once
+APP_STYLES = (
+    "QPushButton[role=\"toolbar\"]{background:#1C2238;border:1px solid #2D3550;border-radius:8px;color:#EAF2FF;padding:2px 10px;}"
+    "QPushButton[role=\"toolbar\"]:hover{background:#233054;}"
+)
+
+_installed = set()
+
+def install_app_styles(app) -> None:
+    if id(app) in _installed:
+        return
+    app.setStyleSheet((app.styleSheet() or "") + APP_STYLES)
+    _installed.add(id(app))
+
+def make_tail_pixmap(side: str, color: QColor, dpr: float = 1.0) -> QPixmap:
+    w, h = TAIL_W, TAIL_H
+    pm = QPixmap(round(w * dpr), round(h * dpr)); pm.setDevicePixelRatio(dpr); pm.fill(Qt.transparent)
     p = QPainter(pm); p.setRenderHints(QPainter.Antialiasing, True)
     p.setBrush(color); p.setPen(Qt.NoPen)
     path = QPainterPath()
@@ -20,10 +42,15 @@ def make_tail_pixmap(side: str, color: QColor) -> QPixmap:
     p.drawPath(path); p.end()
     return pm
 
-def esc_html(s: str) -> str:
-    return (
-        s.replace("&","&amp;")
-         .replace("<","&lt;")
-         .replace(">","&gt;")
-         .replace("\n","<br>")
-    )
+_tails: dict[tuple, QPixmap] = {}
+
+def tail_pixmap(side: str, color: QColor, dpr: float = 1.0) -> QPixmap:
+    # only a couple of (side, color) pairs exist, one per screen scale
+    key = (side, color.rgba(), round(dpr, 2))
+    pm = _tails.get(key)
+    if pm is None:
+        pm = _tails[key] = make_tail_pixmap(side, color, dpr)
+    return pm
+
+def clear_tail_cache() -> None:
+    _tails.clear()
@@ -0,0 +1,259 @@
+import itertools
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, QPointF, QRectF, QSize
+from PySide6.QtGui import QColor, QFont, QFontMetrics, QPainter, QPainterPath, QPen, QTextLayout, QTextOption, QGuiApplication
+from PySide6.QtWidgets import QListView, QStyledItemDelegate, QAbstractItemView, QMenu, QFrame
+
+from .bubbles import tail_pixmap, BUBBLE_COLORS, TAIL_W, TAIL_H
+
+_uids = itertools.count(1)
+
+@dataclass
+class Message:
+    role: str
+    text: str
+    ts: datetime = field(default_factory=datetime.now)
+    uid: int = field(default_factory=lambda: next(_uids))
+    rev: int = 0
+
+MessageRole = Qt.UserRole + 1
+
+class ChatListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows: list[Message] = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not (0 <= index.row() < len(self._rows)):
+            return None
+        msg = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return msg.text
+        if role == MessageRole:
+            return msg
+        return None
+
+    def message(self, row: int) -> Message:
+        return self._rows[row]
+
+    def insert_messages(self, row: int, msgs: list[Message]):
+        if not msgs:
+            return
+        row = max(0, min(row, len(self._rows)))
+        self.beginInsertRows(QModelIndex(), row, row + len(msgs) - 1)
+        self._rows[row:row] = msgs
+        self.endInsertRows()
+
+    def append(self, msg: Message) -> Message:
+        self.insert_messages(len(self._rows), [msg])
+        return msg
+
+    def update_text(self, msg: Message, text: str) -> QModelIndex | None:
+        # streamed replies are almost always the last row
+        if self._rows and self._rows[-1] is msg:
+            row = len(self._rows) - 1
+        else:
+            row = next((i for i, m in enumerate(self._rows) if m is msg), None)
+            if row is None:
+                return None
+        msg.text = text
+        msg.rev += 1
+        idx = self.index(row)
+        self.dataChanged.emit(idx, idx, [Qt.DisplayRole])
+        return idx
+
+    def clear(self):
+        self.beginResetModel()
+        self._rows = []
+        self.endResetModel()
+
+class BubbleDelegate(QStyledItemDelegate):
+    MAX_RATIO = 0.72
+    MARGIN_X, MARGIN_Y = 10, 2
+    PAD_L, PAD_T, PAD_R, PAD_B = 12, 10, 12, 8
+    GAP = 4
+    TAIL_GAP = 2
+    CACHE_SIZE = 1024
+
+    COLORS = BUBBLE_COLORS
+    BORDER = QColor(255, 255, 255, 15)
+    TEXT   = QColor("#FFFFFF")
+    TIME   = QColor("#9AA7BF")
+    SYSTEM = QColor("#A5AFBF")
+
+    def __init__(self, view: QListView):
+        super().__init__(view)
+        self.view = view
+        self.font = QFont(); self.font.setFamilies(["Segoe UI", "Inter"]); self.font.setPixelSize(15)
+        self.time_font = QFont(); self.time_font.setFamilies(["Inter"]); self.time_font.setPixelSize(12)
+        self.sys_font = QFont(view.font())
+        self._time_fm = QFontMetrics(self.time_font)
+        self._layouts: OrderedDict[tuple, tuple] = OrderedDict()
+
+    def _max_text_width(self) -> int:
+        w = self.view.viewport().width() if self.view is not None else 600
+        return max(80, int(w * self.MAX_RATIO) - self.PAD_L - self.PAD_R - 2 * self.MARGIN_X)
+
+    def _layout(self, msg: Message, width: int) -> tuple:
+        key = (msg.uid, msg.rev, width)
+        hit = self._layouts.get(key)
+        if hit is not None:
+            self._layouts.move_to_end(key)
+            return hit
+        font = self.sys_font if msg.role == "system" else self.font
+        text = ("   " + msg.text if msg.role == "system" else msg.text).replace("\n", "\u2028")
+        layout = QTextLayout(text, font)
+        opt = QTextOption(); opt.setWrapMode(QTextOption.WrapAtWordBoundaryOrAnywhere)
+        layout.setTextOption(opt)
+        leading = QFontMetrics(font).lineSpacing() * 0.25
+        y, natural = 0.0, 0.0
+        layout.beginLayout()
+        while True:
+            line = layout.createLine()
+            if not line.isValid():
+                break
+            line.setLineWidth(width)
+            line.setPosition(QPointF(0, y))
+            y += line.height() + leading
+            natural = max(natural, line.naturalTextWidth())
+        layout.endLayout()
+        hit = (layout, natural, max(0.0, y - leading))
+        self._layouts[key] = hit
+        while len(self._layouts) > self.CACHE_SIZE:
+            self._layouts.popitem(last=False)
+        return hit
+
+    def _bubble_size(self, msg: Message) -> tuple[int, int, tuple]:
+        lay = self._layout(msg, self._max_text_width())
+        _, natural, text_h = lay
+        time_w = self._time_fm.horizontalAdvance(msg.ts.strftime("%H:%M"))
+        w = int(max(natural, time_w)) + self.PAD_L + self.PAD_R + 1
+        h = int(text_h) + self.GAP + self._time_fm.height() + self.PAD_T + self.PAD_B + 1
+        return w, h, lay
+
+    def sizeHint(self, option, index):
+        msg = index.data(MessageRole)
+        if msg is None:
+            return QSize(0, 0)
+        width = self.view.viewport().width()
+        if msg.role == "system":
+            _, _, text_h = self._layout(msg, max(80, width - 2 * self.MARGIN_X))
+            return QSize(width, int(text_h) + 2 * self.MARGIN_Y + 4)
+        _, h, _ = self._bubble_size(msg)
+        return QSize(width, h + self.TAIL_GAP + TAIL_H + 2 * self.MARGIN_Y)
+
+    def _bubble_path(self, r: QRectF, user: bool) -> QPainterPath:
+        big, small = 18.0, 8.0
+        bl, br = (big, small) if user else (small, big)
+        path = QPainterPath()
+        path.moveTo(r.left() + big, r.top())
+        path.lineTo(r.right() - big, r.top())
+        path.arcTo(r.right() - 2 * big, r.top(), 2 * big, 2 * big, 90, -90)
+        path.lineTo(r.right(), r.bottom() - br)
+        path.arcTo(r.right() - 2 * br, r.bottom() - 2 * br, 2 * br, 2 * br, 0, -90)
+        path.lineTo(r.left() + bl, r.bottom())
+        path.arcTo(r.left(), r.bottom() - 2 * bl, 2 * bl, 2 * bl, 270, -90)
+        path.lineTo(r.left(), r.top() + big)
+        path.arcTo(r.left(), r.top(), 2 * big, 2 * big, 180, -90)
+        path.closeSubpath()
+        return path
+
+    def paint(self, painter: QPainter, option, index):
+        msg = index.data(MessageRole)
+        if msg is None:
+            return
+        rect = option.rect
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        if msg.role == "system":
+            layout, _, _ = self._layout(msg, max(80, self.view.viewport().width() - 2 * self.MARGIN_X))
+            painter.setPen(self.SYSTEM)
+            layout.draw(painter, QPointF(rect.left() + self.MARGIN_X, rect.top() + self.MARGIN_Y + 2))
+            painter.restore()
+            return
+
+        user = msg.role == "user"
+        w, h, (layout, _, text_h) = self._bubble_size(msg)
+        x = rect.right() - self.MARGIN_X - w if user else rect.left() + self.MARGIN_X
+        bubble = QRectF(x, rect.top() + self.MARGIN_Y, w, h)
+
+        painter.setPen(QPen(self.BORDER, 1))
+        painter.setBrush(self.COLORS["user" if user else "ai"])
+        painter.drawPath(self._bubble_path(bubble.adjusted(0.5, 0.5, -0.5, -0.5), user))
+
+        painter.setPen(self.TEXT)
+        layout.draw(painter, QPointF(bubble.left() + self.PAD_L, bubble.top() + self.PAD_T))
+
+        painter.setFont(self.time_font)
+        painter.setPen(self.TIME)
+        time_rect = QRectF(bubble.left() + self.PAD_L, bubble.top() + self.PAD_T + text_h + self.GAP,
+                           w - self.PAD_L - self.PAD_R, self._time_fm.height())
+        painter.drawText(time_rect, Qt.AlignRight | Qt.AlignVCenter, msg.ts.strftime("%H:%M"))
+
+        dpr = painter.device().devicePixelRatioF() if painter.device() else 1.0
+        tail = tail_pixmap("right" if user else "left", self.COLORS["user" if user else "ai"], dpr)
+        tx = bubble.right() - TAIL_W if user else bubble.left()
+        painter.drawPixmap(QPointF(tx, bubble.bottom() + self.TAIL_GAP), tail)
+        painter.restore()
+
+class ChatView(QListView):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._model = ChatListModel(self)
+        self._delegate = BubbleDelegate(self)
+        self.setModel(self._model)
+        self.setItemDelegate(self._delegate)
+        self.setUniformItemSizes(False)
+        self.setWordWrap(True)
+        self.setSpacing(3)
+        self.setResizeMode(QListView.Adjust)
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(200)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setFocusPolicy(Qt.NoFocus)
+        self.setFrameShape(QFrame.NoFrame)
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(self._context_menu)
+
+    def chat_model(self) -> ChatListModel:
+        return self._model
+
+    def add_message(self, role: str, text: str, row: int | None = None) -> Message:
+        msg = Message(role, text)
+        self._model.insert_messages(self._model.rowCount() if row is None else row, [msg])
+        return msg
+
+    def prepend_messages(self, pairs: list[tuple[str, str]]) -> int:
+        msgs = [Message(role, text) for role, text in pairs]
+        self._model.insert_messages(0, msgs)
+        return len(msgs)
+
+    def set_messages(self, pairs: list[tuple[str, str]]):
+        self._model.beginResetModel()
+        self._model._rows = [Message(role, text) for role, text in pairs]
+        self._model.endResetModel()
+
+    def update_message(self, msg: Message, text: str):
+        idx = self._model.update_text(msg, text)
+        if idx is not None:
+            self._delegate.sizeHintChanged.emit(idx)
+
+    def clear(self):
+        self._model.clear()
+
+    def _context_menu(self, pos):
+        idx = self.indexAt(pos)
+        if not idx.isValid():
+            return
+        menu = QMenu(self)
+        act = menu.addAction("Copy")
+        if menu.exec(self.viewport().mapToGlobal(pos)) == act:
+            QGuiApplication.clipboard().setText(idx.data(Qt.DisplayRole) or "")
@@ -1,23 +1,51 @@
-from datetime import datetime
-from PySide6.QtCore import Qt
+from html import escape
+from PySide6.QtCore import Qt, QTimer
 from PySide6.QtWidgets import (
-    QDialog, QVBoxLayout, QListWidget, QListWidgetItem, 
+    QDialog, QVBoxLayout, QListWidget, QListWidgetItem, QLabel, QLineEdit,
     QHBoxLayout, QPushButton, QDialogButtonBox, QInputDialog, QMessageBox
 )
 
+MORE = "__more__"
+
+def _when(ts: str) -> str:
+    # backend timestamps are ISO seconds; minutes are enough here
+    return (ts or "").replace("T", " ")[:16]
+
 class ChatHistoryDialog(QDialog):
-    def __init__(self, parent=None, sessions=None):
+    SEARCH_DELAY_MS = 250
+
+    def __init__(self, parent=None, sessions=None, search_fn=None, rename_fn=None, delete_fn=None):
+        # sessions: {id: entry from GET /chats}. The *_fn callbacks run the
+        # backend request off the GUI thread and call on_done when it succeeded:
+        # search_fn(query, offset, on_done(data)), rename_fn(id, title, on_done()),
+        # delete_fn(id, on_done())
         super().__init__(parent)
         self.setWindowTitle("Chat History")
-        self.resize(420, 420)
+        self.resize(460, 480)
         self.sessions = sessions or {}
+        self.search_fn = search_fn
+        self.rename_fn = rename_fn
+        self.delete_fn = delete_fn
 
         v = QVBoxLayout(self)
 
+        self.search = QLineEdit()
+        self.search.setPlaceholderText("Search messages…")
+        self.search.setClearButtonEnabled(True)
+        self.search.setVisible(search_fn is not None)
+        v.addWidget(self.search)
+
         self.list = QListWidget()
         self.list.setSpacing(4)
+        self.list.itemDoubleClicked.connect(self._activated)
         v.addWidget(self.list, 1)
 
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.SEARCH_DELAY_MS)
+        self._timer.timeout.connect(self._run_search)
+        self.search.textChanged.connect(lambda _: self._timer.start())
+
         btn_row = QHBoxLayout()
         self.btn_new    = QPushButton("New Chat")
         self.btn_open   = QPushButton("Open")
@@ -29,6 +57,8 @@ class ChatHistoryDialog(QDialog):
         btn_row.addWidget(self.btn_open)
         btn_row.addWidget(self.btn_ren)
         btn_row.addWidget(self.btn_del)
+        self.btn_ren.setEnabled(rename_fn is not None)
+        self.btn_del.setEnabled(delete_fn is not None)
         v.addLayout(btn_row)
 
         close = QDialogButtonBox(QDialogButtonBox.Close)
@@ -45,21 +75,70 @@ class ChatHistoryDialog(QDialog):
 
         self._reload()
 
+    def _query(self) -> str:
+        return self.search.text().strip()
+
     def _reload(self):
+        if self._query():
+            self._run_search()
+            return
         self.list.clear()
         items = sorted(self.sessions.values(),
-                       key=lambda x: x.get("updated", x.get("created", "")),
+                       key=lambda x: x.get("last_updated") or x.get("created") or "",
                        reverse=True)
         for sess in items:
             title = sess.get("title") or "(untitled)"
-            ts = sess.get("updated") or sess.get("created") or ""
-            item = QListWidgetItem(f"{title}\n{ts}")
+            ts = _when(sess.get("last_updated") or sess.get("created"))
+            n = sess.get("turn_count")
+            item = QListWidgetItem(f"{title}\n{ts}" + (f" · {n} turns" if n else ""))
             item.setData(Qt.UserRole, sess.get("id"))
             self.list.addItem(item)
 
+    def _run_search(self, offset: int = 0):
+        q = self._query()
+        if not q:
+            self._reload()
+            return
+        if self.search_fn is not None:
+            self.search_fn(q, offset, self._show_results)
+
+    def _show_results(self, data: dict):
+        if not isinstance(data, dict) or data.get("query", "").strip() != self._query():
+            return      # a newer query is on its way
+        if not data.get("offset"):
+            self.list.clear()
+        elif self.list.count() and self.list.item(self.list.count() - 1).data(Qt.UserRole) == MORE:
+            self.list.takeItem(self.list.count() - 1)
+        for r in data.get("results", []):
+            title = (self.sessions.get(r["chat_id"]) or {}).get("title") or "(untitled)"
+            label = QLabel(f"<b>{escape(title)}</b> · #{r['turn'] + 1}<br>{r['snippet']}")
+            label.setTextFormat(Qt.RichText)
+            label.setWordWrap(True)
+            label.setContentsMargins(6, 3, 6, 3)
+            label.setAttribute(Qt.WA_TransparentForMouseEvents)
+            item = QListWidgetItem()
+            item.setData(Qt.UserRole, r["chat_id"])
+            item.setSizeHint(label.sizeHint())
+            self.list.addItem(item)
+            self.list.setItemWidget(item, label)
+        if data.get("has_more"):
+            more = QListWidgetItem("More results…")
+            more.setData(Qt.UserRole, MORE)
+            more.setData(Qt.UserRole + 1, data.get("next_offset"))
+            self.list.addItem(more)
+        elif not self.list.count():
+            self.list.addItem(QListWidgetItem("Still indexing, try again shortly." if data.get("indexing") else "No matches."))
+
+    def _activated(self, item: QListWidgetItem):
+        if item.data(Qt.UserRole) == MORE:
+            self._run_search(item.data(Qt.UserRole + 1) or 0)
+        elif item.data(Qt.UserRole):
+            self._open()
+
     def _sel_id(self):
         it = self.list.currentItem()
-        return it.data(Qt.UserRole) if it else None
+        sid = it.data(Qt.UserRole) if it else None
+        return None if sid == MORE else sid
 
     def _new(self):
         self.result_action = "new"
@@ -77,14 +156,18 @@ class ChatHistoryDialog(QDialog):
         if not sid: return
         cur = self.sessions.get(sid, {}).get("title") or ""
         title, ok = QInputDialog.getText(self, "Rename Chat", "Title:", text=cur)
-        if ok and title.strip():
-            self.sessions[sid]["title"] = title.strip()
-            self.sessions[sid]["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-            self._reload()
+        if ok and title.strip() and self.rename_fn is not None:
+            def done():
+                if sid in self.sessions:
+                    self.sessions[sid]["title"] = title.strip()
+                self._reload()
+            self.rename_fn(sid, title.strip(), done)
 
     def _del(self):
         sid = self._sel_id()
-        if not sid: return
+        if not sid or self.delete_fn is None: return
         if QMessageBox.question(self, "Delete Chat", "Delete selected chat?") == QMessageBox.Yes:
-            self.sessions.pop(sid, None)
-            self._reload()
+            def done():
+                self.sessions.pop(sid, None)
+                self._reload()
+            self.delete_fn(sid, done)
@@ -38,12 +38,18 @@ class IdentityDialog(QDialog):
         v.addWidget(btns)
 
     def _load_default(self, fetch_default_prompt):
-        try:
-            default_text = fetch_default_prompt(self.user_name.text().strip() or "sayang")
-            if default_text:
-                self.prompt.setPlainText(default_text)
-        except Exception as e:
-            QMessageBox.warning(self, "Gagal memuat default prompt", str(e))
+        # fetch_default_prompt(user_name, on_done, on_error) answers asynchronously
+        self.btn_default.setEnabled(False)
+        fetch_default_prompt(self.user_name.text().strip() or "sayang", self._set_default, self._default_failed)
+
+    def _set_default(self, default_text: str):
+        self.btn_default.setEnabled(True)
+        if default_text:
+            self.prompt.setPlainText(default_text)
+
+    def _default_failed(self, e):
+        self.btn_default.setEnabled(True)
+        QMessageBox.warning(self, "Gagal memuat default prompt", str(e))
 
     def result_identity(self):
         return {
@@ -1,21 +1,180 @@
-import threading
+import threading, time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
 from PySide6.QtCore import QObject, Signal
-from .client import Client
+from .client import Client, Cancelled
+
+class Job:
+    def __init__(self, kind: str):
+        self.id = uuid4().hex
+        self.kind = kind
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.future = None
+        self.response = None
+        self.on_done = None
+        self.on_error = None
+
+    def cancel(self) -> bool:
+        # True if the job never started; otherwise the running call notices the flag
+        self.cancelled.set()
+        return self.future.cancel() if self.future is not None else False
+
+    def close(self):
+        # unblocks a stream read that is waiting on the socket
+        r = self.response
+        if r is not None:
+            try:
+                r.close()
+            except Exception:
+                pass
 
 class Worker(QObject):
     done = Signal(str, str)
+    chunk = Signal(str)
+    reset = Signal(str)
     error = Signal(str)
+    stopped = Signal(str)
+    busy = Signal(bool)
+    _result = Signal(object, object, object)
+
+    BATCH_INTERVAL = 0.05
+    MAX_WORKERS = 4
+    MAX_PENDING = 32
+    STOP_GRACE = 3.0
 
     def __init__(self, client: Client):
         super().__init__()
         self.client = client
+        # sends run one at a time so a follow-up message always sees the
+        # chat_id assigned by the previous reply; everything else shares a small pool
+        self._send_lane = ThreadPoolExecutor(1, thread_name_prefix="chat-send")
+        self._pool = ThreadPoolExecutor(self.MAX_WORKERS, thread_name_prefix="chat-client")
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._current: Job | None = None
+        self._result.connect(self._dispatch)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, kind: str = "call", **kwargs) -> Job | None:
+        job = Job(kind)
+        job.on_done, job.on_error = on_done, on_error
+        with self._lock:
+            if len(self._jobs) >= self.MAX_PENDING:
+                self.error.emit("Too many pending requests, try again in a moment.")
+                return None
+            self._jobs[job.id] = job
 
-    def send(self, text: str):
         def run():
+            value, err = None, None
             try:
-                resp = self.client.send(text)
-                self.done.emit("ai", resp)
+                if not job.cancelled.is_set():
+                    value = fn(*args, **kwargs)
             except Exception as e:
-                self.error.emit(str(e))
-        threading.Thread(target=run, daemon=True).start()
+                err = e
+            finally:
+                job.finished.set()
+            self._result.emit(job, value, err)
+
+        job.future = self._pool.submit(run)
+        return job
+
+    def _dispatch(self, job: Job, value, err):
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        if job.cancelled.is_set():
+            return
+        if err is not None:
+            (job.on_error or (lambda e: self.error.emit(str(e))))(err)
+        elif job.on_done is not None:
+            job.on_done(value)
+
+    def send(self, text: str, stream: bool = True) -> Job:
+        job = Job("send")
+        self._current = job
+        self.busy.emit(True)
+
+        def run():
+            parts = []
+            try:
+                if job.cancelled.is_set():
+                    raise Cancelled("request cancelled")
+                if not stream:
+                    resp = self.client.send(text)
+                    self.done.emit("ai", resp)
+                    return
+                pending, last = [], time.monotonic()
+                for kind, value in self.client.send_stream(text, request_id=job.id, cancelled=job.cancelled,
+                                                         on_open=lambda r: setattr(job, "response", r)):
+                    if kind == "token":
+                        parts.append(value)
+                        pending.append(value)
+                        now = time.monotonic()
+                        if now - last >= self.BATCH_INTERVAL:
+                            self.chunk.emit("".join(pending))
+                            pending, last = [], now
+                    elif kind == "reset":
+                        parts = [value]
+                        pending, last = [], time.monotonic()
+                        self.reset.emit(value)
+                    elif kind == "done":
+                        if pending:
+                            self.chunk.emit("".join(pending))
+                        self.done.emit("ai", value)
+            except Cancelled:
+                self.stopped.emit("".join(parts))
+            except Exception as e:
+                if job.cancelled.is_set():
+                    self.stopped.emit("".join(parts))
+                else:
+                    self.error.emit(str(e))
+            finally:
+                job.finished.set()
+                if self._current is job:
+                    self._current = None
+                self.busy.emit(False)
+
+        job.future = self._send_lane.submit(run)
+        return job
+
+    def stop_generation(self):
+        job = self._current
+        if job is None or job.finished.is_set():
+            return
+        if job.future is not None and job.future.cancel():
+            job.cancelled.set()
+            self._current = None
+            self.stopped.emit("")
+            self.busy.emit(False)
+            return
+
+        def abort():
+            # ask the backend to stop (it still sends a final "done" with the
+            # partial reply); drop the connection if that does not happen soon
+            try:
+                ok = self.client.abort(job.id)
+            except Exception:
+                ok = False
+            if not ok or not job.finished.wait(self.STOP_GRACE):
+                job.cancelled.set()
+                job.close()
+
+        self._pool.submit(abort)
+
+    def cancel(self, job: Job | None):
+        if job is None:
+            return
+        if job is self._current:
+            self.stop_generation()
+        else:
+            job.cancel()
 
+    def shutdown(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        if self._current is not None:
+            self._current.cancelled.set()
+            self._current.close()
+        self._send_lane.shutdown(wait=False, cancel_futures=True)
+        self._pool.shutdown(wait=False, cancel_futures=True)